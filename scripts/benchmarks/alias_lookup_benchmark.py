@@ -0,0 +1,73 @@
+import argparse
+import json
+import os
+import sys
+import time
+
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(CURRENT_DIR, "..", "db"))
+
+from utils.alias_index import AliasIndex  # noqa: E402
+
+
+FIXTURES_DIR = os.path.join(CURRENT_DIR, "fixtures")
+# Each prompt is looked up this many times; the per-lookup latency reported is
+# the median over all repetitions.
+REPETITIONS = 1000
+
+
+def _percentile(sorted_values, percentile):
+    index = min(len(sorted_values) - 1, int(len(sorted_values) * percentile / 100))
+    return sorted_values[index]
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Measures alias lookup latency and hit-rate over sample prompts."
+    )
+    parser.add_argument(
+        "--aliases",
+        default=os.path.join(FIXTURES_DIR, "sample_aliases.jsonl"),
+        help="Aliases file written by the wiki scraper.",
+    )
+    parser.add_argument(
+        "--prompts",
+        default=os.path.join(FIXTURES_DIR, "sample_prompts.txt"),
+        help="File containing one plugin prompt per line.",
+    )
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    alias_index = AliasIndex.load(args.aliases)
+    load_seconds = time.perf_counter() - start
+
+    with open(args.prompts, encoding="utf-8") as f:
+        prompts = [line.strip() for line in f if line.strip()]
+
+    hits, latencies = {}, []
+    for prompt in prompts:
+        timings = []
+        for _ in range(REPETITIONS):
+            start = time.perf_counter()
+            doc_id = alias_index.find(prompt)
+            timings.append(time.perf_counter() - start)
+        timings.sort()
+        latencies.append(timings[len(timings) // 2])
+        hits[prompt] = doc_id
+
+    latencies.sort()
+    results = {
+        "aliases": len(alias_index),
+        "load_ms": load_seconds * 1000,
+        "prompts": len(prompts),
+        "hit_rate": sum(1 for d in hits.values() if d is not None) / len(prompts),
+        "lookup_us_p50": _percentile(latencies, 50) * 1e6,
+        "lookup_us_p95": _percentile(latencies, 95) * 1e6,
+        "lookup_us_max": latencies[-1] * 1e6,
+        "matches": hits,
+    }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+import urllib.request
+
+from concurrent.futures import ThreadPoolExecutor
+
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(CURRENT_DIR, "..", "server"))
+
+from query_service import (  # noqa: E402
+    QUERY_PATH,
+    STREAM_PATH,
+    QueryMetrics,
+    create_server,
+)
+from streaming_benchmark import FakeStreamingAnswerer, _post  # noqa: E402
+
+
+# Prompts players ask after a game update, as (prompt, relative popularity).
+# Variants differing only in case and punctuation coalesce.
+HOT_PROMPTS = [
+    ("How do I kill Zulrah?", 8),
+    ("how do i kill zulrah", 4),
+    ("What are the new Varlamore quests?", 6),
+    ("What drops dragon bones?", 3),
+    ("Best money making method for mid levels?", 3),
+    ("Where can I buy a rune scimitar?", 2),
+]
+
+
+class CountingAnswerer(FakeStreamingAnswerer):
+    """Counts how many answers are actually generated, i.e. LLM calls."""
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.llm_calls = 0
+        self._lock = threading.Lock()
+
+    def stream_query(self, prompt):
+        with self._lock:
+            self.llm_calls += 1
+        return super().stream_query(prompt)
+
+    def query(self, prompt):
+        return "".join(self.stream_query(prompt))
+
+
+def _request(base_url, prompt, stream):
+    start = time.perf_counter()
+    with _post(base_url + (STREAM_PATH if stream else QUERY_PATH), prompt) as res:
+        res.read()
+    return time.perf_counter() - start
+
+
+def run(args, coalesce):
+    metrics = QueryMetrics()
+    answerer = CountingAnswerer(args.retrieval_delay, args.token_delay)
+    server = create_server("127.0.0.1", 0, answerer, metrics, coalesce=coalesce)
+    server.RequestHandlerClass.log_message = lambda *args: None
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+
+    rng = random.Random(0)
+    prompts, weights = zip(*HOT_PROMPTS)
+    requests = [
+        (rng.choices(prompts, weights)[0], rng.random() < args.stream_fraction)
+        for _ in range(args.requests)
+    ]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        latencies = sorted(executor.map(lambda r: _request(base_url, *r), requests))
+    seconds = time.perf_counter() - start
+    server.shutdown()
+
+    coalesced = next(
+        int(float(line.split()[1]))
+        for line in metrics.render_prometheus().splitlines()
+        if line.startswith("scapegpt_coalesced_total ")
+    )
+    return {
+        "coalesce": coalesce,
+        "requests": args.requests,
+        "llm_calls": answerer.llm_calls,
+        "llm_calls_saved": args.requests - answerer.llm_calls,
+        "coalesced": coalesced,
+        "coalescing_rate": coalesced / args.requests,
+        "requests_per_second": args.requests / seconds,
+        "latency_ms_p50": 1000 * latencies[len(latencies) // 2],
+        "latency_ms_p95": 1000 * latencies[int(len(latencies) * 0.95)],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Load-tests the query service with a burst of popular "
+        "prompts, with and without coalescing identical in-flight prompts."
+    )
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument(
+        "--stream-fraction",
+        type=float,
+        default=0.5,
+        help="The fraction of requests that are streamed.",
+    )
+    parser.add_argument("--retrieval-delay", type=float, default=0.2)
+    parser.add_argument("--token-delay", type=float, default=0.02)
+    args = parser.parse_args()
+
+    for coalesce in (False, True):
+        print(json.dumps(run(args, coalesce)))
+
+
+if __name__ == "__main__":
+    main()
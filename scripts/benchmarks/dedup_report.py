@@ -0,0 +1,124 @@
+import argparse
+import json
+import os
+import re
+import sys
+import time
+
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(CURRENT_DIR, "..", "db"))
+
+from embedding_ingest_benchmark import (  # noqa: E402
+    MAX_TOKENS_FOR_EMBEDDING,
+    PROJECT_ROOT,
+    TOKENIZER_NOTE,
+    load_fixture_summaries,
+)
+from utils.dedup import DEFAULT_DUPLICATE_THRESHOLD, find_near_duplicates  # noqa: E402
+from utils.embeddings import DEFAULT_TOKENS_PER_MINUTE  # noqa: E402
+from utils.tokens import num_tokens_from_string, truncate_to_token_limit  # noqa: E402
+
+
+NUMBER_PATTERN = re.compile(r"\d+")
+# How many numbers a variant changes, e.g. an item's charges and value.
+NUM_VARIANT_NUMBERS = 5
+
+
+def load_summaries(summaries_dir):
+    summaries = []
+    for filename in sorted(os.listdir(summaries_dir)):
+        if filename.endswith(".txt"):
+            with open(os.path.join(summaries_dir, filename), encoding="utf-8") as f:
+                summaries.append((filename, f.read()))
+    return summaries
+
+
+def make_variant(summary, number):
+    """Mimics a wiki variant page, e.g. "Amulet of glory(4)" of "Amulet of
+    glory": the same text under a suffixed title, with a few numbers changed.
+    """
+    title, rest = summary.split("\n", 1)
+    rest = NUMBER_PATTERN.sub(
+        lambda m: str(int(m.group()) + number), rest, count=NUM_VARIANT_NUMBERS
+    )
+    return f"{title}({number})\n{rest}"
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Reports how much near-duplicate detection shrinks a corpus "
+        "before it's embedded and indexed.",
+        epilog=TOKENIZER_NOTE,
+    )
+    parser.add_argument(
+        "--summaries-dir",
+        default=os.path.join(PROJECT_ROOT, "summaries"),
+        help="The summaries to deduplicate. The saved pages are used if it "
+        "doesn't exist.",
+    )
+    parser.add_argument(
+        "--variants",
+        type=int,
+        default=0,
+        help="Add this many variant pages of each summary, e.g. to give the "
+        "saved pages (which have none) some near-duplicates.",
+    )
+    parser.add_argument("--threshold", type=float, default=DEFAULT_DUPLICATE_THRESHOLD)
+    parser.add_argument(
+        "--tokens-per-minute", type=float, default=DEFAULT_TOKENS_PER_MINUTE
+    )
+    args = parser.parse_args()
+
+    if os.path.isdir(args.summaries_dir):
+        summaries = load_summaries(args.summaries_dir)
+    else:
+        summaries = [
+            (f"{summary.split(chr(10), 1)[0]}.txt", summary)
+            for summary in load_fixture_summaries()
+        ]
+    summaries += [
+        (f"{filename[:-len('.txt')]}({i}).txt", make_variant(summary, i))
+        for filename, summary in list(summaries)
+        for i in range(1, args.variants + 1)
+    ]
+
+    start = time.perf_counter()
+    duplicates = find_near_duplicates(summaries, args.threshold)
+    dedup_seconds = time.perf_counter() - start
+
+    duplicate_ids = {doc_id for ids in duplicates.values() for doc_id in ids}
+    documents = [
+        truncate_to_token_limit(summary, MAX_TOKENS_FOR_EMBEDDING)
+        for _, summary in summaries
+    ]
+    kept = [d for (f, _), d in zip(summaries, documents) if f not in duplicate_ids]
+    num_tokens = sum(num_tokens_from_string(d) for d in documents)
+    num_tokens_kept = sum(num_tokens_from_string(d) for d in kept)
+
+    print(
+        json.dumps(
+            {
+                "documents": len(summaries),
+                "clusters": len(duplicates),
+                "duplicates": len(duplicate_ids),
+                "documents_saved_fraction": len(duplicate_ids) / len(summaries),
+                "tokens": num_tokens,
+                "tokens_saved": num_tokens - num_tokens_kept,
+                "dedup_seconds": dedup_seconds,
+                # Embedding a full corpus is bound by the tokens-per-minute
+                # quota, so every token not embedded saves indexing time.
+                "embedding_seconds_at_quota": num_tokens * 60 / args.tokens_per_minute,
+                "embedding_seconds_saved_at_quota": (num_tokens - num_tokens_kept)
+                * 60
+                / args.tokens_per_minute,
+                "largest_clusters": sorted(
+                    duplicates.items(), key=lambda c: len(c[1]), reverse=True
+                )[:5],
+            },
+            indent=2,
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
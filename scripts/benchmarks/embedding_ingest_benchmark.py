@@ -0,0 +1,157 @@
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(CURRENT_DIR, "..", "wiki", "scraper"))
+sys.path.insert(0, os.path.join(CURRENT_DIR, "..", "db"))
+
+from bs4 import BeautifulSoup  # noqa: E402
+
+from utils.embeddings import (  # noqa: E402
+    EmbeddingScheduler,
+    HashingEmbeddingBackend,
+    RateLimitError,
+)
+from utils.tokens import truncate_to_token_limit  # noqa: E402
+from utils.wiki_content_scraper import get_content  # noqa: E402
+from utils.wiki_infobox_scraper import get_infobox  # noqa: E402
+
+
+PROJECT_ROOT = os.path.join(CURRENT_DIR, "..", "..")
+PAGES_DIR = os.path.join(CURRENT_DIR, "fixtures", "pages")
+# Mirrors `MAX_TOKENS_FOR_EMBEDDING` in chroma_collection_client.py.
+MAX_TOKENS_FOR_EMBEDDING = 8190
+# Shown in the --help of the benchmarks that count tokens.
+TOKENIZER_NOTE = (
+    "Tokens are counted with tiktoken's cl100k_base encoding, which tiktoken "
+    "downloads on first use. To run offline, populate its cache first (run once "
+    "with network access) or set TIKTOKEN_CACHE_DIR to a populated cache."
+)
+
+
+def _ignore(kind, message):
+    pass
+
+
+class RateLimitedBackend(HashingEmbeddingBackend):
+    """Rejects every `every`-th request with a 429, to exercise retries."""
+
+    def __init__(self, every, **kwargs):
+        super().__init__(**kwargs)
+        self._every = every
+        self._num_requests = 0
+        self._lock = threading.Lock()
+
+    def embed(self, texts):
+        with self._lock:
+            self._num_requests += 1
+            rejected = self._num_requests % self._every == 0
+        if rejected:
+            raise RateLimitError("Rate limit reached", retry_after=0.01)
+        return super().embed(texts)
+
+
+def load_summaries(summaries_dir):
+    summaries = []
+    for filename in sorted(os.listdir(summaries_dir)):
+        if filename.endswith(".txt"):
+            with open(os.path.join(summaries_dir, filename), encoding="utf-8") as f:
+                summaries.append(f.read())
+    return summaries
+
+
+def load_fixture_summaries():
+    summaries = []
+    for filename in sorted(os.listdir(PAGES_DIR)):
+        if not filename.endswith(".html"):
+            continue
+        with open(os.path.join(PAGES_DIR, filename), encoding="utf-8") as f:
+            soup = BeautifulSoup(f.read(), "html.parser")
+        title = filename[: -len(".html")].replace("_", " ")
+        infobox = get_infobox(soup, title, _ignore)
+        content = get_content(soup, title, _ignore)
+        summaries.append(f"{title}\n\n{infobox}\n{content}")
+    return summaries
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmarks embedding a corpus offline, with the hashing "
+        "backend standing in for the embedding API.",
+        epilog=TOKENIZER_NOTE,
+    )
+    parser.add_argument(
+        "--summaries-dir",
+        default=os.path.join(PROJECT_ROOT, "summaries"),
+        help="The summaries to embed. The saved pages are used if it doesn't exist.",
+    )
+    parser.add_argument(
+        "--copies",
+        type=int,
+        default=1,
+        help="Embed the corpus this many times over, e.g. to scale the saved "
+        "pages up to a full corpus.",
+    )
+    parser.add_argument(
+        "--latency-ms",
+        type=float,
+        default=200.0,
+        help="Simulated latency of each embedding request.",
+    )
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--tokens-per-minute", type=float, default=1_000_000)
+    parser.add_argument("--requests-per-minute", type=float, default=3_000)
+    parser.add_argument("--max-batch-tokens", type=int, default=100_000)
+    parser.add_argument(
+        "--rate-limit-every",
+        type=int,
+        help="Reject every Nth request with a 429.",
+    )
+    args = parser.parse_args()
+
+    if os.path.isdir(args.summaries_dir):
+        summaries = load_summaries(args.summaries_dir)
+    else:
+        summaries = load_fixture_summaries()
+    documents = [
+        truncate_to_token_limit(summary, MAX_TOKENS_FOR_EMBEDDING)
+        for summary in summaries
+    ] * args.copies
+
+    for concurrency in args.concurrency:
+        backend_kwargs = {"latency_seconds": args.latency_ms / 1000}
+        if args.rate_limit_every:
+            backend = RateLimitedBackend(args.rate_limit_every, **backend_kwargs)
+        else:
+            backend = HashingEmbeddingBackend(**backend_kwargs)
+        backend.max_batch_tokens = args.max_batch_tokens
+        scheduler = EmbeddingScheduler(
+            backend,
+            tokens_per_minute=args.tokens_per_minute,
+            requests_per_minute=args.requests_per_minute,
+            max_concurrency=concurrency,
+        )
+        start = time.perf_counter()
+        embeddings = scheduler.embed(documents)
+        seconds = time.perf_counter() - start
+        assert len(embeddings) == len(documents)
+        print(
+            json.dumps(
+                {
+                    "documents": len(documents),
+                    "concurrency": concurrency,
+                    "seconds": seconds,
+                    "documents_per_second": len(documents) / seconds,
+                    "tokens_per_minute": scheduler.stats["tokens"] * 60 / seconds,
+                    **scheduler.stats,
+                }
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
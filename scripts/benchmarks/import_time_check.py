@@ -0,0 +1,102 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+DB_DIR = os.path.join(CURRENT_DIR, "..", "db")
+SERVER_DIR = os.path.join(CURRENT_DIR, "..", "server")
+
+# Modules checked, and the most time (in milliseconds, at best of `--runs`)
+# each may take to import, its dependencies included.
+IMPORT_BUDGETS_MS = {
+    "chroma_collection_client": 250,
+    "versioned_collection_client": 250,
+    "query_service": 100,
+}
+# Packages none of them may import eagerly. They're imported where they're
+# used: chromadb when a client connects, the LLM libraries when a query is
+# answered, and tiktoken when tokens are first counted.
+FORBIDDEN_PACKAGES = ["chromadb", "gpt_index", "langchain", "openai", "tiktoken"]
+
+
+def measure(module):
+    """Imports a module in a fresh interpreter with `-X importtime`.
+
+    Returns:
+        Tuple[Optional[float], Set[str]]: The import's cumulative time in
+        milliseconds (None if it failed), and the top-level packages it
+        imported.
+    """
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([DB_DIR, SERVER_DIR]))
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    cumulative_ms, packages = None, set()
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:") :].split("|")
+        name = name.strip()
+        if not cumulative.strip().isdigit():
+            continue  # The header.
+        packages.add(name.split(".")[0])
+        if name == module:
+            cumulative_ms = int(cumulative) / 1000
+    if result.returncode != 0:
+        # E.g. a package imported eagerly isn't installed.
+        print(result.stderr.strip().splitlines()[-1], file=sys.stderr)
+        cumulative_ms = None
+    return cumulative_ms, packages
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Checks that the query and ingestion modules import within "
+        "their time budgets and without the heavy LLM and database libraries. "
+        "Exits with status 1 if any doesn't."
+    )
+    parser.add_argument(
+        "--runs",
+        type=int,
+        default=5,
+        help="Each module is imported this many times; the fastest counts.",
+    )
+    parser.add_argument(
+        "--budget-scale",
+        type=float,
+        default=1.0,
+        help="Multiplies every budget, e.g. for slower machines.",
+    )
+    args = parser.parse_args()
+
+    failed = False
+    for module, budget_ms in IMPORT_BUDGETS_MS.items():
+        budget_ms *= args.budget_scale
+        runs = [measure(module) for _ in range(args.runs)]
+        import_ms = None
+        if all(ms is not None for ms, _ in runs):
+            import_ms = min(ms for ms, _ in runs)
+        forbidden = sorted(set(FORBIDDEN_PACKAGES) & runs[0][1])
+        ok = import_ms is not None and import_ms <= budget_ms and not forbidden
+        failed |= not ok
+        print(
+            json.dumps(
+                {
+                    "module": module,
+                    "import_ms": import_ms,
+                    "budget_ms": budget_ms,
+                    "forbidden_imports": forbidden,
+                    "ok": ok,
+                }
+            )
+        )
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+import argparse
+import json
+import os
+import re
+import sys
+import time
+
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(CURRENT_DIR, "..", "db"))
+
+import numpy as np  # noqa: E402
+
+from chroma_collection_client import HYBRID_CANDIDATE_MULTIPLIER  # noqa: E402
+from dedup_report import load_summaries, make_variant  # noqa: E402
+from embedding_ingest_benchmark import (  # noqa: E402
+    PROJECT_ROOT,
+    load_fixture_summaries,
+)
+from utils.embeddings import HashingEmbeddingBackend  # noqa: E402
+from utils.mmr import maximal_marginal_relevance  # noqa: E402
+
+
+PROMPTS_PATH = os.path.join(CURRENT_DIR, "fixtures", "sample_prompts.txt")
+# Strips a variant's suffix, e.g. "Zulrah(2)" is an article about "Zulrah".
+VARIANT_SUFFIX_PATTERN = re.compile(r"\(\d+\)$")
+# Each MMR selection is timed over this many repetitions.
+TIMING_REPETITIONS = 100
+
+
+def _article(summary):
+    return VARIANT_SUFFIX_PATTERN.sub("", summary.split("\n", 1)[0])
+
+
+def _mean_pairwise_similarity(vectors):
+    similarities = vectors @ vectors.T
+    n = len(vectors)
+    if n < 2:
+        return 1.0
+    return float((similarities.sum() - np.trace(similarities)) / (n * (n - 1)))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Measures how much MMR diversifies the documents passed to "
+        "the LLM, what relevance it gives up, and what it costs per query."
+    )
+    parser.add_argument(
+        "--summaries-dir",
+        default=os.path.join(PROJECT_ROOT, "summaries"),
+        help="The corpus. The saved pages are used if it doesn't exist.",
+    )
+    parser.add_argument(
+        "--variants",
+        type=int,
+        default=2,
+        help="Add this many variant pages of each summary, as the wiki has for "
+        "e.g. monsters' and items' forms.",
+    )
+    parser.add_argument("--n-results", type=int, default=3)
+    parser.add_argument(
+        "--lambdas", type=float, nargs="+", default=[1.0, 0.9, 0.7, 0.5, 0.3]
+    )
+    args = parser.parse_args()
+
+    if os.path.isdir(args.summaries_dir):
+        summaries = [summary for _, summary in load_summaries(args.summaries_dir)]
+    else:
+        summaries = load_fixture_summaries()
+    summaries += [
+        make_variant(summary, i)
+        for summary in list(summaries)
+        for i in range(1, args.variants + 1)
+    ]
+    with open(PROMPTS_PATH, encoding="utf-8") as f:
+        prompts = [line.strip() for line in f if line.strip()]
+
+    backend = HashingEmbeddingBackend()
+    matrix = np.asarray(backend.embed(summaries), dtype=np.float32)
+    articles = [_article(summary) for summary in summaries]
+    # As many candidates as hybrid retrieval fuses from its two retrievers.
+    num_candidates = 2 * args.n_results * HYBRID_CANDIDATE_MULTIPLIER
+
+    results = []
+    for lambda_mult in args.lambdas:
+        similarities, distinct, relevance, seconds = [], [], [], []
+        for prompt in prompts:
+            query = np.asarray(backend.embed([prompt])[0], dtype=np.float32)
+            scores = matrix @ query
+            pool = np.argsort(-scores)[:num_candidates]
+            # Min-max normalized, as fused retrieval scores are.
+            pool_scores = scores[pool]
+            spread = pool_scores.max() - pool_scores.min()
+            pool_relevance = (pool_scores - pool_scores.min()) / (spread or 1.0)
+
+            start = time.perf_counter()
+            for _ in range(TIMING_REPETITIONS):
+                selected = maximal_marginal_relevance(
+                    pool_relevance, matrix[pool], args.n_results, lambda_mult
+                )
+            seconds.append((time.perf_counter() - start) / TIMING_REPETITIONS)
+
+            chosen = pool[selected]
+            similarities.append(_mean_pairwise_similarity(matrix[chosen]))
+            distinct.append(len({articles[i] for i in chosen}))
+            relevance.append(float(scores[chosen].mean()))
+
+        results.append(
+            {
+                "lambda": lambda_mult,
+                "mean_pairwise_similarity": float(np.mean(similarities)),
+                "distinct_articles_mean": float(np.mean(distinct)),
+                "all_distinct_fraction": float(
+                    np.mean([d == args.n_results for d in distinct])
+                ),
+                "prompt_similarity_mean": float(np.mean(relevance)),
+                "mmr_us_per_query": 1e6 * float(np.mean(seconds)),
+            }
+        )
+
+    print(
+        json.dumps(
+            {
+                "documents": len(summaries),
+                "prompts": len(prompts),
+                "candidates": num_candidates,
+                # The embeddings fetched along with the candidates, per query.
+                "embedding_kb_fetched_per_query": num_candidates
+                * matrix.shape[1]
+                * 4
+                / 1024,
+                "results": results,
+            },
+            indent=2,
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(CURRENT_DIR, "..", "wiki", "scraper"))
+sys.path.insert(0, os.path.join(CURRENT_DIR, "..", "db"))
+
+import requests  # noqa: E402
+
+from bs4 import BeautifulSoup  # noqa: E402
+
+# Both scripts/wiki/scraper/utils and scripts/db/utils are namespace packages,
+# so modules from either can be imported through `utils`.
+from utils.context_packer import pack_context, split_sections  # noqa: E402
+from utils.embeddings import HashingEmbeddingBackend  # noqa: E402
+from utils.inverted_index import InvertedIndex  # noqa: E402
+from utils.tokens import num_tokens_from_string, truncate_to_token_limit  # noqa: E402
+from utils.wiki_content_scraper import get_content  # noqa: E402
+from utils.wiki_infobox_scraper import get_infobox  # noqa: E402
+
+
+OSRS_WIKI_URL_BASE = "https://oldschool.runescape.wiki"
+PAGES_DIR = os.path.join(CURRENT_DIR, "fixtures", "pages")
+# Mirrors `MAX_TOKENS_FOR_EMBEDDING` in chroma_collection_client.py.
+MAX_TOKENS_FOR_EMBEDDING = 8190
+BENCHMARK_PROMPT = "What does it drop and how do I get there?"
+CONTEXT_TOKEN_BUDGET = 2560
+# A deterministic, offline stand-in for the OpenAI embedding API.
+STUB_EMBEDDING_BACKEND = HashingEmbeddingBackend()
+STAGES = [
+    "parse",
+    "infobox",
+    "content",
+    "tokenize",
+    "truncate",
+    "index",
+    "embed",
+    "answer",
+]
+
+
+def stub_llm(llm_prompt):
+    """A deterministic, offline stand-in for the streaming chat model."""
+    for word in llm_prompt.split()[:256]:
+        yield word + " "
+
+
+def _ignore(kind, message):
+    pass
+
+
+def _run_stages(html, title):
+    """Runs every pipeline stage on a page, returning each stage's seconds.
+
+    The scrapers only read the soup, so both share one parse, as in the
+    scraper itself.
+    """
+    timings = {}
+
+    def _timed(stage, fn, *args):
+        start = time.perf_counter()
+        result = fn(*args)
+        timings[stage] = time.perf_counter() - start
+        return result
+
+    soup = _timed("parse", BeautifulSoup, html, "html.parser")
+    # Unknown labels/headlines are warned about while scraping; keep them out
+    # of the results.
+    infobox = _timed("infobox", get_infobox, soup, title, _ignore)
+    content = _timed("content", get_content, soup, title, _ignore)
+    summary = f"{title}\n\n{infobox}\n{content}"
+
+    _timed("tokenize", num_tokens_from_string, summary)
+    document = _timed(
+        "truncate", truncate_to_token_limit, summary, MAX_TOKENS_FOR_EMBEDDING
+    )
+
+    def _index():
+        sections = split_sections(document, num_tokens_from_string)
+        InvertedIndex().add(title, title, document)
+        return sections
+
+    sections = _timed("index", _index)
+    _timed("embed", STUB_EMBEDDING_BACKEND.embed, [document])
+
+    def _answer():
+        context = pack_context(
+            BENCHMARK_PROMPT, [(title, document, sections)], CONTEXT_TOKEN_BUDGET
+        )
+        return "".join(stub_llm("\n\n".join(text for _, text in context.documents)))
+
+    _timed("answer", _answer)
+    return timings, len(summary.encode("utf-8"))
+
+
+def benchmark_page(path, repeat):
+    """Benchmarks a single saved page.
+
+    Returns:
+        dict: Median milliseconds per stage, peak traced memory and sizes.
+    """
+    with open(path, encoding="utf-8") as f:
+        html = f.read()
+    title = os.path.basename(path)[: -len(".html")].replace("_", " ")
+
+    # Warm up (e.g. tiktoken loads its encoding on first use).
+    _run_stages(html, title)
+    runs = [_run_stages(html, title)[0] for _ in range(repeat)]
+
+    tracemalloc.start()
+    _, summary_bytes = _run_stages(html, title)
+    _, peak_bytes = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    result = {
+        "page": title,
+        "html_bytes": len(html.encode("utf-8")),
+        "summary_bytes": summary_bytes,
+        "peak_memory_bytes": peak_bytes,
+    }
+    for stage in STAGES:
+        result[f"{stage}_ms"] = statistics.median(run[stage] for run in runs) * 1000
+    result["total_ms"] = sum(result[f"{stage}_ms"] for stage in STAGES)
+    return result
+
+
+def refresh_fixtures():
+    """Re-downloads every fixture page from the wiki."""
+    for filename in sorted(os.listdir(PAGES_DIR)):
+        if not filename.endswith(".html"):
+            continue
+        res = requests.get(f"{OSRS_WIKI_URL_BASE}/w/{filename[:-len('.html')]}")
+        res.raise_for_status()
+        with open(os.path.join(PAGES_DIR, filename), "w", encoding="utf-8") as f:
+            f.write(res.text)
+        print(f"Refreshed fixture: {filename}")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmarks the scrape and index pipeline on saved wiki pages."
+    )
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument(
+        "--output",
+        help="Write results as JSON lines to this file instead of stdout.",
+    )
+    parser.add_argument(
+        "--refresh-fixtures",
+        action="store_true",
+        help="Re-download the saved pages from the wiki before benchmarking.",
+    )
+    args = parser.parse_args()
+
+    if args.refresh_fixtures:
+        refresh_fixtures()
+
+    results = []
+    for filename in sorted(os.listdir(PAGES_DIR)):
+        if filename.endswith(".html"):
+            results.append(
+                benchmark_page(os.path.join(PAGES_DIR, filename), args.repeat)
+            )
+
+    lines = [json.dumps(result) for result in results]
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write("\n".join(lines) + "\n")
+    else:
+        print("\n".join(lines))
+
+
+if __name__ == "__main__":
+    main()
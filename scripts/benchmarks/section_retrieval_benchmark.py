@@ -0,0 +1,145 @@
+import argparse
+import json
+import os
+import sys
+import time
+
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(CURRENT_DIR, "..", "db"))
+
+import numpy as np  # noqa: E402
+
+from chroma_collection_client import (  # noqa: E402
+    DEFAULT_CONTEXT_TOKEN_BUDGET,
+    MIN_SECTION_SCORE_FRACTION,
+)
+from dedup_report import load_summaries  # noqa: E402
+from embedding_ingest_benchmark import (  # noqa: E402
+    MAX_TOKENS_FOR_EMBEDDING,
+    PROJECT_ROOT,
+    TOKENIZER_NOTE,
+    load_fixture_summaries,
+)
+from utils.context_packer import (  # noqa: E402
+    pack_context,
+    section_embedding_text,
+    split_sections,
+)
+from utils.embeddings import HashingEmbeddingBackend  # noqa: E402
+from utils.tokens import num_tokens_from_string, truncate_to_token_limit  # noqa: E402
+
+
+PROMPTS_PATH = os.path.join(CURRENT_DIR, "fixtures", "sample_prompts.txt")
+
+
+def _top_k(matrix, query, k):
+    scores = matrix @ query
+    return list(np.argsort(-scores)[:k])
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compares retrieving whole documents with two-stage "
+        "retrieval (documents by their lead section, then the sections of the "
+        "best ones), by the vectors scored and the context sent to the LLM.",
+        epilog=TOKENIZER_NOTE,
+    )
+    parser.add_argument(
+        "--summaries-dir",
+        default=os.path.join(PROJECT_ROOT, "summaries"),
+        help="The corpus. The saved pages are used if it doesn't exist.",
+    )
+    parser.add_argument("--n-results", type=int, default=3)
+    parser.add_argument(
+        "--token-budget", type=int, default=DEFAULT_CONTEXT_TOKEN_BUDGET
+    )
+    args = parser.parse_args()
+
+    if os.path.isdir(args.summaries_dir):
+        documents = [summary for _, summary in load_summaries(args.summaries_dir)]
+    else:
+        documents = load_fixture_summaries()
+    documents = [
+        truncate_to_token_limit(d, MAX_TOKENS_FOR_EMBEDDING) for d in documents
+    ]
+    with open(PROMPTS_PATH, encoding="utf-8") as f:
+        prompts = [line.strip() for line in f if line.strip()]
+
+    backend = HashingEmbeddingBackend()
+    sections = [split_sections(d, num_tokens_from_string) for d in documents]
+    section_texts = [
+        [section_embedding_text(d, section) for section in doc_sections]
+        for d, doc_sections in zip(documents, sections)
+    ]
+    full_matrix = np.asarray(backend.embed(documents), dtype=np.float32)
+    section_matrices = [
+        np.asarray(backend.embed(texts), dtype=np.float32) for texts in section_texts
+    ]
+    # The lead section is what a document is embedded as.
+    lead_matrix = np.stack([matrix[0] for matrix in section_matrices])
+    num_sections = sum(len(s) for s in sections)
+
+    results = {}
+    for mode in ("whole_documents", "two_stage"):
+        context_tokens, sections_packed, vectors_scored = [], [], []
+        start = time.perf_counter()
+        for prompt in prompts:
+            query = np.asarray(backend.embed([prompt])[0], dtype=np.float32)
+            if mode == "whole_documents":
+                best = _top_k(full_matrix, query, args.n_results)
+                section_scores, min_score_fraction = None, 0.0
+                vectors_scored.append(len(documents))
+            else:
+                best = _top_k(lead_matrix, query, args.n_results)
+                section_scores = {
+                    (doc_num, section_num): float(score)
+                    for doc_num, i in enumerate(best)
+                    for section_num, score in enumerate(section_matrices[i] @ query)
+                }
+                min_score_fraction = MIN_SECTION_SCORE_FRACTION
+                vectors_scored.append(len(documents) + len(section_scores))
+            context = pack_context(
+                prompt,
+                [(str(i), documents[i], sections[i]) for i in best],
+                args.token_budget,
+                section_scores,
+                min_score_fraction,
+            )
+            context_tokens.append(context.num_tokens)
+            sections_packed.append(context.num_sections_used)
+        seconds = time.perf_counter() - start
+
+        results[mode] = {
+            "vectors_scored_per_query": float(np.mean(vectors_scored)),
+            "context_tokens_mean": float(np.mean(context_tokens)),
+            "context_tokens_p95": float(np.percentile(context_tokens, 95)),
+            "sections_packed_mean": float(np.mean(sections_packed)),
+            "ms_per_query": 1000 * seconds / len(prompts),
+        }
+
+    whole, two_stage = results["whole_documents"], results["two_stage"]
+    print(
+        json.dumps(
+            {
+                "documents": len(documents),
+                "sections": num_sections,
+                "prompts": len(prompts),
+                # Searching every section directly would score this many.
+                "flat_section_vectors_scored_per_query": num_sections,
+                **results,
+                "context_tokens_saved_fraction": 1
+                - two_stage["context_tokens_mean"] / whole["context_tokens_mean"],
+                "embedding_tokens_whole_documents": sum(
+                    num_tokens_from_string(d) for d in documents
+                ),
+                "embedding_tokens_two_stage": sum(
+                    num_tokens_from_string(t) for texts in section_texts for t in texts
+                ),
+            },
+            indent=2,
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(CURRENT_DIR, "..", "db"))
+
+import numpy as np  # noqa: E402
+
+from utils.embeddings import DEFAULT_TOKENS_PER_MINUTE  # noqa: E402
+from utils.snapshot import SnapshotReader, SnapshotWriter  # noqa: E402
+from utils.vector_store import PRECISIONS  # noqa: E402
+from vector_store_benchmark import synthetic_embeddings  # noqa: E402
+
+
+# Documents are written and read this many at a time, as
+# `ChromaCollectionClient` does.
+BATCH_SIZE = 1000
+# A summary's average length; used to size the synthetic documents and to
+# estimate how long re-embedding them would take.
+AVERAGE_DOCUMENT_TOKENS = 800
+# Roughly how many characters a token is.
+CHARACTERS_PER_TOKEN = 4
+
+
+def directory_size(path):
+    return sum(
+        os.path.getsize(os.path.join(path, filename)) for filename in os.listdir(path)
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmarks writing and reading collection snapshots, "
+        "against re-embedding the corpus at the API's quota."
+    )
+    parser.add_argument("--documents", type=int, default=30_000)
+    parser.add_argument("--dimensions", type=int, default=1536)
+    parser.add_argument("--precisions", nargs="+", default=PRECISIONS)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    embeddings = synthetic_embeddings(args.documents, args.dimensions, 384, rng)
+    text = "x" * (AVERAGE_DOCUMENT_TOKENS * CHARACTERS_PER_TOKEN)
+    ids = [f"{i}.txt" for i in range(args.documents)]
+    documents = [f"Document {i}\n\n{text}" for i in range(args.documents)]
+    metadatas = [{"sections": "[[0,10,3]]"}] * args.documents
+
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        for precision in args.precisions:
+            path = os.path.join(tmp_dir, precision)
+            start = time.perf_counter()
+            writer = SnapshotWriter(
+                path, "benchmark", "hashing/1536", args.documents, precision
+            )
+            for i in range(0, args.documents, BATCH_SIZE):
+                end = i + BATCH_SIZE
+                writer.write(
+                    ids[i:end], documents[i:end], metadatas[i:end], embeddings[i:end]
+                )
+            writer.close()
+            write_seconds = time.perf_counter() - start
+
+            start = time.perf_counter()
+            reader = SnapshotReader(path)
+            worst_error = 0.0
+            for batch_ids, _, _, batch_embeddings in reader.batches(BATCH_SIZE):
+                first = int(batch_ids[0].split(".")[0])
+                expected = embeddings[first : first + len(batch_ids)]
+                worst_error = max(
+                    worst_error, float(np.abs(batch_embeddings - expected).max())
+                )
+            read_seconds = time.perf_counter() - start
+
+            print(
+                json.dumps(
+                    {
+                        "precision": precision,
+                        "documents": args.documents,
+                        "embeddings_mb": os.path.getsize(
+                            os.path.join(path, "embeddings.npy")
+                        )
+                        / 2**20,
+                        "snapshot_mb": directory_size(path) / 2**20,
+                        "write_seconds": write_seconds,
+                        "read_seconds": read_seconds,
+                        "max_embedding_error": worst_error,
+                        "reembedding_seconds_at_quota": args.documents
+                        * AVERAGE_DOCUMENT_TOKENS
+                        * 60
+                        / DEFAULT_TOKENS_PER_MINUTE,
+                    }
+                )
+            )
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+import urllib.request
+
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(CURRENT_DIR, "..", "server"))
+
+from query_service import (  # noqa: E402
+    METRICS_PATH,
+    QUERY_PATH,
+    STREAM_PATH,
+    QueryMetrics,
+    create_server,
+)
+
+
+FAKE_ANSWER = (
+    "Zulrah can be killed with a combination of magic and ranged attacks. "
+    "Bring anti-venom, a good food supply and switch styles as its form changes."
+)
+
+
+class FakeStreamingAnswerer:
+    """Stands in for `ChromaCollectionClient`, emitting one word per delay."""
+
+    def __init__(self, retrieval_delay: float, token_delay: float) -> None:
+        self._retrieval_delay = retrieval_delay
+        self._token_delay = token_delay
+
+    def stream_query(self, prompt):
+        time.sleep(self._retrieval_delay)
+        for word in FAKE_ANSWER.split(" "):
+            time.sleep(self._token_delay)
+            yield word + " "
+
+    def query(self, prompt):
+        return "".join(self.stream_query(prompt))
+
+
+def _post(url, prompt):
+    return urllib.request.urlopen(
+        urllib.request.Request(
+            url,
+            data=json.dumps({"prompt": prompt}).encode("utf-8"),
+            headers={"Content-Type": "application/json"},
+        )
+    )
+
+
+def _time_streamed(url):
+    start = time.perf_counter()
+    ttft = None
+    with _post(url, "How do I kill Zulrah?") as res:
+        for line in res:
+            if ttft is None and line.startswith(b"data: "):
+                ttft = time.perf_counter() - start
+    return ttft, time.perf_counter() - start
+
+
+def _time_blocking(url):
+    start = time.perf_counter()
+    with _post(url, "How do I kill Zulrah?") as res:
+        json.loads(res.read())
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compares time-to-first-token of streamed and blocking answers."
+    )
+    parser.add_argument("--requests", type=int, default=10)
+    parser.add_argument("--retrieval-delay", type=float, default=0.2)
+    parser.add_argument("--token-delay", type=float, default=0.02)
+    args = parser.parse_args()
+
+    metrics = QueryMetrics()
+    answerer = FakeStreamingAnswerer(args.retrieval_delay, args.token_delay)
+    server = create_server("127.0.0.1", 0, answerer, metrics)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+
+    streamed = [_time_streamed(base_url + STREAM_PATH) for _ in range(args.requests)]
+    blocking = [_time_blocking(base_url + QUERY_PATH) for _ in range(args.requests)]
+    with urllib.request.urlopen(base_url + METRICS_PATH) as res:
+        server_metrics = res.read().decode("utf-8")
+    server.shutdown()
+
+    results = {
+        "requests": args.requests,
+        "streamed_ttft_ms_avg": 1000 * sum(t for t, _ in streamed) / len(streamed),
+        "streamed_total_ms_avg": 1000 * sum(t for _, t in streamed) / len(streamed),
+        "blocking_ttft_ms_avg": 1000 * sum(blocking) / len(blocking),
+        "server_ttft_ms_p50": 1000 * metrics.quantile("ttft_seconds", 0.5),
+        "server_ttft_ms_p95": 1000 * metrics.quantile("ttft_seconds", 0.95),
+    }
+    print(json.dumps(results, indent=2))
+    print(server_metrics)
+
+
+if __name__ == "__main__":
+    main()
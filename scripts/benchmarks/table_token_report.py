@@ -0,0 +1,149 @@
+import argparse
+import json
+import os
+import sys
+
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(CURRENT_DIR, "..", "wiki", "scraper"))
+sys.path.insert(0, os.path.join(CURRENT_DIR, "..", "db"))
+
+from bs4 import BeautifulSoup  # noqa: E402
+
+from utils.tokens import num_tokens_from_string  # noqa: E402
+from utils.wiki_content_scraper import get_content  # noqa: E402
+from utils.wiki_tables import TABLES_FILE_EXTENSION, read_tables  # noqa: E402
+
+
+PROJECT_ROOT = os.path.join(CURRENT_DIR, "..", "..")
+PAGES_DIR = os.path.join(CURRENT_DIR, "fixtures", "pages")
+# Mirrors `MAX_TOKENS_FOR_EMBEDDING` in chroma_collection_client.py; summaries
+# longer than this are truncated when loaded.
+MAX_TOKENS_FOR_EMBEDDING = 8190
+# How many of the pages with the largest savings the report lists.
+NUM_TOP_PAGES = 10
+
+
+def _ignore(kind, message):
+    pass
+
+
+def load_corpus(tables_dir, summaries_dir):
+    """Reads every sidecar in `tables_dir`, with its summary if there is one.
+
+    Returns:
+        List[Tuple[str, List[WikiTable], Optional[str]]]: The title, tables and
+        summary of each page.
+    """
+    corpus = []
+    for filename in sorted(os.listdir(tables_dir)):
+        if not filename.endswith(TABLES_FILE_EXTENSION):
+            continue
+        summary_filename, title, tables = read_tables(
+            os.path.join(tables_dir, filename)
+        )
+        summary = None
+        try:
+            with open(
+                os.path.join(summaries_dir, summary_filename), encoding="utf-8"
+            ) as f:
+                summary = f.read()
+        except FileNotFoundError:
+            pass
+        corpus.append((title, tables, summary))
+    return corpus
+
+
+def load_fixtures():
+    """Scrapes the saved pages into the same shape as `load_corpus`."""
+    corpus = []
+    for filename in sorted(os.listdir(PAGES_DIR)):
+        if not filename.endswith(".html"):
+            continue
+        with open(os.path.join(PAGES_DIR, filename), encoding="utf-8") as f:
+            soup = BeautifulSoup(f.read(), "html.parser")
+        title = filename[: -len(".html")].replace("_", " ")
+        tables = []
+        content = get_content(soup, title, _ignore, tables=tables)
+        corpus.append((title, tables, f"{title}\n\n{content}"))
+    return corpus
+
+
+def report(corpus):
+    """Counts table tokens as labelled rows and compactly, page by page.
+
+    Summaries hold compactly rendered tables; had they been written with
+    labelled rows, they'd be longer by the difference in table tokens.
+    """
+    totals = {
+        "pages": len(corpus),
+        "tables": 0,
+        "rows": 0,
+        "rows_tokens": 0,
+        "compact_tokens": 0,
+        "summaries": 0,
+        "summaries_truncated_as_rows": 0,
+        "summaries_truncated_compact": 0,
+    }
+    pages = []
+    for title, tables, summary in corpus:
+        rows_tokens = sum(num_tokens_from_string(t.render_rows()) for t in tables)
+        compact_tokens = sum(num_tokens_from_string(t.render_compact()) for t in tables)
+        totals["tables"] += len(tables)
+        totals["rows"] += sum(len(t.rows) for t in tables)
+        totals["rows_tokens"] += rows_tokens
+        totals["compact_tokens"] += compact_tokens
+        pages.append((rows_tokens - compact_tokens, title))
+
+        if summary is not None:
+            summary_tokens = num_tokens_from_string(summary)
+            totals["summaries"] += 1
+            totals["summaries_truncated_compact"] += (
+                summary_tokens > MAX_TOKENS_FOR_EMBEDDING
+            )
+            totals["summaries_truncated_as_rows"] += (
+                summary_tokens + rows_tokens - compact_tokens > MAX_TOKENS_FOR_EMBEDDING
+            )
+
+    saved = totals["rows_tokens"] - totals["compact_tokens"]
+    totals["tokens_saved"] = saved
+    totals["tokens_saved_fraction"] = (
+        saved / totals["rows_tokens"] if totals["rows_tokens"] else 0.0
+    )
+    totals["top_pages"] = [
+        {"title": title, "tokens_saved": tokens_saved}
+        for tokens_saved, title in sorted(pages, reverse=True)[:NUM_TOP_PAGES]
+    ]
+    return totals
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Reports the tokens saved by rendering tables compactly "
+        "rather than as labelled rows, across the scraped corpus."
+    )
+    parser.add_argument(
+        "--tables-dir",
+        default=os.path.join(PROJECT_ROOT, "tables"),
+        help="The directory of table sidecars written by the scraper.",
+    )
+    parser.add_argument(
+        "--summaries-dir",
+        default=os.path.join(PROJECT_ROOT, "summaries"),
+        help="The directory of the summaries the sidecars belong to.",
+    )
+    parser.add_argument(
+        "--fixtures",
+        action="store_true",
+        help="Report on the saved benchmark pages instead of the corpus.",
+    )
+    args = parser.parse_args()
+
+    if args.fixtures:
+        corpus = load_fixtures()
+    else:
+        corpus = load_corpus(args.tables_dir, args.summaries_dir)
+    print(json.dumps(report(corpus), indent=2))
+
+
+if __name__ == "__main__":
+    main()
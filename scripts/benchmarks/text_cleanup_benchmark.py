@@ -0,0 +1,118 @@
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(CURRENT_DIR, "..", "wiki", "scraper"))
+
+from bs4 import BeautifulSoup  # noqa: E402
+
+from utils.text_cleanup import clean_text, is_noise_annotation  # noqa: E402
+
+
+PAGES_DIR = os.path.join(CURRENT_DIR, "fixtures", "pages")
+# Artefact-bearing cells that the saved pages don't happen to contain.
+SYNTHETIC_CELLS = [
+    "12,175 Attack experience (update)",
+    "Rune scimitar (update | poll)",
+    "Always\n(update | poll)",
+    "8 January 2015 (Update)",
+    "14,891,234 coins (info)",
+    "+50 (edit)",
+]
+
+
+def legacy_infobox_cleanup(text):
+    """The chain `get_infobox` used to run on every value."""
+    return (
+        text.strip()
+        .replace(" (edit)", "")
+        .replace("(edit)", "")
+        .replace(" (info)", "")
+        .replace("(info)", "")
+        .replace("(Update)", "")
+        .replace(" (Update)", "")
+    )
+
+
+def legacy_table_cleanup(text):
+    """The chain `_parse_wikitable` used to run on every cell."""
+    text = text.strip()
+    text = text.replace("(update)", "")
+    text = text.replace(" (update)", "")
+    text = text.replace(" (update | poll)", "")
+    text = text.replace("\n(update | poll)", "")
+    text = text.replace("(update | poll)", "")
+    return text
+
+
+def legacy_is_noise_annotation(sup_text):
+    return (
+        "st" not in sup_text
+        and "nd" not in sup_text
+        and "rd" not in sup_text
+        and "US" not in sup_text
+        and "UK" not in sup_text
+    )
+
+
+def load_cells():
+    """Returns the text of every table cell and <sup> in the saved pages."""
+    cells, sups = list(SYNTHETIC_CELLS), []
+    for filename in sorted(os.listdir(PAGES_DIR)):
+        if not filename.endswith(".html"):
+            continue
+        with open(os.path.join(PAGES_DIR, filename), encoding="utf-8") as f:
+            soup = BeautifulSoup(f.read(), "html.parser")
+        cells.extend(cell.text for cell in soup.find_all(["td", "th"]))
+        sups.extend(sup.text.strip() for sup in soup.find_all("sup"))
+    return cells, sups or ["[1]", "2nd", "[c 1]", "UK"]
+
+
+def _time_per_million(fn, inputs):
+    start = time.perf_counter()
+    for text in inputs:
+        fn(text)
+    return (time.perf_counter() - start) * 1e6 / len(inputs)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compares the text cleanup pass with the chains it replaced."
+    )
+    parser.add_argument("--cells", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    cells, sups = load_cells()
+    random.seed(0)
+    cell_inputs = random.choices(cells, k=args.cells)
+    sup_inputs = random.choices(sups, k=args.cells)
+
+    results = {
+        "cells": args.cells,
+        "distinct_cells": len(set(cells)),
+        "legacy_infobox_chain_s_per_million": _time_per_million(
+            legacy_infobox_cleanup, cell_inputs
+        ),
+        "legacy_table_chain_s_per_million": _time_per_million(
+            legacy_table_cleanup, cell_inputs
+        ),
+        "legacy_sup_check_s_per_million": _time_per_million(
+            legacy_is_noise_annotation, sup_inputs
+        ),
+        "clean_text_uncached_s_per_million": _time_per_million(
+            clean_text.__wrapped__, cell_inputs
+        ),
+        "clean_text_s_per_million": _time_per_million(clean_text, cell_inputs),
+        "is_noise_annotation_s_per_million": _time_per_million(
+            is_noise_annotation, sup_inputs
+        ),
+    }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
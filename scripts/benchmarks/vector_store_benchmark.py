@@ -0,0 +1,120 @@
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(CURRENT_DIR, "..", "db"))
+
+import numpy as np  # noqa: E402
+
+from utils.vector_store import LocalVectorStore  # noqa: E402
+
+
+# (precision, PCA dimensions, rescore candidates) of each configuration; the
+# first is the uncompressed baseline.
+CONFIGS = [
+    ("float32", None, 0),
+    ("float16", None, 0),
+    ("int8", None, 0),
+    ("int8", None, 100),
+    ("float16", 256, 0),
+    ("float16", 256, 100),
+    ("int8", 256, 0),
+    ("int8", 256, 100),
+]
+
+
+def synthetic_embeddings(num_vectors, dimensions, intrinsic_dimensions, rng):
+    """Normalized vectors concentrated near a low-dimensional subspace.
+
+    Real text embeddings share a large common component and vary mostly
+    along a few hundred directions; uniformly random vectors would make PCA
+    look far worse, and quantization far better, than they are.
+    """
+    basis = rng.standard_normal((intrinsic_dimensions, dimensions))
+    weights = 1 / np.arange(1, intrinsic_dimensions + 1) ** 0.5
+    latent = rng.standard_normal((num_vectors, intrinsic_dimensions)) * weights
+    common = rng.standard_normal(dimensions) * 0.5
+    noise = rng.standard_normal((num_vectors, dimensions)) * 0.05
+    vectors = (latent @ basis + common + noise).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Reports the memory, load time, query latency and recall@k "
+        "of compressed local vector stores against float32."
+    )
+    parser.add_argument("--documents", type=int, default=30_000)
+    parser.add_argument("--dimensions", type=int, default=1536)
+    parser.add_argument("--intrinsic-dimensions", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    vectors = synthetic_embeddings(
+        args.documents + args.queries,
+        args.dimensions,
+        args.intrinsic_dimensions,
+        rng,
+    )
+    corpus, queries = vectors[: args.documents], vectors[args.documents :]
+    ids = [str(i) for i in range(args.documents)]
+    exact = [
+        set(np.argsort(-(corpus @ query))[: args.k].astype(str)) for query in queries
+    ]
+
+    tmp_dir = tempfile.mkdtemp()
+    baseline_query_seconds = None
+    try:
+        for precision, dimensions, rescore_candidates in CONFIGS:
+            path = os.path.join(tmp_dir, f"{precision}_{dimensions}")
+            store = LocalVectorStore(precision, dimensions, rescore_candidates)
+            store.add(ids, corpus)
+            start = time.perf_counter()
+            store.save(path)
+            build_seconds = time.perf_counter() - start
+
+            start = time.perf_counter()
+            store = LocalVectorStore.load(
+                path, precision, dimensions, rescore_candidates
+            )
+            load_seconds = time.perf_counter() - start
+
+            start = time.perf_counter()
+            hits = 0
+            for query, expected in zip(queries, exact):
+                found = {doc_id for doc_id, _ in store.search(query, args.k)}
+                hits += len(found & expected)
+            query_seconds = (time.perf_counter() - start) / len(queries)
+            if baseline_query_seconds is None:
+                baseline_query_seconds = query_seconds
+
+            print(
+                json.dumps(
+                    {
+                        "precision": precision,
+                        "dimensions": dimensions or args.dimensions,
+                        "rescore_candidates": rescore_candidates,
+                        "memory_mb": store.memory_bytes / 2**20,
+                        "build_seconds": build_seconds,
+                        "load_seconds": load_seconds,
+                        "query_ms": query_seconds * 1000,
+                        # Only float32 is scored by BLAS, so compression costs
+                        # query time unless PCA shrinks the vectors enough.
+                        "query_slowdown": query_seconds / baseline_query_seconds,
+                        f"recall@{args.k}": hits / (len(queries) * args.k),
+                    }
+                )
+            )
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+if __name__ == "__main__":
+    main()
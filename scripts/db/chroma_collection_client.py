@@ -1,21 +1,91 @@
-import chromadb
-import tiktoken
-
-from chromadb.config import Settings
-from chromadb.utils import embedding_functions
-from gpt_index.indices.service_context import ServiceContext
-from gpt_index.indices.tree.base import GPTTreeIndex
-from gpt_index.langchain_helpers.chain_wrapper import LLMPredictor
-from gpt_index.readers.schema.base import Document
-from langchain.chat_models import ChatOpenAI
-from typing import List, Tuple
-
-
-# OpenAI constants
-CHAT_MODEL = "gpt-3.5-turbo"
-EMBEDDING_MODEL = "text-embedding-ada-002"
+import json
+import math
+import numpy as np
+import os
+import shutil
+import time
+
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from utils.alias_index import AliasIndex
+from utils.chroma import connect
+from utils.context_packer import (
+    PackedContext,
+    pack_context,
+    section_embedding_text,
+    sections_from_metadata,
+    sections_to_metadata,
+    split_sections,
+)
+from utils.dedup import DEFAULT_DUPLICATE_THRESHOLD, find_near_duplicates
+from utils.embeddings import (
+    EmbeddingBackend,
+    EmbeddingCache,
+    EmbeddingScheduler,
+    OpenAIEmbeddingBackend,
+)
+from utils.inverted_index import InvertedIndex
+from utils.llm import build_tree_index, stream_chat_completion
+from utils.mmr import maximal_marginal_relevance
+from utils.snapshot import SnapshotReader, SnapshotWriter
+from utils.table_store import TableStore, parse_lookup
+from utils.tokens import num_tokens_from_string, truncate_to_token_limit
+from utils.tracing import QueryTrace, Tracer
+from utils.vector_store import FLOAT32, LocalVectorStore
+
+
+# OpenAI constants (see also utils/llm.py)
 MAX_TOKENS_FOR_PROMPT = 1024
 MAX_TOKENS_FOR_EMBEDDING = 8190
+# gpt-3.5-turbo has a 4096 token context window. After the answer
+# (`NUM_OUTPUTS`), the longest allowed prompt (`MAX_TOKENS_FOR_PROMPT`) and
+# LlamaIndex's prompt template, roughly this much is left for documents.
+DEFAULT_CONTEXT_TOKEN_BUDGET = 2560
+# Mirrors LlamaIndex's default question-answering prompt, which `query` uses.
+STREAMING_PROMPT_TEMPLATE = (
+    "Context information is below. \n"
+    "---------------------\n"
+    "{context}"
+    "\n---------------------\n"
+    "Given the context information and not prior knowledge, "
+    "answer the question: {query}\n"
+)
+
+# Local index constants
+INVERTED_INDEX_FILENAME = "inverted_index.json.gz"
+ALIASES_FILENAME = "aliases.jsonl"
+TABLE_STORE_FILENAME = "tables.sqlite3"
+VECTOR_STORE_DIRNAME = "vectors"
+SECTION_VECTOR_STORE_DIRNAME = "section_vectors"
+EMBEDDING_CACHE_FILENAME = "embedding_cache.sqlite3"
+DUPLICATES_FILENAME = "duplicates.json"
+# Metadata key listing the IDs of the near-duplicates a document stands in for.
+DUPLICATES_METADATA_KEY = "duplicates"
+# Documents are read from ChromaDB this many at a time when exporting a
+# snapshot, and added this many at a time when importing one.
+SNAPSHOT_BATCH_SIZE = 1000
+# Documents are embedded this many at a time when loading: enough to spread
+# over concurrent embedding requests, while only one batch's embeddings are
+# held in memory and a failed request only loses its batch. Each batch is
+# added to ChromaDB `ADD_BATCH_SIZE` documents at a time, so that a problem
+# document only fails those few.
+LOAD_BATCH_SIZE = 1000
+ADD_BATCH_SIZE = 10
+# Weight given to the (min-max normalized) BM25 score when fusing it with the
+# (min-max normalized) vector similarity. The remainder goes to the vector score.
+HYBRID_BM25_WEIGHT = 0.4
+# Each retriever fetches this many times `n_results` candidates before fusion,
+# so that a document ranked highly by only one of them can still make the cut.
+HYBRID_CANDIDATE_MULTIPLIER = 3
+# With section retrieval, section `<N>` of document `<ID>` is stored in the
+# section vector store as `<ID>#<N>`.
+SECTION_ID_SEPARATOR = "#"
+# With section retrieval, sections scoring less than this fraction of the
+# best retrieved section aren't packed into the LLM's context.
+MIN_SECTION_SCORE_FRACTION = 0.35
+# Trailing words that turn a bare title into an infobox lookup, e.g.
+# "Abyssal bludgeon stats".
+LOOKUP_SUFFIXES = ("stats", "infobox", "info", "bonuses", "details")
 
 
 class ChromaCollectionClient:
@@ -26,6 +96,21 @@ class ChromaCollectionClient:
         port: int,
         openai_api_key: str,
         collection_name: str,
+        index_dir: Optional[str] = None,
+        aliases_path: Optional[str] = None,
+        table_store_path: Optional[str] = None,
+        context_token_budget: int = DEFAULT_CONTEXT_TOKEN_BUDGET,
+        stream_llm: Optional[Callable[[str], Iterator[str]]] = None,
+        tracer: Optional[Tracer] = None,
+        embedding_backend: Optional[EmbeddingBackend] = None,
+        embedding_cache_precision: Optional[str] = None,
+        embedding_cache_path: Optional[str] = None,
+        vector_precision: Optional[str] = None,
+        vector_dimensions: Optional[int] = None,
+        rescore_candidates: int = 0,
+        duplicate_threshold: Optional[float] = DEFAULT_DUPLICATE_THRESHOLD,
+        section_retrieval: bool = False,
+        mmr_lambda: Optional[float] = None,
     ) -> None:
         """
         Args:
@@ -37,23 +122,134 @@ class ChromaCollectionClient:
             openai_api_key (str): The OpenAI API key to use.
             collection_name (str): The name of the ChromaDB collection to use. If
                 unavailable, a new collection will be created with this name.
+            index_dir (Optional[str]): The directory local indices (e.g. the
+                BM25 inverted index) for this collection are stored in.
+                Defaults to `index/<collection_name>` at the root of the
+                project.
+            aliases_path (Optional[str]): The aliases file written by the wiki
+                scraper, mapping article names to summary filenames. Defaults
+                to `aliases.jsonl` at the root of the project.
+            table_store_path (Optional[str]): The SQLite store of drop and
+                shop table rows lookup-style prompts are answered from.
+                Defaults to `tables.sqlite3` in `index_dir`.
+            context_token_budget (int): The maximum number of tokens of
+                retrieved content passed to the LLM per query.
+            stream_llm (Optional[Callable[[str], Iterator[str]]]): Generates an
+                answer to a fully formatted prompt, yielding it piece by piece.
+                Used by `stream_query`. Defaults to streaming OpenAI's chat
+                model.
+            tracer (Optional[Tracer]): Records each query's per-stage
+                latency, token usage and retrieved documents. Defaults to a
+                tracer that prints a breakdown of every query.
+            embedding_backend (Optional[EmbeddingBackend]): Embeds documents
+                and prompts. Embeddings are computed by the client, within
+                the backend's rate limits, and passed to ChromaDB. Defaults
+                to OpenAI's embedding model.
+            embedding_cache_precision (Optional[str]): If given, embeddings
+                are cached in `index_dir` at this precision ("float32",
+                "float16" or "int8"), so unchanged documents aren't
+                re-embedded when reloaded.
+            embedding_cache_path (Optional[str]): Where embeddings are
+                cached. Defaults to `embedding_cache.sqlite3` in `index_dir`.
+            vector_precision (Optional[str]): If given, document embeddings
+                are also kept in a local vector store in `index_dir` at this
+                precision, and searched instead of ChromaDB. float16 and int8
+                take less memory than float32 but are slower to search, unless
+                `vector_dimensions` reduces them too.
+            vector_dimensions (Optional[int]): If given, the local vector
+                store reduces embeddings to this many dimensions by PCA.
+            rescore_candidates (int): How many of the local vector store's
+                best candidates are rescored with the float32 embeddings.
+            duplicate_threshold (Optional[float]): Summaries loaded together
+                that are at least this similar (see `find_near_duplicates`)
+                are indexed once, as their canonical summary. No
+                deduplication if None.
+            section_retrieval (bool): If True, retrieval is two-staged:
+                documents are embedded by their lead section (title, infobox
+                and intro) alone and retrieved as usual, then each retrieved
+                document's sections are scored against the prompt by their
+                own embeddings, kept in a local store in `index_dir`. Only
+                the relevant sections are packed into the LLM's context.
+                Changing this requires reloading the collection.
+            mmr_lambda (Optional[float]): If given, the retrieved documents
+                are diversified by maximal marginal relevance (see
+                `maximal_marginal_relevance`) among all fused candidates,
+                with this trade-off between relevance and novelty. E.g. only
+                one of several variants of a monster is passed to the LLM,
+                leaving room for other relevant articles. No diversification
+                if None.
         """
-        self._client = chromadb.Client(
-            Settings(
-                chroma_api_impl=api_type,
-                chroma_server_host=host,
-                chroma_server_http_port=port,
-            )
-        )
+        self._client = connect(api_type, host, port)
         self._openai_api_key = openai_api_key
-        openai_ef = embedding_functions.OpenAIEmbeddingFunction(
-            api_key=self._openai_api_key, model_name=EMBEDDING_MODEL
-        )
+        current_dir = os.path.dirname(os.path.abspath(__file__))
+        two_dirs_up = os.path.join(current_dir, "..", "..")
+        if index_dir is None:
+            index_dir = os.path.join(two_dirs_up, "index", collection_name)
+        os.makedirs(index_dir, exist_ok=True)
+
+        if embedding_backend is None:
+            embedding_backend = OpenAIEmbeddingBackend(self._openai_api_key)
+        embedding_cache = None
+        if embedding_cache_precision is not None:
+            if embedding_cache_path is None:
+                embedding_cache_path = os.path.join(index_dir, EMBEDDING_CACHE_FILENAME)
+            embedding_cache = EmbeddingCache(
+                embedding_cache_path, embedding_cache_precision
+            )
+        self._embedder = EmbeddingScheduler(embedding_backend, cache=embedding_cache)
         self._collection_name = collection_name
+        # Embeddings are always passed in explicitly; the collection's
+        # embedding function only keeps ChromaDB from falling back to its own
+        # model if they aren't.
         self._collection = self._client.get_or_create_collection(
-            name=collection_name, embedding_function=openai_ef
+            name=collection_name, embedding_function=self._embedder
         )
 
+        self._inverted_index_path = os.path.join(index_dir, INVERTED_INDEX_FILENAME)
+        self._inverted_index = InvertedIndex.load(self._inverted_index_path)
+        if aliases_path is None:
+            aliases_path = os.path.join(two_dirs_up, ALIASES_FILENAME)
+        self._alias_index = AliasIndex.load(aliases_path)
+        if table_store_path is None:
+            table_store_path = os.path.join(index_dir, TABLE_STORE_FILENAME)
+        self._table_store = TableStore(table_store_path)
+        self._vector_store_path = os.path.join(index_dir, VECTOR_STORE_DIRNAME)
+        self._vector_store = None
+        if vector_precision is not None:
+            self._vector_store = LocalVectorStore.load(
+                self._vector_store_path,
+                vector_precision,
+                vector_dimensions,
+                rescore_candidates,
+            )
+        self._section_store_path = os.path.join(index_dir, SECTION_VECTOR_STORE_DIRNAME)
+        self._section_store = None
+        if section_retrieval:
+            self._section_store = LocalVectorStore.load(self._section_store_path)
+        self._duplicate_threshold = duplicate_threshold
+        self._mmr_lambda = mmr_lambda
+        # Near-duplicate documents that weren't indexed, keyed by ID: the
+        # "canonical" document indexed in their place and their "title".
+        self._duplicates_path = os.path.join(index_dir, DUPLICATES_FILENAME)
+        self._duplicates: Dict[str, Dict[str, str]] = {}
+        if os.path.exists(self._duplicates_path):
+            with open(self._duplicates_path, encoding="utf-8") as f:
+                self._duplicates = json.load(f)
+        for duplicate in self._duplicates.values():
+            self._alias_index.add(
+                duplicate["title"], duplicate["canonical"], overwrite=False
+            )
+        self._context_token_budget = context_token_budget
+        # Section boundaries and token counts for documents loaded before they
+        # were cached in metadata, keyed by document ID.
+        self._sections_cache = {}
+        if stream_llm is None:
+            stream_llm = self._stream_chat_completion
+        self._stream_llm = stream_llm
+        if tracer is None:
+            tracer = Tracer()
+        self._tracer = tracer
+
     def delete(self) -> None:
         """
         Deletes the specified collection and removes the reference to this
@@ -62,7 +258,7 @@ class ChromaCollectionClient:
         self._client.delete_collection(name=self._collection_name)
         del self
 
-    def load(self, summaries: List[Tuple[str, str]]) -> None:
+    def load(self, summaries: List[Tuple[str, str]], replace: bool = False) -> None:
         """Loads content into the ChromaDB collection.
 
         If a given piece of content exceeds the max embedding token size of 8190
@@ -70,53 +266,332 @@ class ChromaCollectionClient:
         Truncation adheres to the Fibonacci sequence (i.e. first 1 word is cut,
         then 2, then 3, then 5, then 8 and so on...).
 
-        Files are added in small batches such that any problem documents can be
-        handled separately.
+        Documents are embedded `LOAD_BATCH_SIZE` at a time, each batch in as
+        few requests as the embedding backend allows and concurrently within
+        its rate limits, and then added in small batches such that any
+        problem documents can be handled separately. A batch that fails to
+        embed or to add is reported and skipped; the rest still load. Every
+        successfully added batch is also added to the local BM25 inverted
+        index, which is persisted once loading finishes.
+
+        Each document's section boundaries and per-section token counts are
+        stored in its metadata so that `query` can pack context without
+        re-tokenizing documents. With section retrieval, documents are
+        embedded by their lead section, and every section is embedded too.
+
+        Near-duplicate summaries (e.g. an item's charged variants) are only
+        embedded and indexed once, as their cluster's canonical summary,
+        which lists the others' IDs in its metadata. Their titles become
+        aliases of the canonical document. Only summaries loaded together
+        are compared.
 
         Args:
             summaries (List[Tuple[str, str]]): A list of tuples containing
                                             filename and content pairs for each
                                             document summary.
+            replace (bool): If True, documents already in the collection
+                under the same IDs are replaced. Each is only removed once
+                its batch has been embedded, so a failed batch leaves the
+                documents it would have replaced in place.
         """
 
         def _add_batch_to_collection(
-            documents: List[str], ids: List[str], batch_num: int
-        ) -> None:
+            documents: List[str],
+            ids: List[str],
+            embeddings: List[List[float]],
+            batch_num: int,
+        ) -> bool:
+            metadatas = [sections_to_metadata(sections[doc_id]) for doc_id in ids]
+            for doc_id, metadata in zip(ids, metadatas):
+                if doc_id in duplicate_ids:
+                    metadata[DUPLICATES_METADATA_KEY] = json.dumps(
+                        duplicate_ids[doc_id]
+                    )
             try:
-                self._collection.add(documents=documents, ids=ids)
+                self._collection.add(
+                    documents=documents,
+                    ids=ids,
+                    embeddings=embeddings,
+                    metadatas=metadatas,
+                )
             except:
                 print()
                 print(f"Batch {batch_num} failed! Problematic document(s):")
                 print(ids)
                 print()
+                return False
+
+            for doc_id, document in zip(ids, documents):
+                self._inverted_index.add(doc_id, _get_title(document), document)
+            return True
+
+        for filename, _ in summaries:
+            self._duplicates.pop(filename, None)
+        duplicate_ids = {}
+        if self._duplicate_threshold is not None:
+            kept, duplicate_ids = self._deduplicate(summaries)
+            if replace:
+                # Documents that are now near-duplicates are only indexed as
+                # their canonical document.
+                kept_ids = {filename for filename, _ in kept}
+                self._remove(
+                    self._collection.get(
+                        ids=[f for f, _ in summaries if f not in kept_ids]
+                    )["ids"]
+                )
+            summaries = kept
+
+        batch_num = 1
+        for i in range(0, len(summaries), LOAD_BATCH_SIZE):
+            filename_ids, documents_content = [], []
+            for filename, content in summaries[i : i + LOAD_BATCH_SIZE]:
+                filename_ids.append(filename)
+                documents_content.append(
+                    truncate_to_token_limit(content, MAX_TOKENS_FOR_EMBEDDING)
+                )
+            sections = {
+                doc_id: split_sections(content, num_tokens_from_string)
+                for doc_id, content in zip(filename_ids, documents_content)
+            }
+            num_batches = math.ceil(len(filename_ids) / ADD_BATCH_SIZE)
+            try:
+                embeddings, section_embeddings = self._embed_documents(
+                    filename_ids, documents_content, sections
+                )
+            except Exception as e:
+                print()
+                print(
+                    f"Embedding batches {batch_num}-{batch_num + num_batches - 1} "
+                    f"failed ({e!r})! Skipped document(s):"
+                )
+                print(filename_ids)
+                print()
+                batch_num += num_batches
+                continue
+            if replace:
+                self._remove(self._collection.get(ids=filename_ids)["ids"])
+
+            # Successfully added documents, for the local vector stores.
+            added_ids, added_embeddings = [], []
+            for j in range(0, len(filename_ids), ADD_BATCH_SIZE):
+                ids_batch = filename_ids[j : j + ADD_BATCH_SIZE]
+                embeddings_batch = embeddings[j : j + ADD_BATCH_SIZE]
+                if _add_batch_to_collection(
+                    documents_content[j : j + ADD_BATCH_SIZE],
+                    ids_batch,
+                    embeddings_batch,
+                    batch_num,
+                ):
+                    added_ids.extend(ids_batch)
+                    added_embeddings.extend(embeddings_batch)
+                batch_num += 1
 
-        filename_ids, documents_content = [], []
-        for filename, content in summaries:
-            filename_ids.append(filename)
-            # TODO(rbnsl): Is there a better way of doing this?
-            content_token_count = self._num_tokens_from_string(content, "cl100k_base")
-            f1, f2 = 0, 1
-            while content_token_count > MAX_TOKENS_FOR_EMBEDDING:
-                content = content.rsplit(" ", f2)[0]
-                f_tmp, f1 = f1, f2
-                f2 += f_tmp
-                content_token_count = self._num_tokens_from_string(
-                    content, "cl100k_base"
+            if self._vector_store is not None:
+                self._vector_store.add(added_ids, added_embeddings)
+            if self._section_store is not None:
+                added = set(added_ids)
+                section_ids = [
+                    section_id
+                    for section_id in section_embeddings
+                    if section_id.rsplit(SECTION_ID_SEPARATOR, 1)[0] in added
+                ]
+                self._section_store.add(
+                    section_ids, [section_embeddings[s] for s in section_ids]
                 )
-            documents_content.append(content)
 
-        batch_num, batch_size = 1, 10
-        for i in range(0, len(filename_ids), batch_size):
-            content_batch = documents_content[i : i + batch_size]
-            ids_batch = filename_ids[i : i + batch_size]
-            _add_batch_to_collection(content_batch, ids_batch, batch_num)
-            batch_num += 1
+        self._save_indices()
 
-        remaining = len(filename_ids) % batch_size
-        if remaining > 0:
-            content_batch = documents_content[-remaining:]
-            ids_batch = filename_ids[-remaining:]
-            _add_batch_to_collection(content_batch, ids_batch, batch_num)
+    def count(self) -> int:
+        """Returns the number of documents in the collection."""
+        return self._collection.count()
+
+    def search(self, prompt: str, n_results: int = 3) -> List[str]:
+        """Returns the IDs of the documents `query` would answer from.
+
+        Unlike `query`, no LLM is called, so this is cheap enough to e.g.
+        sanity-check a freshly loaded collection with sample prompts.
+        """
+        pinned_id = self._find_named(prompt)
+        query_embedding = self._embedder.embed([prompt])[0]
+        return [
+            doc_id
+            for doc_id, _, _ in self._retrieve(
+                prompt, query_embedding, n_results, pinned_id
+            )
+        ]
+
+    def export_snapshot(self, path: str, precision: str = FLOAT32) -> None:
+        """Exports the collection to a snapshot (see `utils/snapshot.py`).
+
+        The snapshot holds every document's ID, text, metadata and
+        embedding, plus the table store and near-duplicates, so that
+        `import_snapshot` can bring up a replica without calling the
+        embedding API. The collection shouldn't be loaded into meanwhile.
+        With section retrieval, the section embeddings are included.
+
+        Args:
+            path (str): The directory to write the snapshot to.
+            precision (str): The precision embeddings are stored at
+                ("float32", "float16" or "int8").
+        """
+        start = time.perf_counter()
+        num_documents = self.count()
+        writer = SnapshotWriter(
+            path,
+            self._collection_name,
+            self._embedder.backend.name,
+            num_documents,
+            precision,
+        )
+        for offset in range(0, num_documents, SNAPSHOT_BATCH_SIZE):
+            page = self._collection.get(
+                limit=SNAPSHOT_BATCH_SIZE,
+                offset=offset,
+                include=["documents", "metadatas", "embeddings"],
+            )
+            writer.write(
+                page["ids"], page["documents"], page["metadatas"], page["embeddings"]
+            )
+        self._table_store.backup(writer.tables_path)
+        if self._section_store is not None and os.path.exists(self._section_store_path):
+            shutil.copytree(self._section_store_path, writer.section_vectors_path)
+        writer.close(self._duplicates)
+        print(
+            f"Exported {num_documents} documents to {path} in "
+            f"{time.perf_counter() - start:.1f}s."
+        )
+
+    def import_snapshot(self, path: str) -> None:
+        """Loads a snapshot written by `export_snapshot` into the collection.
+
+        Documents are added with their snapshotted embeddings in bulk, and
+        the local indices rebuilt from them; nothing is embedded, unless
+        this client does section retrieval and the snapshot has no section
+        embeddings.
+
+        Raises:
+            ValueError: If the collection isn't empty, or the snapshot's
+                embeddings are of a different model than this client embeds
+                prompts with.
+        """
+        start = time.perf_counter()
+        snapshot = SnapshotReader(path)
+        if self.count() > 0:
+            raise ValueError("Snapshots can only be imported into an empty collection.")
+        if snapshot.embedding_model != self._embedder.backend.name:
+            raise ValueError(
+                f"The snapshot's embeddings are of {snapshot.embedding_model}, "
+                f"not {self._embedder.backend.name}."
+            )
+
+        embed_sections = False
+        if self._section_store is not None:
+            if snapshot.section_vectors_path is not None:
+                self._section_store = LocalVectorStore.load(
+                    snapshot.section_vectors_path
+                )
+            else:
+                print("The snapshot has no section embeddings; embedding them.")
+                embed_sections = True
+
+        added_ids = []
+        for ids, documents, metadatas, embeddings in snapshot.batches(
+            SNAPSHOT_BATCH_SIZE
+        ):
+            self._collection.add(
+                documents=documents,
+                ids=ids,
+                embeddings=embeddings.tolist(),
+                metadatas=metadatas,
+            )
+            for doc_id, document in zip(ids, documents):
+                self._inverted_index.add(doc_id, _get_title(document), document)
+            added_ids.extend(ids)
+            if embed_sections:
+                section_embeddings = self._embed_sections(
+                    ids,
+                    documents,
+                    {
+                        doc_id: self._get_sections(doc_id, document, metadata)
+                        for doc_id, document, metadata in zip(ids, documents, metadatas)
+                    },
+                )
+                self._section_store.add(
+                    list(section_embeddings), list(section_embeddings.values())
+                )
+        self._inverted_index.save(self._inverted_index_path)
+        if self._vector_store is not None:
+            self._vector_store.add(added_ids, snapshot.embeddings())
+            self._vector_store.save(self._vector_store_path)
+        if self._section_store is not None:
+            self._section_store.save(self._section_store_path)
+
+        if snapshot.tables_path is not None:
+            self._table_store.restore(snapshot.tables_path)
+        self._duplicates = snapshot.duplicates()
+        for duplicate in self._duplicates.values():
+            self._alias_index.add(
+                duplicate["title"], duplicate["canonical"], overwrite=False
+            )
+        self._save_duplicates()
+        print(
+            f"Imported {len(added_ids)} documents from {path} in "
+            f"{time.perf_counter() - start:.1f}s."
+        )
+
+    def load_tables(self, records: List[Dict]) -> None:
+        """Loads table sidecars written by the wiki scraper into the table store.
+
+        Each document's rows replace any it already has, so this is also how
+        re-scraped documents' tables are synced.
+
+        Args:
+            records (List[Dict]): The contents of each sidecar file: the
+                document's "id" (its summary filename), "title" and "tables".
+        """
+        num_rows = 0
+        for record in records:
+            num_rows += self._table_store.add(
+                record["id"], record["title"], record["tables"]
+            )
+        print(f"Loaded {num_rows} table rows from {len(records)} documents.")
+
+    def remove(self, ids: List[str]) -> None:
+        """Removes documents from the collection and the local indices."""
+        if len(ids) == 0:
+            return
+        self._remove(ids)
+        removed = set(ids)
+        self._duplicates = {
+            doc_id: duplicate
+            for doc_id, duplicate in self._duplicates.items()
+            if doc_id not in removed and duplicate["canonical"] not in removed
+        }
+        self._save_indices()
+
+    def sync(
+        self,
+        summaries: List[Tuple[str, str]],
+        removed_ids: List[str],
+        tables: Optional[List[Dict]] = None,
+    ) -> None:
+        """Applies a delta scrape to the collection.
+
+        Args:
+            summaries (List[Tuple[str, str]]): Filename and content pairs of
+                new or changed summaries (the summaries delta's "upserted"
+                files). Any existing documents with the same IDs are replaced,
+                each only once its replacement has been embedded.
+            removed_ids (List[str]): Filenames of summaries that were deleted
+                (the summaries delta's "removed" files).
+            tables (Optional[List[Dict]]): The table sidecars of the new or
+                changed summaries (see `load_tables`). Replaced documents lose
+                their table rows otherwise.
+        """
+        self.remove(list(removed_ids))
+        self.load(summaries, replace=True)
+        if tables:
+            self.load_tables(tables)
 
     def query(self, prompt: str, n_results: int = 3) -> str:
         """Constructs an answer to a provided prompt based on DB content.
@@ -124,60 +599,480 @@ class ChromaCollectionClient:
         How it works:
             1. Tokenize the prompt to ensure it's not too long. If it is, this
                should be indicated to the user
-            2. Queries ChromaDB to return the 3 most similar documents to the
-               prompt
-            3. LlamaIndex is used to construct a list index out of the 3
+            2. If the prompt is just an article title or alias (optionally
+               followed by e.g. "stats"), that article's infobox is returned
+               as-is; no LLM call is needed. Likewise, lookups like "what
+               drops dragon bones" or "where can I buy a rune scimitar" are
+               answered straight from the table store
+            3. Queries ChromaDB and the local BM25 index for candidates, fusing
+               both scores to pick the 3 most relevant documents to the prompt.
+               If the prompt names an article (by title or alias), that
+               article is always one of the 3
+            4. The documents' sections are ranked by relevance to the prompt
+               and the best ones packed into the context token budget. With
+               section retrieval, only their sections' embeddings are
+               searched, and irrelevant sections are left out
+            5. LlamaIndex is used to construct a list index out of the packed
                documents
-            4. This index is queried with the prompt, and the documents' content
+            6. This index is queried with the prompt, and the documents' content
                injected as context
-            5. LlamaIndex uses OpenAI's chat model under the hood to generate
+            7. LlamaIndex uses OpenAI's chat model under the hood to generate
                a response to the prompt using the documents' content
 
         Args:
             prompt (str): The search prompt to query the collection for.
             n_results (int): The number of results to return. Defaults to 3.
 
+        Every stage is timed and recorded, along with token usage and the
+        retrieved documents, by the client's tracer.
+
         Returns:
             str: The query result as a string.
         """
-        num_tokens = self._num_tokens_from_string(prompt, "cl100k_base")
-        if num_tokens > MAX_TOKENS_FOR_PROMPT:
-            raise ValueError(f"Prompt too long: {prompt} has {num_tokens} tokens.")
+        trace = self._tracer.start(prompt)
+        try:
+            num_prompt_tokens = self._check_prompt_length(prompt, trace)
 
-        results = self._collection.query(
-            query_texts=[prompt],
-            n_results=n_results,
-        )
+            with trace.span("lookup"):
+                answer = self._lookup(prompt)
+            if answer:
+                return answer
 
-        documents = []
-        for result in zip(
-            results["ids"][0],
-            results["documents"][0],
-            results["metadatas"][0],
-        ):
-            document = Document(
-                doc_id=result[0],
-                text=result[1],
-                extra_info=result[2],
+            context = self._build_context(prompt, n_results, trace)
+            trace.embedding_tokens = num_prompt_tokens
+            trace.llm_tokens_in = num_tokens_from_string(
+                _format_llm_prompt(context, prompt)
             )
-            documents.append(document)
+            with trace.span("build_index"):
+                index = build_tree_index(context.documents)
 
-        num_outputs = 256
-        llm_predictor = LLMPredictor(
-            llm=ChatOpenAI(
-                temperature=0.6, model_name=CHAT_MODEL, max_tokens=num_outputs
-            )
+            with trace.span("llm"):
+                response = index.query(prompt, mode="retrieve")
+            trace.llm_tokens_out = num_tokens_from_string(str(response))
+            return response
+        except Exception as e:
+            trace.error = str(e)
+            raise
+        finally:
+            self._tracer.finish(trace)
+
+    def stream_query(self, prompt: str, n_results: int = 3) -> Iterator[str]:
+        """Like `query`, but yields the answer as the LLM generates it.
+
+        Retrieval and context packing are identical to `query`. Rather than
+        building a tree index, the packed context is formatted into a single
+        prompt and streamed through `stream_llm`, so the first piece of the
+        answer arrives as soon as the LLM produces it.
+
+        Args:
+            prompt (str): The search prompt to query the collection for.
+            n_results (int): The number of results to return. Defaults to 3.
+
+        Yields:
+            str: Consecutive pieces of the answer.
+        """
+        trace = self._tracer.start(prompt)
+        try:
+            num_prompt_tokens = self._check_prompt_length(prompt, trace)
+
+            with trace.span("lookup"):
+                answer = self._lookup(prompt)
+            if answer:
+                trace.mark_first_token()
+                yield answer
+                return
+
+            context = self._build_context(prompt, n_results, trace)
+            llm_prompt = _format_llm_prompt(context, prompt)
+            trace.embedding_tokens = num_prompt_tokens
+            trace.llm_tokens_in = num_tokens_from_string(llm_prompt)
+
+            # Time spent by the caller between pieces is counted towards the
+            # LLM stage too, as the answer is generated lazily.
+            answer = []
+            with trace.span("llm"):
+                for piece in self._stream_llm(llm_prompt):
+                    trace.mark_first_token()
+                    answer.append(piece)
+                    yield piece
+            trace.llm_tokens_out = num_tokens_from_string("".join(answer))
+        except Exception as e:
+            trace.error = str(e)
+            raise
+        finally:
+            self._tracer.finish(trace)
+
+    def _deduplicate(
+        self, summaries: List[Tuple[str, str]]
+    ) -> Tuple[List[Tuple[str, str]], Dict[str, List[str]]]:
+        """Drops near-duplicate summaries, recording what they resolve to.
+
+        Returns:
+            Tuple[List[Tuple[str, str]], Dict[str, List[str]]]: The summaries
+                to index, and the IDs of the near-duplicates each canonical
+                summary stands in for.
+        """
+        start = time.perf_counter()
+        duplicate_ids = find_near_duplicates(summaries, self._duplicate_threshold)
+        titles = {filename: _get_title(content) for filename, content in summaries}
+        for canonical_id, ids in duplicate_ids.items():
+            for doc_id in ids:
+                self._duplicates[doc_id] = {
+                    "canonical": canonical_id,
+                    "title": titles[doc_id],
+                }
+                self._alias_index.add(titles[doc_id], canonical_id, overwrite=False)
+
+        kept = [(f, c) for f, c in summaries if f not in self._duplicates]
+        num_tokens_saved = sum(
+            num_tokens_from_string(c) for f, c in summaries if f in self._duplicates
         )
-        service_context = ServiceContext.from_defaults(llm_predictor=llm_predictor)
-        index = GPTTreeIndex.from_documents(
-            documents,
-            service_context=service_context,
+        print(
+            f"Skipped {len(summaries) - len(kept)} of {len(summaries)} summaries "
+            f"as near-duplicates of {len(duplicate_ids)} others "
+            f"({num_tokens_saved} tokens not embedded) in "
+            f"{time.perf_counter() - start:.2f}s."
         )
+        return kept, duplicate_ids
+
+    def _remove(self, ids: List[str]) -> None:
+        """Removes documents from the collection and the local indices.
+
+        The indices aren't saved, and near-duplicates resolving to the
+        documents are kept, as they're about to be replaced.
+        """
+        if len(ids) == 0:
+            return
+        self._collection.delete(ids=ids)
+        self._table_store.remove(ids)
+        for doc_id in ids:
+            self._inverted_index.remove(doc_id)
+            self._sections_cache.pop(doc_id, None)
+        if self._vector_store is not None:
+            self._vector_store.remove(ids)
+        if self._section_store is not None:
+            removed = set(ids)
+            self._section_store.remove(
+                [
+                    section_id
+                    for section_id in self._section_store.ids
+                    if section_id.rsplit(SECTION_ID_SEPARATOR, 1)[0] in removed
+                ]
+            )
 
-        return index.query(prompt, mode="retrieve")
+    def _save_indices(self) -> None:
+        self._inverted_index.save(self._inverted_index_path)
+        self._save_duplicates()
+        if self._vector_store is not None:
+            self._vector_store.save(self._vector_store_path)
+        if self._section_store is not None:
+            self._section_store.save(self._section_store_path)
 
-    def _num_tokens_from_string(self, string: str, encoding_name: str) -> int:
-        """Returns the number of tokens in a text string."""
-        encoding = tiktoken.get_encoding(encoding_name)
-        num_tokens = len(encoding.encode(string))
+    def _save_duplicates(self) -> None:
+        with open(self._duplicates_path, "w", encoding="utf-8") as f:
+            json.dump(self._duplicates, f)
+
+    def _check_prompt_length(self, prompt: str, trace: QueryTrace) -> int:
+        """Returns the number of tokens in the prompt, if it's not too long."""
+        with trace.span("tokenize"):
+            num_tokens = num_tokens_from_string(prompt)
+        if num_tokens > MAX_TOKENS_FOR_PROMPT:
+            raise ValueError(f"Prompt too long: {prompt} has {num_tokens} tokens.")
         return num_tokens
+
+    def _build_context(
+        self, prompt: str, n_results: int, trace: QueryTrace
+    ) -> PackedContext:
+        """Retrieves documents for a prompt and packs them into the budget."""
+        with trace.span("retrieve"):
+            pinned_id = self._find_named(prompt)
+            query_embedding = self._embedder.embed([prompt])[0]
+            retrieved = []
+            for doc_id, text, metadata in self._retrieve(
+                prompt, query_embedding, n_results, pinned_id
+            ):
+                sections = self._get_sections(doc_id, text, metadata)
+                retrieved.append((doc_id, text, sections))
+        trace.doc_ids = [doc_id for doc_id, _, _ in retrieved]
+
+        if self._section_store is None:
+            with trace.span("pack"):
+                return pack_context(prompt, retrieved, self._context_token_budget)
+
+        with trace.span("retrieve_sections"):
+            section_nums = {}
+            for doc_num, (doc_id, _, sections) in enumerate(retrieved):
+                for section_num in range(len(sections)):
+                    section_id = f"{doc_id}{SECTION_ID_SEPARATOR}{section_num}"
+                    section_nums[section_id] = (doc_num, section_num)
+            section_scores = {
+                section_nums[section_id]: score
+                for section_id, score in self._section_store.score(
+                    query_embedding, list(section_nums)
+                ).items()
+            }
+        with trace.span("pack"):
+            return pack_context(
+                prompt,
+                retrieved,
+                self._context_token_budget,
+                section_scores,
+                MIN_SECTION_SCORE_FRACTION,
+            )
+
+    def _stream_chat_completion(self, llm_prompt: str) -> Iterator[str]:
+        """Streams an answer from OpenAI's chat model."""
+        return stream_chat_completion(llm_prompt, self._openai_api_key)
+
+    def _lookup(self, prompt: str) -> Optional[str]:
+        """Answers the prompt without retrieval or an LLM, if it's a lookup."""
+        return self._lookup_infobox(prompt) or self._lookup_table(prompt)
+
+    def _lookup_table(self, prompt: str) -> Optional[str]:
+        """Answers drop and shop lookups from the table store."""
+        lookup = parse_lookup(prompt)
+        if lookup is None:
+            return None
+        kind, name = lookup
+        return self._table_store.answer(kind, name, self._match_name(name))
+
+    def _lookup_infobox(self, prompt: str) -> Optional[str]:
+        """Returns the infobox of the article the prompt exactly names, if any."""
+        name = prompt.strip().rstrip("?!.")
+        doc_id = self._match_name(name)
+        if doc_id is None:
+            last_word_removed = name.rsplit(" ", 1)
+            if len(last_word_removed) < 2:
+                return None
+            if last_word_removed[1].lower() not in LOOKUP_SUFFIXES:
+                return None
+            doc_id = self._match_name(last_word_removed[0])
+            if doc_id is None:
+                return None
+
+        results = self._collection.get(ids=[doc_id])
+        if len(results["documents"]) == 0:
+            return None
+        return _get_infobox(results["documents"][0])
+
+    def _find_named(self, prompt: str) -> Optional[str]:
+        """Returns the ID of the document the prompt names, if any."""
+        doc_id = self._alias_index.find(prompt, self._inverted_index.document_fraction)
+        if doc_id in self._duplicates:
+            doc_id = self._duplicates[doc_id]["canonical"]
+        return doc_id
+
+    def _match_name(self, name: str) -> Optional[str]:
+        """Returns the ID of the document titled (or aliased) exactly `name`."""
+        doc_id = self._alias_index.get(name)
+        if doc_id is None:
+            doc_id = self._inverted_index.match_title(name)
+        if doc_id in self._duplicates:
+            doc_id = self._duplicates[doc_id]["canonical"]
+        return doc_id
+
+    def _retrieve(
+        self,
+        prompt: str,
+        query_embedding: List[float],
+        n_results: int,
+        pinned_id: Optional[str] = None,
+    ) -> List[Tuple[str, str, Optional[Dict]]]:
+        """Hybrid retrieval fusing vector similarity with BM25.
+
+        Args:
+            prompt (str): The search prompt.
+            query_embedding (List[float]): The prompt's embedding.
+            n_results (int): The number of documents to return.
+            pinned_id (Optional[str]): A document that must be returned
+                (first) regardless of its score, e.g. because the prompt
+                names it.
+
+        With MMR, every fused candidate is fetched with its embedding, and
+        the `n_results` documents are selected among them for relevance and
+        novelty together. The pinned document stays first.
+
+        Returns:
+            List[Tuple[str, str, Optional[Dict]]]: (ID, document, metadata)
+                triples for the `n_results` best documents, best first.
+        """
+        num_candidates = n_results * HYBRID_CANDIDATE_MULTIPLIER
+        include = ["documents", "metadatas", "distances"]
+        if self._mmr_lambda is not None:
+            include.append("embeddings")
+
+        candidates = {}
+        embeddings = {}
+        vector_scores = {}
+        if self._vector_store is not None:
+            # Documents are fetched below, along with BM25's.
+            vector_scores = dict(
+                self._vector_store.search(query_embedding, num_candidates)
+            )
+        else:
+            results = self._collection.query(
+                query_embeddings=[query_embedding],
+                n_results=num_candidates,
+                include=include,
+            )
+            for i, (doc_id, text, metadata, distance) in enumerate(
+                zip(
+                    results["ids"][0],
+                    results["documents"][0],
+                    results["metadatas"][0],
+                    results["distances"][0],
+                )
+            ):
+                candidates[doc_id] = (doc_id, text, metadata)
+                # Smaller distances are better; negate so that larger is better.
+                vector_scores[doc_id] = -distance
+                if self._mmr_lambda is not None:
+                    embeddings[doc_id] = results["embeddings"][0][i]
+        bm25_scores = dict(self._inverted_index.search(prompt, num_candidates))
+
+        fused_scores = _fuse_scores(vector_scores, bm25_scores, HYBRID_BM25_WEIGHT)
+        best_ids = sorted(fused_scores, key=fused_scores.get, reverse=True)
+        if pinned_id is not None:
+            best_ids = [pinned_id] + [i for i in best_ids if i != pinned_id]
+        if self._mmr_lambda is None:
+            best_ids = best_ids[:n_results]
+
+        # Documents only BM25 (or the local vector store) found still need
+        # their content fetched.
+        missing_ids = [doc_id for doc_id in best_ids if doc_id not in candidates]
+        if missing_ids:
+            fetched = self._collection.get(
+                ids=missing_ids, include=[i for i in include if i != "distances"]
+            )
+            for i, (doc_id, text, metadata) in enumerate(
+                zip(fetched["ids"], fetched["documents"], fetched["metadatas"])
+            ):
+                candidates[doc_id] = (doc_id, text, metadata)
+                if self._mmr_lambda is not None:
+                    embeddings[doc_id] = fetched["embeddings"][i]
+        best_ids = [doc_id for doc_id in best_ids if doc_id in candidates]
+
+        if self._mmr_lambda is not None and len(best_ids) > n_results:
+            selected = maximal_marginal_relevance(
+                # A pinned document may not have been a candidate at all.
+                np.array([fused_scores.get(doc_id, 1.0) for doc_id in best_ids]),
+                np.array([embeddings[doc_id] for doc_id in best_ids]),
+                n_results,
+                self._mmr_lambda,
+                num_pinned=int(best_ids[0] == pinned_id),
+            )
+            best_ids = [best_ids[i] for i in selected]
+
+        return [candidates[doc_id] for doc_id in best_ids[:n_results]]
+
+    def _embed_documents(
+        self,
+        ids: List[str],
+        documents: List[str],
+        sections: Dict[str, List[Tuple[int, int, int]]],
+    ) -> Tuple[List[List[float]], Optional[Dict[str, List[float]]]]:
+        """Embeds documents for retrieval, and their sections if need be.
+
+        Returns:
+            Tuple[List[List[float]], Optional[Dict[str, List[float]]]]: The
+                documents' embeddings, and with section retrieval, every
+                section's embedding keyed by section ID (None otherwise).
+        """
+        if self._section_store is None:
+            return self._embedder.embed(documents), None
+        # The lead section is the document's embedding too; see
+        # `_embed_sections`.
+        section_embeddings = self._embed_sections(ids, documents, sections)
+        embeddings = [
+            section_embeddings[f"{doc_id}{SECTION_ID_SEPARATOR}0"] for doc_id in ids
+        ]
+        return embeddings, section_embeddings
+
+    def _embed_sections(
+        self,
+        ids: List[str],
+        documents: List[str],
+        sections: Dict[str, List[Tuple[int, int, int]]],
+    ) -> Dict[str, List[float]]:
+        """Embeds every section of the documents, keyed by section ID.
+
+        Section 0, the lead, is what a document is embedded as for
+        retrieval, so the two are embedded (and cached) once.
+        """
+        section_ids, texts = [], []
+        for doc_id, document in zip(ids, documents):
+            for section_num, section in enumerate(sections[doc_id]):
+                section_ids.append(f"{doc_id}{SECTION_ID_SEPARATOR}{section_num}")
+                texts.append(
+                    truncate_to_token_limit(
+                        section_embedding_text(document, section),
+                        MAX_TOKENS_FOR_EMBEDDING,
+                    )
+                )
+        return dict(zip(section_ids, self._embedder.embed(texts)))
+
+    def _get_sections(
+        self, doc_id: str, text: str, metadata: Optional[Dict]
+    ) -> List[Tuple[int, int, int]]:
+        """Returns a document's sections, preferring those cached at load time."""
+        sections = sections_from_metadata(metadata)
+        if sections is None:
+            sections = self._sections_cache.get(doc_id)
+        if sections is None:
+            sections = split_sections(text, num_tokens_from_string)
+            self._sections_cache[doc_id] = sections
+        return sections
+
+
+def _format_llm_prompt(context: PackedContext, prompt: str) -> str:
+    return STREAMING_PROMPT_TEMPLATE.format(
+        context="\n\n".join(text for _, text in context.documents),
+        query=prompt,
+    )
+
+
+def _get_title(document: str) -> str:
+    """Returns the title of a summary (always its first line)."""
+    return document.split("\n", 1)[0]
+
+
+def _get_infobox(document: str) -> str:
+    """Returns the title and infobox rows at the top of a summary.
+
+    Summaries are written as "{title}\n\n{infobox}\n{content}", where every
+    infobox row is a single "Label: value" line.
+    """
+    lines = document.split("\n")
+    infobox_lines = []
+    for line in lines[2:]:
+        if ": " not in line:
+            break
+        infobox_lines.append(line)
+    if len(infobox_lines) == 0:
+        return ""
+    return lines[0] + "\n\n" + "\n".join(infobox_lines)
+
+
+def _min_max_normalize(scores: Dict[str, float]) -> Dict[str, float]:
+    if len(scores) == 0:
+        return {}
+    lo, hi = min(scores.values()), max(scores.values())
+    if hi == lo:
+        return {key: 1.0 for key in scores}
+    return {key: (score - lo) / (hi - lo) for key, score in scores.items()}
+
+
+def _fuse_scores(
+    vector_scores: Dict[str, float], bm25_scores: Dict[str, float], bm25_weight: float
+) -> Dict[str, float]:
+    """Linearly combines normalized vector and BM25 scores.
+
+    A document missing from one retriever's candidates scores 0 for it.
+    """
+    vector_scores = _min_max_normalize(vector_scores)
+    bm25_scores = _min_max_normalize(bm25_scores)
+    return {
+        doc_id: (1 - bm25_weight) * vector_scores.get(doc_id, 0.0)
+        + bm25_weight * bm25_scores.get(doc_id, 0.0)
+        for doc_id in vector_scores.keys() | bm25_scores.keys()
+    }
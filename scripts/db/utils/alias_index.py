@@ -0,0 +1,157 @@
+import json
+import os
+
+from typing import Callable, Dict, List, Optional
+from urllib.parse import unquote
+
+from utils.inverted_index import tokenize
+
+
+# Words that are never matched on their own. Some article titles are common
+# English words, and a prompt containing "what" or "the" shouldn't pin them.
+STOPWORDS = set(
+    [
+        "a",
+        "an",
+        "and",
+        "are",
+        "can",
+        "do",
+        "does",
+        "for",
+        "get",
+        "how",
+        "i",
+        "in",
+        "is",
+        "it",
+        "of",
+        "on",
+        "or",
+        "the",
+        "to",
+        "what",
+        "where",
+        "which",
+        "who",
+        "with",
+    ]
+)
+# A single-term name found within a longer prompt only pins its article if
+# the term is in at most this fraction of documents. Many titles are common
+# words ("Bones", "Coins", "Magic", "Attack", "Time") that appear all over the
+# wiki, and a prompt merely using one isn't about that article; rarer names
+# like "Zulrah" or "Vorkath" almost always are.
+MAX_SINGLE_TERM_DOCUMENT_FRACTION = 0.01
+
+
+def normalize_alias(alias: str) -> str:
+    """Normalizes a title, slug or "AKA" name for lookup.
+
+    Percent-encoding (e.g. "%27") is decoded, underscores become spaces, and
+    case and apostrophes are ignored; "Karil%27s_crossbow" and "karils
+    crossbow" normalize to the same key.
+    """
+    return " ".join(tokenize(unquote(alias).replace("_", " ")))
+
+
+class AliasIndex:
+    """An in-memory map of normalized article names to document IDs."""
+
+    def __init__(self) -> None:
+        self._aliases: Dict[str, str] = {}
+        self._max_alias_terms = 0
+
+    def __len__(self) -> int:
+        return len(self._aliases)
+
+    def add(self, alias: str, doc_id: str, overwrite: bool = True) -> None:
+        key = normalize_alias(alias)
+        if not key or (not overwrite and key in self._aliases):
+            return
+        self._aliases[key] = doc_id
+        self._max_alias_terms = max(self._max_alias_terms, key.count(" ") + 1)
+
+    def get(self, name: str) -> Optional[str]:
+        """Returns the document ID for an exact (normalized) name, if known."""
+        return self._aliases.get(normalize_alias(name))
+
+    def find(
+        self,
+        prompt: str,
+        document_fraction: Optional[Callable[[str], float]] = None,
+    ) -> Optional[str]:
+        """Finds the document for the longest article name within a prompt.
+
+        Every run of up to `_max_alias_terms` consecutive terms in the prompt is
+        looked up, longest runs first, so "abyssal bludgeon" wins over
+        "abyssal". Each lookup is at most two dictionary accesses.
+
+        Names of two or more terms match anywhere. A single-term name only
+        matches if it's the whole prompt (stopwords aside), or if
+        `document_fraction` shows the term is rare (see
+        `MAX_SINGLE_TERM_DOCUMENT_FRACTION`).
+
+        Args:
+            prompt (str): The player's prompt.
+            document_fraction (Optional[Callable[[str], float]]): Returns the
+                fraction of documents a term appears in. Without it,
+                single-term names only match whole prompts.
+        """
+        terms = tokenize(unquote(prompt))
+        num_content_terms = sum(term not in STOPWORDS for term in terms)
+        for length in range(min(self._max_alias_terms, len(terms)), 0, -1):
+            for start in range(len(terms) - length + 1):
+                window = terms[start : start + length]
+                if all(term in STOPWORDS for term in window):
+                    continue
+                if (
+                    length == 1
+                    and num_content_terms > 1
+                    and (
+                        document_fraction is None
+                        or document_fraction(window[0])
+                        > MAX_SINGLE_TERM_DOCUMENT_FRACTION
+                    )
+                ):
+                    continue
+                key = " ".join(window)
+                doc_id = self._aliases.get(key)
+                # Plurals and possessives ("bludgeon's" tokenizes to
+                # "bludgeons") get one more lookup without the trailing "s".
+                if doc_id is None and key.endswith("s"):
+                    doc_id = self._aliases.get(key[:-1])
+                if doc_id is not None:
+                    return doc_id
+        return None
+
+    @classmethod
+    def load(cls, path: str) -> "AliasIndex":
+        """Loads the aliases file written by the scraper.
+
+        Each line is a JSON object of the form
+        {"id": "<summary filename>", "aliases": ["<name>", ...]}. When a
+        document appears more than once (it was re-scraped), its last line
+        wins. A missing file yields an empty index.
+
+        The first alias of each record is the article's own title. Titles are
+        added before any other alias so that another article's "AKA" name can
+        never shadow a real title.
+        """
+        records: Dict[str, List[str]] = {}
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    record = json.loads(line)
+                    records[record["id"]] = record["aliases"]
+
+        index = cls()
+        for doc_id, aliases in records.items():
+            if aliases:
+                index.add(aliases[0], doc_id)
+        for doc_id, aliases in records.items():
+            for alias in aliases[1:]:
+                index.add(alias, doc_id, overwrite=False)
+        return index
@@ -0,0 +1,25 @@
+def connect(api_type: str, host: str, port: int):
+    """Connects to a ChromaDB server.
+
+    chromadb is imported here rather than at module level, as it pulls in a
+    large dependency tree; modules that only need it once a client is
+    created import quickly.
+
+    Args:
+        api_type (str): The type of API to use (e.g. 'rest').
+        host (str): The hostname of the database server.
+        port (int): The port number to connect to.
+
+    Returns:
+        chromadb.api.API: The client.
+    """
+    import chromadb
+    from chromadb.config import Settings
+
+    return chromadb.Client(
+        Settings(
+            chroma_api_impl=api_type,
+            chroma_server_host=host,
+            chroma_server_http_port=port,
+        )
+    )
@@ -0,0 +1,230 @@
+import json
+
+from typing import Callable, Dict, List, Optional, Tuple
+
+from utils.inverted_index import InvertedIndex
+from utils.tokens import num_tokens_from_string, truncate_to_token_limit
+
+
+# `get_content` writes every headline (h2, h3 and h4) as a block of its own,
+# i.e. a single line surrounded by blank lines. Blocks this short that don't
+# look like a sentence or an infobox/table row are treated as headlines.
+MAX_HEADLINE_LENGTH = 60
+NON_HEADLINE_ENDINGS = (".", ",", ":", ";", "!", "?", ")")
+# The lead section (title, infobox and intro) of a document is ranked as if it
+# scored this fraction of the best section score on top of its own score; it's
+# what most questions about an article need.
+LEAD_SECTION_BONUS = 0.5
+# Metadata key section boundaries and token counts are cached under.
+SECTIONS_METADATA_KEY = "sections"
+# Weight given to the (max-normalized) BM25 score of a section when fusing it
+# with its (min-max normalized) embedding similarity, if section embeddings
+# are given to `pack_context`.
+SECTION_BM25_WEIGHT = 0.3
+
+# A section as (start offset, end offset, token count) within its document.
+Section = Tuple[int, int, int]
+
+
+def _is_headline(block: str) -> bool:
+    return (
+        "\n" not in block
+        and len(block) <= MAX_HEADLINE_LENGTH
+        and ": " not in block
+        and not block.endswith(NON_HEADLINE_ENDINGS)
+    )
+
+
+def split_sections(document: str, count_tokens: Callable[[str], int]) -> List[Section]:
+    """Splits a summary into sections at the headlines `get_content` emits.
+
+    The first section is always the lead: the title, the infobox and anything
+    before the first headline.
+
+    Args:
+        document (str): The summary.
+        count_tokens (Callable[[str], int]): Returns the token count of a
+            string.
+
+    Returns:
+        List[Section]: (start, end, token count) for each section, in order.
+    """
+    starts = [0]
+    offset = 0
+    blocks = document.split("\n\n")
+    for i, block in enumerate(blocks):
+        # A headline is never the last block; something follows it.
+        if i > 0 and i < len(blocks) - 1 and _is_headline(block.strip()):
+            starts.append(offset)
+        offset += len(block) + 2
+
+    sections = []
+    for start, end in zip(starts, starts[1:] + [len(document)]):
+        sections.append((start, end, count_tokens(document[start:end])))
+    return sections
+
+
+def sections_to_metadata(sections: List[Section]) -> Dict[str, str]:
+    """Serializes sections for storage alongside a document in ChromaDB."""
+    return {SECTIONS_METADATA_KEY: json.dumps(sections, separators=(",", ":"))}
+
+
+def sections_from_metadata(metadata: Optional[Dict]) -> Optional[List[Section]]:
+    """Returns the sections cached by `sections_to_metadata`, if any."""
+    if not metadata or SECTIONS_METADATA_KEY not in metadata:
+        return None
+    return [tuple(section) for section in json.loads(metadata[SECTIONS_METADATA_KEY])]
+
+
+class PackedContext:
+    """The outcome of packing retrieved documents into a token budget."""
+
+    def __init__(
+        self,
+        documents: List[Tuple[str, str]],
+        num_tokens: int,
+        num_sections_used: int,
+        num_sections_total: int,
+    ) -> None:
+        # (document ID, packed text) pairs, in retrieval order. Documents with
+        # no section selected are omitted.
+        self.documents = documents
+        self.num_tokens = num_tokens
+        self.num_sections_used = num_sections_used
+        self.num_sections_total = num_sections_total
+
+
+def section_embedding_text(document: str, section: Section) -> str:
+    """Returns the text a section is embedded as.
+
+    The lead section (title, infobox and intro) stands for the whole
+    document. Other sections are prefixed with the document's title, as
+    e.g. a "Drops" section means little on its own.
+    """
+    start, end, _ = section
+    text = document[start:end].strip()
+    if start == 0:
+        return text
+    return document.split("\n", 1)[0] + "\n\n" + text
+
+
+def pack_context(
+    prompt: str,
+    documents: List[Tuple[str, str, List[Section]]],
+    token_budget: int,
+    section_scores: Optional[Dict[Tuple[int, int], float]] = None,
+    min_score_fraction: float = 0.0,
+) -> PackedContext:
+    """Selects the sections most relevant to a prompt within a token budget.
+
+    Sections from all documents are ranked together with BM25 against the
+    prompt (headlines weighted as titles) and greedily packed, best first, as
+    long as they fit. The best section is always packed, truncated to the
+    budget if it's longer, so that e.g. a long lead section doesn't drop its
+    whole document and the context is never empty. Each document is then
+    reassembled from its selected sections in their original order; a
+    document whose lead section wasn't selected keeps its title line so the
+    LLM knows what the sections are about.
+
+    Args:
+        prompt (str): The player's prompt.
+        documents (List[Tuple[str, str, List[Section]]]): (document ID, text,
+            sections) for each retrieved document, best first.
+        token_budget (int): The maximum number of context tokens.
+        section_scores (Optional[Dict[Tuple[int, int], float]]): The
+            similarity of (document number, section number) sections'
+            embeddings to the prompt's. If given, sections are ranked by it
+            fused with BM25 (see `SECTION_BM25_WEIGHT`); sections missing
+            from it score 0 for it.
+        min_score_fraction (float): Sections scoring less than this fraction
+            of the best section's score are left out even if they'd fit, so
+            that only relevant sections are sent to the LLM.
+
+    Returns:
+        PackedContext: The packed documents and accounting.
+    """
+    index = InvertedIndex()
+    for doc_num, (_, text, sections) in enumerate(documents):
+        for section_num, (start, end, _) in enumerate(sections):
+            section_text = text[start:end]
+            index.add(
+                f"{doc_num}:{section_num}", section_text.split("\n", 1)[0], section_text
+            )
+    num_sections_total = len(index)
+
+    bm25_scores = {}
+    for key, score in index.search(prompt, top_k=num_sections_total):
+        doc_num, section_num = key.split(":")
+        bm25_scores[int(doc_num), int(section_num)] = score
+    scores = bm25_scores
+    if section_scores is not None:
+        scores = _fuse_section_scores(section_scores, bm25_scores)
+    lead_bonus = LEAD_SECTION_BONUS * max(scores.values(), default=0.0)
+    ranked = []
+    for doc_num, (_, _, sections) in enumerate(documents):
+        for section_num in range(len(sections)):
+            score = scores.get((doc_num, section_num), 0.0)
+            if section_num == 0:
+                score += lead_bonus
+            # Ties (e.g. no term overlap at all) favor better-ranked documents
+            # and earlier sections.
+            ranked.append((-score, doc_num, section_num))
+    ranked.sort()
+
+    min_score = min_score_fraction * -ranked[0][0] if ranked else 0.0
+    selected = set()
+    # Text of sections truncated to fit, keyed like `selected`.
+    truncated = {}
+    num_tokens = 0
+    for negated_score, doc_num, section_num in ranked:
+        if -negated_score < min_score:
+            break
+        _, text, sections = documents[doc_num]
+        start, end, section_tokens = sections[section_num]
+        if num_tokens + section_tokens > token_budget:
+            if selected:
+                continue
+            section_text = truncate_to_token_limit(
+                text[start:end].strip(), token_budget
+            )
+            truncated[doc_num, section_num] = section_text
+            section_tokens = num_tokens_from_string(section_text)
+        selected.add((doc_num, section_num))
+        num_tokens += section_tokens
+
+    packed = []
+    for doc_num, (doc_id, text, sections) in enumerate(documents):
+        parts = [
+            truncated.get((doc_num, section_num), text[start:end].strip())
+            for section_num, (start, end, _) in enumerate(sections)
+            if (doc_num, section_num) in selected
+        ]
+        if len(parts) == 0:
+            continue
+        if (doc_num, 0) not in selected:
+            parts.insert(0, text.split("\n", 1)[0])
+        packed.append((doc_id, "\n\n".join(parts)))
+
+    return PackedContext(packed, num_tokens, len(selected), num_sections_total)
+
+
+def _fuse_section_scores(
+    embedding_scores: Dict[Tuple[int, int], float],
+    bm25_scores: Dict[Tuple[int, int], float],
+) -> Dict[Tuple[int, int], float]:
+    """Linearly combines sections' embedding similarity and BM25 scores.
+
+    BM25 scores are divided by the best one rather than min-max normalized,
+    so that a section sharing no terms with the prompt gets 0, not the
+    lowest score of those that do.
+    """
+    fused = {}
+    best_bm25 = max(bm25_scores.values(), default=0.0) or 1.0
+    if embedding_scores:
+        lo, hi = min(embedding_scores.values()), max(embedding_scores.values())
+        for key, score in embedding_scores.items():
+            normalized = (score - lo) / (hi - lo) if hi > lo else 1.0
+            fused[key] = (1 - SECTION_BM25_WEIGHT) * normalized
+    for key, score in bm25_scores.items():
+        fused[key] = fused.get(key, 0.0) + SECTION_BM25_WEIGHT * score / best_bm25
+    return fused
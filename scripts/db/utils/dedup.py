@@ -0,0 +1,139 @@
+import hashlib
+import numpy as np
+
+from collections import defaultdict
+from typing import Dict, List, Sequence, Set, Tuple
+
+from utils.inverted_index import tokenize
+
+
+# Summaries are compared as sets of overlapping runs of this many terms.
+SHINGLE_SIZE = 5
+# Summaries at least this similar (Jaccard similarity of their shingles) are
+# near-duplicates, e.g. an item's charged variants or a monster's level
+# variants.
+DEFAULT_DUPLICATE_THRESHOLD = 0.8
+# MinHash signatures of this length are split into `LSH_BANDS` bands; two
+# summaries become candidates if any band matches exactly. With 20 bands of 6
+# rows, pairs at 0.8 similarity become candidates 99.8% of the time and pairs
+# at 0.3 only 1.5%. Candidates are then checked exactly.
+NUM_PERMUTATIONS = 120
+LSH_BANDS = 20
+# Permutations are (a * x + b) mod `MINHASH_PRIME` over 32-bit shingle hashes,
+# which can't overflow 64 bits.
+MINHASH_PRIME = (1 << 31) - 1
+MINHASH_SEED = 0
+
+
+def shingle(text: str) -> Set[int]:
+    """Returns the hashes of a text's `SHINGLE_SIZE`-term shingles.
+
+    Hashes are stable across runs (unlike `hash`), so signatures are too.
+    """
+    terms = tokenize(text)
+    num_shingles = max(1, len(terms) - SHINGLE_SIZE + 1)
+    shingles = set()
+    for i in range(num_shingles):
+        key = " ".join(terms[i : i + SHINGLE_SIZE]).encode("utf-8")
+        digest = hashlib.blake2b(key, digest_size=4).digest()
+        shingles.add(int.from_bytes(digest, "little"))
+    return shingles
+
+
+def jaccard(a: Set[int], b: Set[int]) -> float:
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+class MinHasher:
+    """Computes MinHash signatures of shingle sets.
+
+    The fraction of positions at which two signatures agree estimates the
+    Jaccard similarity of their sets.
+    """
+
+    def __init__(
+        self, num_permutations: int = NUM_PERMUTATIONS, seed: int = MINHASH_SEED
+    ) -> None:
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, MINHASH_PRIME, num_permutations, dtype=np.uint64)
+        self._b = rng.integers(0, MINHASH_PRIME, num_permutations, dtype=np.uint64)
+
+    def signature(self, shingles: Set[int]) -> np.ndarray:
+        x = np.fromiter(shingles, dtype=np.uint64, count=len(shingles))
+        x %= np.uint64(MINHASH_PRIME)
+        hashes = (self._a[:, None] * x[None, :] + self._b[:, None]) % np.uint64(
+            MINHASH_PRIME
+        )
+        return hashes.min(axis=1)
+
+
+def find_near_duplicates(
+    documents: Sequence[Tuple[str, str]],
+    threshold: float = DEFAULT_DUPLICATE_THRESHOLD,
+) -> Dict[str, List[str]]:
+    """Clusters near-duplicate documents.
+
+    Candidate pairs are found by MinHash LSH, so only documents sharing a
+    signature band are ever compared, and kept if their exact shingle
+    similarity is at least `threshold`. Clusters are the connected
+    components of the kept pairs. Each cluster's canonical document is the
+    one with the shortest title (its first line), e.g. "Amulet of glory"
+    over "Amulet of glory(4)", then the smallest ID.
+
+    Args:
+        documents (Sequence[Tuple[str, str]]): (ID, text) pairs.
+        threshold (float): The Jaccard similarity above which documents are
+            near-duplicates.
+
+    Returns:
+        Dict[str, List[str]]: The IDs of each cluster's other documents,
+            keyed by its canonical document's ID. Documents with no
+            near-duplicates are left out.
+    """
+    hasher = MinHasher()
+    rows_per_band = NUM_PERMUTATIONS // LSH_BANDS
+    shingle_sets = [shingle(text) for _, text in documents]
+    buckets = defaultdict(list)
+    for i, shingles in enumerate(shingle_sets):
+        signature = hasher.signature(shingles)
+        for band in range(LSH_BANDS):
+            rows = signature[band * rows_per_band : (band + 1) * rows_per_band]
+            buckets[(band, rows.tobytes())].append(i)
+
+    parents = list(range(len(documents)))
+
+    def _find(i: int) -> int:
+        while parents[i] != i:
+            parents[i] = parents[parents[i]]
+            i = parents[i]
+        return i
+
+    compared = set()
+    for bucket in buckets.values():
+        for position, j in enumerate(bucket):
+            for i in bucket[:position]:
+                if (i, j) in compared or _find(i) == _find(j):
+                    continue
+                compared.add((i, j))
+                if jaccard(shingle_sets[i], shingle_sets[j]) >= threshold:
+                    parents[_find(j)] = _find(i)
+
+    clusters = defaultdict(list)
+    for i in range(len(documents)):
+        clusters[_find(i)].append(i)
+
+    duplicates = {}
+    for members in clusters.values():
+        if len(members) < 2:
+            continue
+        ids = sorted(
+            (len(_get_title(documents[i][1])), documents[i][0]) for i in members
+        )
+        duplicates[ids[0][1]] = [doc_id for _, doc_id in ids[1:]]
+    return duplicates
+
+
+def _get_title(text: str) -> str:
+    return text.split("\n", 1)[0]
@@ -0,0 +1,360 @@
+import abc
+import hashlib
+import math
+import numpy as np
+import random
+import sqlite3
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+from utils.tokens import num_tokens_from_string
+from utils.vector_store import FLOAT32, dequantize, quantize
+
+
+# A vector per embedded text.
+Embedding = List[float]
+
+OPENAI_EMBEDDING_MODEL = "text-embedding-ada-002"
+OPENAI_EMBEDDING_DIMENSIONS = 1536
+# OpenAI takes at most 2048 inputs per embedding request. Requests are also
+# kept well under its per-request token limit so that a corpus is spread over
+# enough requests to be embedded concurrently.
+OPENAI_MAX_BATCH_SIZE = 2048
+OPENAI_MAX_BATCH_TOKENS = 100_000
+# text-embedding-ada-002's default quotas.
+DEFAULT_TOKENS_PER_MINUTE = 1_000_000
+DEFAULT_REQUESTS_PER_MINUTE = 3_000
+DEFAULT_MAX_CONCURRENCY = 4
+# Rate limited requests are retried this many times, backing off
+# exponentially from `RETRY_BASE_SECONDS` (with jitter) unless the API says
+# how long to wait.
+MAX_RETRIES = 6
+RETRY_BASE_SECONDS = 1.0
+RETRY_MAX_SECONDS = 60.0
+
+
+class RateLimitError(Exception):
+    """Raised by a backend when its API rejects a request with a 429."""
+
+    def __init__(self, message: str, retry_after: Optional[float] = None) -> None:
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class EmbeddingBackend(abc.ABC):
+    """Turns texts into embeddings.
+
+    Subclasses implement `embed` for a single request's worth of texts; see
+    `EmbeddingScheduler` for batching, rate limiting and retries.
+    """
+
+    # Identifies the model; collections should only ever hold embeddings of
+    # one.
+    name = ""
+    dimensions = 0
+    max_batch_size = OPENAI_MAX_BATCH_SIZE
+    max_batch_tokens = OPENAI_MAX_BATCH_TOKENS
+
+    @abc.abstractmethod
+    def embed(self, texts: List[str]) -> List[Embedding]:
+        """Embeds a batch of texts in one request.
+
+        Raises:
+            RateLimitError: If the request was rate limited.
+        """
+
+
+class OpenAIEmbeddingBackend(EmbeddingBackend):
+    def __init__(self, api_key: str, model: str = OPENAI_EMBEDDING_MODEL) -> None:
+        self._api_key = api_key
+        self.name = f"openai/{model}"
+        self.dimensions = OPENAI_EMBEDDING_DIMENSIONS
+        self._model = model
+
+    def embed(self, texts: List[str]) -> List[Embedding]:
+        # Imported here so that the offline backends don't need the OpenAI
+        # client installed.
+        import openai
+
+        try:
+            response = openai.Embedding.create(
+                api_key=self._api_key, model=self._model, input=texts
+            )
+        except openai.error.RateLimitError as e:
+            retry_after = None
+            if e.headers and "retry-after" in e.headers:
+                retry_after = float(e.headers["retry-after"])
+            raise RateLimitError(str(e), retry_after) from e
+        data = sorted(response["data"], key=lambda d: d["index"])
+        return [d["embedding"] for d in data]
+
+
+class HashingEmbeddingBackend(EmbeddingBackend):
+    """A deterministic, offline backend hashing words into buckets.
+
+    Its embeddings carry no meaning beyond shared words, but they're free and
+    reproducible, so a full-corpus ingest can be run and benchmarked without
+    an API key.
+    """
+
+    def __init__(
+        self,
+        dimensions: int = OPENAI_EMBEDDING_DIMENSIONS,
+        latency_seconds: float = 0.0,
+    ) -> None:
+        """
+        Args:
+            dimensions (int): The length of each embedding.
+            latency_seconds (float): Simulated time each request takes, to
+                benchmark request scheduling as if against a remote API.
+        """
+        self.name = f"hashing/{dimensions}"
+        self.dimensions = dimensions
+        self._latency_seconds = latency_seconds
+
+    def embed(self, texts: List[str]) -> List[Embedding]:
+        if self._latency_seconds:
+            time.sleep(self._latency_seconds)
+        return [self._embed_one(text) for text in texts]
+
+    def _embed_one(self, text: str) -> Embedding:
+        vector = [0.0] * self.dimensions
+        for word in text.lower().split():
+            digest = hashlib.blake2b(word.encode("utf-8"), digest_size=8).digest()
+            bucket = int.from_bytes(digest[:4], "little") % self.dimensions
+            vector[bucket] += 1.0 if digest[4] & 1 else -1.0
+        norm = math.sqrt(sum(x * x for x in vector))
+        if norm == 0:
+            return vector
+        return [x / norm for x in vector]
+
+
+def batch_by_tokens(
+    token_counts: List[int], max_batch_tokens: int, max_batch_size: int
+) -> List[List[int]]:
+    """Groups texts, in order, into batches within a token and size budget.
+
+    A text over the token budget on its own gets a batch of its own.
+
+    Args:
+        token_counts (List[int]): Each text's token count.
+        max_batch_tokens (int): The most tokens a batch may hold.
+        max_batch_size (int): The most texts a batch may hold.
+
+    Returns:
+        List[List[int]]: The indices of each batch's texts.
+    """
+    batches, batch, batch_tokens = [], [], 0
+    for i, num_tokens in enumerate(token_counts):
+        if batch and (
+            batch_tokens + num_tokens > max_batch_tokens or len(batch) == max_batch_size
+        ):
+            batches.append(batch)
+            batch, batch_tokens = [], 0
+        batch.append(i)
+        batch_tokens += num_tokens
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+class RateBudget:
+    """A thread-safe token bucket refilled continuously over each minute.
+
+    `acquire` blocks until the amount is available. The bucket starts full, so
+    a burst of up to a minute's quota goes through at once.
+    """
+
+    def __init__(self, per_minute: float) -> None:
+        self._capacity = per_minute
+        self._available = per_minute
+        self._rate = per_minute / 60
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, amount: float) -> None:
+        # A request larger than the whole quota can only ever go through
+        # with a full bucket.
+        amount = min(amount, self._capacity)
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._available = min(
+                    self._capacity,
+                    self._available + (now - self._updated) * self._rate,
+                )
+                self._updated = now
+                if self._available >= amount:
+                    self._available -= amount
+                    return
+                wait = (amount - self._available) / self._rate
+            time.sleep(wait)
+
+
+class EmbeddingCache:
+    """A persistent cache of embeddings, keyed by model and text.
+
+    Re-loading or syncing a collection only pays for the documents whose text
+    changed. Embeddings can be stored at reduced precision (see
+    `vector_store.PRECISIONS`) to keep the cache small.
+    """
+
+    def __init__(self, path: str, precision: str = FLOAT32) -> None:
+        self._precision = precision
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "key TEXT PRIMARY KEY, precision TEXT NOT NULL, vector BLOB NOT NULL, "
+            "scale REAL)"
+        )
+
+    @staticmethod
+    def key(model: str, text: str) -> str:
+        return hashlib.sha256(f"{model}\n{text}".encode("utf-8")).hexdigest()
+
+    def get_many(self, keys: List[str]) -> Dict[str, Embedding]:
+        """Returns the cached embeddings of whichever keys are cached."""
+        found = {}
+        with self._lock:
+            for key in keys:
+                row = self._conn.execute(
+                    "SELECT precision, vector, scale FROM embeddings WHERE key = ?",
+                    (key,),
+                ).fetchone()
+                if row is None:
+                    continue
+                precision, blob, scale = row
+                codes = np.frombuffer(blob, dtype=precision)[None, :]
+                scales = None if scale is None else np.array([scale], np.float32)
+                found[key] = dequantize(codes, scales)[0].tolist()
+        return found
+
+    def put_many(self, keys: List[str], embeddings: List[Embedding]) -> None:
+        if len(keys) == 0:
+            return
+        codes, scales = quantize(
+            np.asarray(embeddings, dtype=np.float32), self._precision
+        )
+        rows = [
+            (
+                key,
+                self._precision,
+                codes[i].tobytes(),
+                None if scales is None else float(scales[i]),
+            )
+            for i, key in enumerate(keys)
+        ]
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?, ?)", rows
+            )
+
+    def close(self) -> None:
+        self._conn.close()
+
+
+class EmbeddingScheduler:
+    """Embeds any number of texts through a backend within its quotas.
+
+    Texts are batched by token budget, and batches are sent concurrently,
+    each only once both the tokens-per-minute and requests-per-minute budgets
+    allow it. Rate limited requests are retried with exponential backoff.
+    Texts already in the cache, if one is given, aren't sent at all.
+    """
+
+    def __init__(
+        self,
+        backend: EmbeddingBackend,
+        tokens_per_minute: float = DEFAULT_TOKENS_PER_MINUTE,
+        requests_per_minute: float = DEFAULT_REQUESTS_PER_MINUTE,
+        max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+        max_retries: int = MAX_RETRIES,
+        count_tokens: Callable[[str], int] = num_tokens_from_string,
+        cache: Optional[EmbeddingCache] = None,
+    ) -> None:
+        self.backend = backend
+        self._cache = cache
+        self._tokens = RateBudget(tokens_per_minute)
+        self._requests = RateBudget(requests_per_minute)
+        self._max_concurrency = max_concurrency
+        self._max_retries = max_retries
+        self._count_tokens = count_tokens
+        self._stats_lock = threading.Lock()
+        self.stats = {"requests": 0, "retries": 0, "tokens": 0, "cache_hits": 0}
+
+    def __call__(self, texts: List[str]) -> List[Embedding]:
+        """Makes the scheduler usable as a Chroma embedding function."""
+        return self.embed(texts)
+
+    def embed(self, texts: List[str]) -> List[Embedding]:
+        """Embeds texts, returning their embeddings in the same order."""
+        if self._cache is None:
+            return self._embed_uncached(texts)
+
+        keys = [EmbeddingCache.key(self.backend.name, text) for text in texts]
+        cached = self._cache.get_many(keys)
+        missing = [i for i, key in enumerate(keys) if key not in cached]
+        embedded = self._embed_uncached([texts[i] for i in missing])
+        self._cache.put_many([keys[i] for i in missing], embedded)
+        with self._stats_lock:
+            self.stats["cache_hits"] += len(texts) - len(missing)
+
+        embeddings = [cached.get(key) for key in keys]
+        for i, embedding in zip(missing, embedded):
+            embeddings[i] = embedding
+        return embeddings
+
+    def _embed_uncached(self, texts: List[str]) -> List[Embedding]:
+        if len(texts) == 0:
+            return []
+        token_counts = [self._count_tokens(text) for text in texts]
+        batches = batch_by_tokens(
+            token_counts, self.backend.max_batch_tokens, self.backend.max_batch_size
+        )
+
+        def _embed_batch(batch: List[int]) -> List[Embedding]:
+            return self._embed_with_retries(
+                [texts[i] for i in batch], sum(token_counts[i] for i in batch)
+            )
+
+        embeddings: List[Optional[Embedding]] = [None] * len(texts)
+        if len(batches) == 1 or self._max_concurrency == 1:
+            results = map(_embed_batch, batches)
+        else:
+            executor = ThreadPoolExecutor(
+                max_workers=min(self._max_concurrency, len(batches))
+            )
+            with executor:
+                results = list(executor.map(_embed_batch, batches))
+        for batch, batch_embeddings in zip(batches, results):
+            for i, embedding in zip(batch, batch_embeddings):
+                embeddings[i] = embedding
+        return embeddings
+
+    def _embed_with_retries(self, texts: List[str], num_tokens: int) -> List[Embedding]:
+        attempt = 0
+        while True:
+            self._tokens.acquire(num_tokens)
+            self._requests.acquire(1)
+            try:
+                embeddings = self.backend.embed(texts)
+            except RateLimitError as e:
+                if attempt >= self._max_retries:
+                    raise
+                wait = e.retry_after
+                if wait is None:
+                    wait = min(RETRY_MAX_SECONDS, RETRY_BASE_SECONDS * 2**attempt)
+                    wait *= random.uniform(0.5, 1.0)
+                attempt += 1
+                with self._stats_lock:
+                    self.stats["retries"] += 1
+                time.sleep(wait)
+                continue
+            with self._stats_lock:
+                self.stats["requests"] += 1
+                self.stats["tokens"] += num_tokens
+            return embeddings
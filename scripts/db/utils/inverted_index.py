@@ -0,0 +1,241 @@
+import gzip
+import heapq
+import json
+import math
+import os
+import re
+
+from collections import defaultdict
+from operator import itemgetter
+from typing import Dict, List, Optional, Tuple
+
+
+# Okapi BM25 parameters. These are the usual defaults; summaries vary a lot in
+# length (a few lines for an item, thousands of words for a guide), so length
+# normalisation (`BM25_B`) matters more than term saturation (`BM25_K1`).
+BM25_K1 = 1.2
+BM25_B = 0.75
+# Title terms are counted this many times over. Player questions almost always
+# name the item/NPC/quest they're about (e.g. "Abyssal bludgeon stats"), so a
+# title hit should outweigh the same word appearing somewhere in a drop table.
+TITLE_WEIGHT = 5
+INDEX_FORMAT_VERSION = 1
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text: str) -> List[str]:
+    """Splits text into lowercase alphanumeric terms.
+
+    Apostrophes are dropped rather than treated as separators such that
+    "Karil's" and "Karils" produce the same term.
+    """
+    return TOKEN_PATTERN.findall(text.lower().replace("'", ""))
+
+
+def normalize_title(title: str) -> str:
+    """Normalizes an article title for exact matching."""
+    return " ".join(tokenize(title))
+
+
+class InvertedIndex:
+    """A small, incrementally built BM25 index over document summaries.
+
+    Documents are referenced internally by their insertion position so that
+    postings can be stored as compact integer lists. Removing a document
+    leaves a hole at its position; holes are skipped when scoring. Each
+    document's terms are also kept (in memory only, rebuilt from the postings
+    on load) so a removal only touches that document's postings.
+    """
+
+    def __init__(self) -> None:
+        self._doc_ids: List[Optional[str]] = []
+        self._doc_lengths: List[int] = []
+        self._positions: Dict[str, int] = {}
+        # Maps term -> {document position: (title-weighted) term frequency}.
+        self._postings: Dict[str, Dict[int, int]] = defaultdict(dict)
+        # The forward index: each document position's terms and normalized
+        # title.
+        self._doc_terms: List[Optional[List[str]]] = []
+        self._doc_titles: List[Optional[str]] = []
+        # Maps normalized title -> document position.
+        self._titles: Dict[str, int] = {}
+        self._total_length = 0
+
+    def __len__(self) -> int:
+        return len(self._positions)
+
+    def __contains__(self, doc_id: str) -> bool:
+        return doc_id in self._positions
+
+    def add(self, doc_id: str, title: str, text: str) -> None:
+        """Adds (or replaces) a document in the index.
+
+        Args:
+            doc_id (str): The ID the document is stored under in ChromaDB.
+            title (str): The article title. Its terms are weighted by
+                `TITLE_WEIGHT`.
+            text (str): The full document content.
+        """
+        if doc_id in self._positions:
+            self.remove(doc_id)
+
+        term_frequencies = defaultdict(int)
+        for term in tokenize(text):
+            term_frequencies[term] += 1
+        title_terms = tokenize(title)
+        for term in title_terms:
+            term_frequencies[term] += TITLE_WEIGHT
+
+        position = len(self._doc_ids)
+        doc_length = sum(term_frequencies.values())
+        self._doc_ids.append(doc_id)
+        self._doc_lengths.append(doc_length)
+        self._doc_terms.append(list(term_frequencies))
+        self._doc_titles.append(" ".join(title_terms) if title_terms else None)
+        self._positions[doc_id] = position
+        self._total_length += doc_length
+        for term, frequency in term_frequencies.items():
+            self._postings[term][position] = frequency
+        if title_terms:
+            self._titles[" ".join(title_terms)] = position
+
+    def remove(self, doc_id: str) -> None:
+        """Removes a document from the index, if present."""
+        position = self._positions.pop(doc_id, None)
+        if position is None:
+            return
+
+        for term in self._doc_terms[position]:
+            postings = self._postings[term]
+            del postings[position]
+            if not postings:
+                del self._postings[term]
+        # The title may since have been taken over by another document.
+        title = self._doc_titles[position]
+        if title is not None and self._titles.get(title) == position:
+            del self._titles[title]
+
+        self._total_length -= self._doc_lengths[position]
+        self._doc_ids[position] = None
+        self._doc_lengths[position] = 0
+        self._doc_terms[position] = None
+        self._doc_titles[position] = None
+
+    def document_fraction(self, term: str) -> float:
+        """Returns the fraction of documents `term` (a single token) is in."""
+        if len(self._positions) == 0:
+            return 0.0
+        return len(self._postings.get(term, ())) / len(self._positions)
+
+    def match_title(self, text: str) -> Optional[str]:
+        """Returns the ID of the document whose title exactly matches `text`."""
+        position = self._titles.get(normalize_title(text))
+        if position is None:
+            return None
+        return self._doc_ids[position]
+
+    def search(self, query: str, top_k: int = 10) -> List[Tuple[str, float]]:
+        """Scores documents against a query using Okapi BM25.
+
+        Args:
+            query (str): The free-text query (usually the player's prompt).
+            top_k (int): The maximum number of results to return.
+
+        Returns:
+            List[Tuple[str, float]]: (document ID, score) pairs, best first.
+        """
+        num_docs = len(self._positions)
+        if num_docs == 0:
+            return []
+        avg_doc_length = self._total_length / num_docs
+
+        scores = defaultdict(float)
+        for term in set(tokenize(query)):
+            postings = self._postings.get(term)
+            if not postings:
+                continue
+            doc_frequency = len(postings)
+            idf = math.log(1 + (num_docs - doc_frequency + 0.5) / (doc_frequency + 0.5))
+            for position, frequency in postings.items():
+                length_norm = (
+                    1 - BM25_B + BM25_B * (self._doc_lengths[position] / avg_doc_length)
+                )
+                scores[position] += (
+                    idf
+                    * frequency
+                    * (BM25_K1 + 1)
+                    / (frequency + BM25_K1 * length_norm)
+                )
+
+        best = heapq.nlargest(top_k, scores.items(), key=itemgetter(1))
+        return [(self._doc_ids[position], score) for position, score in best]
+
+    def save(self, path: str) -> None:
+        """Persists the index as gzipped JSON.
+
+        Postings are written as flat [gap, frequency, gap, frequency, ...]
+        lists, where each gap is the difference from the previous document
+        position. This keeps the file small for common terms. The file is
+        written to a temporary path first and then moved into place, so a
+        crash mid-save never leaves a corrupt index behind.
+        """
+        postings = {}
+        for term, term_postings in self._postings.items():
+            encoded, previous = [], 0
+            for position in sorted(term_postings):
+                encoded.extend([position - previous, term_postings[position]])
+                previous = position
+            postings[term] = encoded
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        tmp_path = path + ".tmp"
+        with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "version": INDEX_FORMAT_VERSION,
+                    "doc_ids": self._doc_ids,
+                    "doc_lengths": self._doc_lengths,
+                    "titles": self._titles,
+                    "postings": postings,
+                },
+                f,
+                separators=(",", ":"),
+            )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "InvertedIndex":
+        """Loads an index written by `save`, or an empty one if none exists."""
+        index = cls()
+        if not os.path.exists(path):
+            return index
+
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("version") != INDEX_FORMAT_VERSION:
+            raise ValueError(f"Unsupported inverted index version in: {path}")
+
+        index._doc_ids = data["doc_ids"]
+        index._doc_lengths = data["doc_lengths"]
+        index._titles = data["titles"]
+        index._positions = {
+            doc_id: position
+            for position, doc_id in enumerate(index._doc_ids)
+            if doc_id is not None
+        }
+        index._total_length = sum(index._doc_lengths)
+        index._doc_terms = [
+            [] if doc_id is not None else None for doc_id in index._doc_ids
+        ]
+        index._doc_titles = [None] * len(index._doc_ids)
+        for title, position in index._titles.items():
+            index._doc_titles[position] = title
+        for term, encoded in data["postings"].items():
+            term_postings, position = {}, 0
+            for i in range(0, len(encoded), 2):
+                position += encoded[i]
+                term_postings[position] = encoded[i + 1]
+                index._doc_terms[position].append(term)
+            index._postings[term] = term_postings
+        return index
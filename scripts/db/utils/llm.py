@@ -0,0 +1,59 @@
+from typing import Iterator, List, Tuple
+
+
+# OpenAI chat constants
+CHAT_MODEL = "gpt-3.5-turbo"
+NUM_OUTPUTS = 256
+TEMPERATURE = 0.6
+
+# The LLM libraries (LlamaIndex, LangChain and OpenAI's client) are imported by
+# the functions using them rather than at module level. They pull in large
+# dependency trees that processes only loading or retrieving never need.
+
+
+def build_tree_index(documents: List[Tuple[str, str]]):
+    """Builds a LlamaIndex tree index over documents, answered by OpenAI's
+    chat model.
+
+    Args:
+        documents (List[Tuple[str, str]]): (ID, text) pairs.
+
+    Returns:
+        GPTTreeIndex: The index, to be queried with a prompt.
+    """
+    from gpt_index.indices.service_context import ServiceContext
+    from gpt_index.indices.tree.base import GPTTreeIndex
+    from gpt_index.langchain_helpers.chain_wrapper import LLMPredictor
+    from gpt_index.readers.schema.base import Document
+    from langchain.chat_models import ChatOpenAI
+
+    llm_predictor = LLMPredictor(
+        llm=ChatOpenAI(
+            temperature=TEMPERATURE,
+            model_name=CHAT_MODEL,
+            max_tokens=NUM_OUTPUTS,
+        )
+    )
+    service_context = ServiceContext.from_defaults(llm_predictor=llm_predictor)
+    return GPTTreeIndex.from_documents(
+        [Document(doc_id=doc_id, text=text) for doc_id, text in documents],
+        service_context=service_context,
+    )
+
+
+def stream_chat_completion(llm_prompt: str, openai_api_key: str) -> Iterator[str]:
+    """Streams an answer from OpenAI's chat model."""
+    import openai
+
+    response = openai.ChatCompletion.create(
+        api_key=openai_api_key,
+        model=CHAT_MODEL,
+        messages=[{"role": "user", "content": llm_prompt}],
+        temperature=TEMPERATURE,
+        max_tokens=NUM_OUTPUTS,
+        stream=True,
+    )
+    for chunk in response:
+        content = chunk["choices"][0]["delta"].get("content")
+        if content:
+            yield content
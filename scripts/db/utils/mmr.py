@@ -0,0 +1,63 @@
+import numpy as np
+
+from typing import List
+
+
+# How much relevance counts against similarity to what's already selected:
+# 1.0 ranks by relevance alone, 0.0 by novelty alone.
+DEFAULT_MMR_LAMBDA = 0.5
+
+
+def maximal_marginal_relevance(
+    relevance: np.ndarray,
+    embeddings: np.ndarray,
+    k: int,
+    lambda_mult: float = DEFAULT_MMR_LAMBDA,
+    num_pinned: int = 0,
+) -> List[int]:
+    """Selects `k` candidates that are relevant but unlike each other.
+
+    Candidates are picked greedily, each time the one maximizing
+    `lambda_mult * relevance - (1 - lambda_mult) * max similarity` to those
+    already picked. The similarities are computed once, as a single matrix
+    product, and each candidate's maximum similarity to the selection is
+    updated in place as candidates are picked.
+
+    Args:
+        relevance (np.ndarray): Each candidate's relevance to the prompt,
+            ideally in [0, 1] like the similarities.
+        embeddings (np.ndarray): Each candidate's embedding, one per row.
+        k (int): How many candidates to select.
+        lambda_mult (float): See `DEFAULT_MMR_LAMBDA`.
+        num_pinned (int): How many of the first candidates are selected
+            regardless, e.g. the article the prompt names.
+
+    Returns:
+        List[int]: The indices of the selected candidates, in selection order.
+    """
+    num_candidates = len(relevance)
+    k = min(k, num_candidates)
+    if k == 0:
+        return []
+    vectors = np.asarray(embeddings, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    vectors = vectors / np.where(norms == 0, 1.0, norms)
+    similarities = vectors @ vectors.T
+
+    relevance = lambda_mult * np.asarray(relevance, dtype=np.float32)
+    max_similarity = np.full(num_candidates, -np.inf, dtype=np.float32)
+    available = np.ones(num_candidates, dtype=bool)
+    selected = []
+    for step in range(k):
+        if step < num_pinned:
+            best = step
+        elif step == 0:
+            best = int(np.argmax(relevance))
+        else:
+            scores = relevance - (1 - lambda_mult) * max_similarity
+            scores[~available] = -np.inf
+            best = int(np.argmax(scores))
+        selected.append(best)
+        available[best] = False
+        np.maximum(max_similarity, similarities[best], out=max_similarity)
+    return selected
@@ -0,0 +1,238 @@
+import json
+import numpy as np
+import os
+import shutil
+
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+from utils.vector_store import FLOAT32, INT8, dequantize, quantize
+
+
+SNAPSHOT_FORMAT_VERSION = 1
+# Files a snapshot is made of, in its directory:
+#   - The manifest: the format version, collection, embedding model, the
+#     embeddings' precision and dimensions, and the number of documents.
+#   - The embeddings, one row per document, as a memory-mappable .npy array
+#     (plus each row's scale for int8).
+#   - The documents: a JSONL line per row, in the same order, with the ID,
+#     text and metadata.
+#   - The table store, near-duplicates and (with section retrieval) section
+#     vector store, copied as they are.
+MANIFEST_FILENAME = "manifest.json"
+EMBEDDINGS_FILENAME = "embeddings.npy"
+SCALES_FILENAME = "scales.npy"
+DOCUMENTS_FILENAME = "documents.jsonl"
+TABLES_FILENAME = "tables.sqlite3"
+DUPLICATES_FILENAME = "duplicates.json"
+SECTION_VECTORS_DIRNAME = "section_vectors"
+
+
+class SnapshotWriter:
+    """Writes a snapshot of a collection, a page of documents at a time.
+
+    The snapshot is written to a temporary directory next to `path` and moved
+    into place by `close`, so a snapshot that exists is always complete.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        collection_name: str,
+        embedding_model: str,
+        num_documents: int,
+        precision: str = FLOAT32,
+    ) -> None:
+        """
+        Args:
+            path (str): The directory to write the snapshot to. Replaced if it
+                already exists.
+            collection_name (str): The name of the collection snapshotted.
+            embedding_model (str): The model the embeddings are of (see
+                `EmbeddingBackend.name`).
+            num_documents (int): The number of documents that will be written.
+            precision (str): The precision embeddings are stored at (see
+                `vector_store.PRECISIONS`).
+        """
+        self.path = path
+        self.tmp_path = path + ".tmp"
+        shutil.rmtree(self.tmp_path, ignore_errors=True)
+        os.makedirs(self.tmp_path)
+        self._manifest = {
+            "version": SNAPSHOT_FORMAT_VERSION,
+            "collection": collection_name,
+            "embedding_model": embedding_model,
+            "precision": precision,
+            "dimensions": None,
+            "count": num_documents,
+        }
+        self._num_written = 0
+        # Created on the first write, once the embeddings' length is known.
+        self._codes: Optional[np.ndarray] = None
+        self._scales: Optional[np.ndarray] = None
+        self._documents = open(
+            os.path.join(self.tmp_path, DOCUMENTS_FILENAME), "w", encoding="utf-8"
+        )
+
+    def write(
+        self,
+        ids: Sequence[str],
+        documents: Sequence[str],
+        metadatas: Sequence[Optional[Dict]],
+        embeddings: Sequence[Sequence[float]],
+    ) -> None:
+        if len(ids) == 0:
+            return
+        if self._num_written + len(ids) > self._manifest["count"]:
+            raise ValueError("More documents written than the snapshot was sized for.")
+        codes, scales = quantize(
+            np.asarray(embeddings, dtype=np.float32), self._manifest["precision"]
+        )
+        if self._codes is None:
+            self._open_arrays(codes.dtype, codes.shape[1])
+
+        start, end = self._num_written, self._num_written + len(ids)
+        self._codes[start:end] = codes
+        if scales is not None:
+            self._scales[start:end] = scales
+        for doc_id, document, metadata in zip(ids, documents, metadatas):
+            self._documents.write(
+                json.dumps(
+                    {"id": doc_id, "document": document, "metadata": metadata},
+                    separators=(",", ":"),
+                )
+            )
+            self._documents.write("\n")
+        self._num_written = end
+
+    def close(self, duplicates: Optional[Dict] = None) -> None:
+        """Finishes the snapshot and moves it into place.
+
+        Args:
+            duplicates (Optional[Dict]): The collection's near-duplicates (see
+                `ChromaCollectionClient.load`).
+
+        Raises:
+            ValueError: If fewer documents were written than the snapshot was
+                sized for, e.g. because some were removed while exporting.
+        """
+        self._documents.close()
+        if self._num_written != self._manifest["count"]:
+            shutil.rmtree(self.tmp_path)
+            raise ValueError(
+                f"Expected {self._manifest['count']} documents, but "
+                f"{self._num_written} were written."
+            )
+        if self._codes is None:
+            self._open_arrays(np.float32, 0)
+        self._codes.flush()
+        if self._scales is not None:
+            self._scales.flush()
+        del self._codes, self._scales
+
+        with open(os.path.join(self.tmp_path, DUPLICATES_FILENAME), "w") as f:
+            json.dump(duplicates or {}, f)
+        with open(os.path.join(self.tmp_path, MANIFEST_FILENAME), "w") as f:
+            json.dump(self._manifest, f, indent=2)
+        shutil.rmtree(self.path, ignore_errors=True)
+        os.replace(self.tmp_path, self.path)
+
+    @property
+    def tables_path(self) -> str:
+        """Where the table store should be copied to before `close`."""
+        return os.path.join(self.tmp_path, TABLES_FILENAME)
+
+    @property
+    def section_vectors_path(self) -> str:
+        """Where the section vector store should be copied to before `close`."""
+        return os.path.join(self.tmp_path, SECTION_VECTORS_DIRNAME)
+
+    def _open_arrays(self, dtype: np.dtype, dimensions: int) -> None:
+        self._manifest["dimensions"] = dimensions
+        shape = (self._manifest["count"], dimensions)
+        self._codes = np.lib.format.open_memmap(
+            os.path.join(self.tmp_path, EMBEDDINGS_FILENAME),
+            mode="w+",
+            dtype=dtype,
+            shape=shape,
+        )
+        if self._manifest["precision"] == INT8:
+            self._scales = np.lib.format.open_memmap(
+                os.path.join(self.tmp_path, SCALES_FILENAME),
+                mode="w+",
+                dtype=np.float32,
+                shape=(shape[0],),
+            )
+
+
+class SnapshotReader:
+    """Reads a snapshot written by `SnapshotWriter`.
+
+    Embeddings are memory-mapped, so only the batch being read is ever
+    widened to float32 in memory.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        with open(os.path.join(path, MANIFEST_FILENAME)) as f:
+            self.manifest = json.load(f)
+        if self.manifest.get("version") != SNAPSHOT_FORMAT_VERSION:
+            raise ValueError(f"Unsupported snapshot version in: {path}")
+        self._codes = np.load(os.path.join(path, EMBEDDINGS_FILENAME), mmap_mode="r")
+        self._scales = None
+        if self.manifest["precision"] == INT8:
+            self._scales = np.load(os.path.join(path, SCALES_FILENAME), mmap_mode="r")
+
+    def __len__(self) -> int:
+        return self.manifest["count"]
+
+    @property
+    def embedding_model(self) -> str:
+        return self.manifest["embedding_model"]
+
+    @property
+    def tables_path(self) -> Optional[str]:
+        """The snapshotted table store, if there was one."""
+        path = os.path.join(self.path, TABLES_FILENAME)
+        return path if os.path.exists(path) else None
+
+    @property
+    def section_vectors_path(self) -> Optional[str]:
+        """The snapshotted section vector store, if there was one."""
+        path = os.path.join(self.path, SECTION_VECTORS_DIRNAME)
+        return path if os.path.exists(path) else None
+
+    def duplicates(self) -> Dict:
+        with open(os.path.join(self.path, DUPLICATES_FILENAME)) as f:
+            return json.load(f)
+
+    def embeddings(self, start: int = 0, end: Optional[int] = None) -> np.ndarray:
+        """Returns rows `start` to `end` of the embeddings as float32."""
+        scales = None if self._scales is None else self._scales[start:end]
+        return dequantize(self._codes[start:end], scales)
+
+    def batches(
+        self, batch_size: int
+    ) -> Iterator[Tuple[List[str], List[str], List[Optional[Dict]], np.ndarray]]:
+        """Yields the documents in batches.
+
+        Yields:
+            Tuple[List[str], List[str], List[Optional[Dict]], np.ndarray]: The
+                IDs, documents, metadatas and (float32) embeddings of each
+                batch.
+        """
+        ids, documents, metadatas = [], [], []
+        start = 0
+        with open(os.path.join(self.path, DOCUMENTS_FILENAME), encoding="utf-8") as f:
+            for line in f:
+                record = json.loads(line)
+                ids.append(record["id"])
+                documents.append(record["document"])
+                metadatas.append(record["metadata"])
+                if len(ids) == batch_size:
+                    yield ids, documents, metadatas, self.embeddings(
+                        start, start + len(ids)
+                    )
+                    start += len(ids)
+                    ids, documents, metadatas = [], [], []
+        if ids:
+            yield ids, documents, metadatas, self.embeddings(start, start + len(ids))
@@ -0,0 +1,315 @@
+import json
+import re
+import sqlite3
+import threading
+
+from typing import Dict, List, Optional, Tuple
+
+from utils.alias_index import normalize_alias
+
+
+# Kinds of lookup tables, as recorded in the sidecars by the wiki scraper
+# (see `classify_table` in wiki_tables.py, which also finds each table's
+# columns).
+DROPS = "drops"
+SHOPS = "shops"
+# Maximum number of rows a lookup answer lists.
+MAX_ANSWER_ROWS = 25
+# Lookup-style prompts and the lookup each is answered with, e.g. "what drops
+# dragon bones" finds the sources of an item. Matched against the prompt with
+# trailing punctuation removed; `name` is the item or source looked up.
+LOOKUP_PATTERNS = [
+    (
+        "sources",
+        re.compile(
+            r"^(?:what|which|who)(?: \w+)? drops? (?:an? |the )?(?P<name>.+)$", re.I
+        ),
+    ),
+    (
+        "sources",
+        re.compile(
+            r"^where (?:do|can) (?:i|you) (?:get|find|obtain) (?:an? |the )?"
+            r"(?P<name>.+)$",
+            re.I,
+        ),
+    ),
+    (
+        "shops",
+        re.compile(
+            r"^(?:where (?:do|can) (?:i|you) buy|where to buy|who sells|"
+            r"which shops? sells?) (?:an? |the )?(?P<name>.+)$",
+            re.I,
+        ),
+    ),
+    (
+        "drops",
+        re.compile(r"^what (?:does|do) (?:an? |the )?(?P<name>.+) drop$", re.I),
+    ),
+    (
+        "drops",
+        re.compile(r"^(?P<name>.+?) (?:drops|drop table|loot table)$", re.I),
+    ),
+]
+# Fractions like "2/1,024" or "~1/128" in the rarity column.
+RARITY_FRACTION_PATTERN = re.compile(r"([\d.,]+)\s*/\s*([\d.,]+)")
+# Rarity words the wiki uses instead of fractions, as probabilities. Rows are
+# ordered most common first.
+RARITY_WORDS = {
+    "always": 1.0,
+    "common": 1 / 16,
+    "uncommon": 1 / 64,
+    "rare": 1 / 512,
+    "very rare": 1 / 4096,
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS table_rows (
+    doc_id TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    subject TEXT NOT NULL,
+    section TEXT NOT NULL,
+    item TEXT NOT NULL,
+    item_key TEXT NOT NULL,
+    source TEXT NOT NULL,
+    source_key TEXT NOT NULL,
+    quantity TEXT,
+    rarity TEXT,
+    rarity_value REAL,
+    price TEXT,
+    cells TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS table_rows_item ON table_rows (item_key, kind);
+CREATE INDEX IF NOT EXISTS table_rows_source ON table_rows (source_key, kind);
+CREATE INDEX IF NOT EXISTS table_rows_rarity ON table_rows (rarity_value);
+CREATE INDEX IF NOT EXISTS table_rows_doc ON table_rows (doc_id);
+"""
+
+
+def parse_rarity(rarity: str) -> Optional[float]:
+    """Returns a rarity as a probability, e.g. 0.5 for "1/2" or "2/4".
+
+    Cells with several rarities (e.g. "1/128 / 1/64") take the first.
+    """
+    match = RARITY_FRACTION_PATTERN.search(rarity)
+    if match:
+        try:
+            numerator = float(match.group(1).replace(",", ""))
+            denominator = float(match.group(2).replace(",", ""))
+        except ValueError:
+            return None
+        return numerator / denominator if denominator else None
+    return RARITY_WORDS.get(rarity.strip().lower())
+
+
+def parse_lookup(prompt: str) -> Optional[Tuple[str, str]]:
+    """Recognizes a lookup-style prompt.
+
+    Returns:
+        Optional[Tuple[str, str]]: The lookup ("sources" of an item, "shops"
+            selling an item, or "drops" of a source) and the name looked up,
+            or None if the prompt isn't a lookup.
+    """
+    prompt = " ".join(prompt.strip().rstrip("?!.").split())
+    for lookup, pattern in LOOKUP_PATTERNS:
+        match = pattern.match(prompt)
+        if match:
+            return lookup, match.group("name")
+    return None
+
+
+class TableStore:
+    """A local SQLite store of drop and shop table rows.
+
+    Rows are read from the table sidecars the wiki scraper writes, indexed by
+    item, source (the monster, shop or activity the item comes from) and
+    rarity, so that questions like "what drops dragon bones" are answered
+    from the rows themselves rather than from retrieved summaries.
+    """
+
+    def __init__(self, path: str) -> None:
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.executescript(SCHEMA)
+
+    def close(self) -> None:
+        self._conn.close()
+
+    def backup(self, path: str) -> None:
+        """Copies the store to a new SQLite file at `path`."""
+        destination = sqlite3.connect(path)
+        with self._lock:
+            self._conn.backup(destination)
+        destination.close()
+
+    def restore(self, path: str) -> None:
+        """Replaces the store's rows with those of a copy made by `backup`."""
+        source = sqlite3.connect(path)
+        with self._lock:
+            source.backup(self._conn)
+        source.close()
+
+    def add(self, doc_id: str, title: str, tables: List[Dict]) -> int:
+        """Replaces a document's rows with those of its lookup tables.
+
+        Args:
+            doc_id (str): The ID of the document (summary) the tables are from.
+            title (str): The document's title.
+            tables (List[Dict]): The document's tables as stored in its
+                sidecar: "section", "headers", "rows" and "lookup" (the
+                table's kind, which column names its rows' items or sources
+                and which hold their quantities, rarities and prices; None if
+                it isn't a lookup table) each.
+
+        Returns:
+            int: The number of rows stored.
+        """
+        records = []
+        for table in tables:
+            lookup = table.get("lookup")
+            if lookup is None:
+                continue
+            kind, subject_column = lookup["kind"], lookup["column"]
+            headers = table["headers"]
+            quantity, rarity, price = (
+                lookup.get("quantity"),
+                lookup.get("rarity"),
+                lookup.get("price"),
+            )
+            for row in table["rows"]:
+                name = row[subject_column]
+                if not name:
+                    continue
+                if lookup["subject"] == "item":
+                    item, source = name, title
+                else:
+                    item, source = title, name
+                rarity_text = row[rarity] if rarity is not None else None
+                records.append(
+                    (
+                        doc_id,
+                        kind,
+                        lookup["subject"],
+                        table.get("section", ""),
+                        item,
+                        normalize_alias(item),
+                        source,
+                        normalize_alias(source),
+                        row[quantity] if quantity is not None else None,
+                        rarity_text,
+                        parse_rarity(rarity_text) if rarity_text else None,
+                        row[price] if price is not None else None,
+                        json.dumps(dict(zip(headers, row))),
+                    )
+                )
+
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM table_rows WHERE doc_id = ?", (doc_id,))
+            self._conn.executemany(
+                "INSERT INTO table_rows VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                records,
+            )
+        return len(records)
+
+    def remove(self, doc_ids: List[str]) -> None:
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "DELETE FROM table_rows WHERE doc_id = ?",
+                [(doc_id,) for doc_id in doc_ids],
+            )
+
+    def find_sources(self, item: str, kind: str = DROPS) -> List[Dict]:
+        """Returns the rows an item appears in, most common first."""
+        return self._select("item_key = ? AND kind = ?", (normalize_alias(item), kind))
+
+    def find_items(self, source: str, doc_id: Optional[str] = None) -> List[Dict]:
+        """Returns the items a source drops, most common first.
+
+        Rows are matched by the drop tables in the source's document if
+        given, and by the source's name otherwise.
+        """
+        if doc_id is not None:
+            rows = self._select(
+                "doc_id = ? AND kind = ? AND subject = 'item'", (doc_id, DROPS)
+            )
+            if rows:
+                return rows
+        return self._select(
+            "source_key = ? AND kind = ?", (normalize_alias(source), DROPS)
+        )
+
+    def answer(
+        self, kind: str, name: str, doc_id: Optional[str] = None
+    ) -> Optional[str]:
+        """Answers a lookup (see `parse_lookup`) from the stored rows.
+
+        Args:
+            kind (str): "sources", "shops" or "drops".
+            name (str): The item or source looked up.
+            doc_id (Optional[str]): The document `name` resolves to, if known;
+                "what does X drop" is answered from X's own drop tables.
+
+        Returns:
+            Optional[str]: The answer, or None if no rows match.
+        """
+        if kind == "drops":
+            rows = self.find_items(name, doc_id)
+        else:
+            table_kind = SHOPS if kind == "shops" else DROPS
+            rows = self.find_sources(name, table_kind)
+            if not rows and name.lower().endswith("s"):
+                # "what drops dragon bones" names the item "Dragon bones", but
+                # "what drops abyssal whips" doesn't name "Abyssal whip".
+                rows = self.find_sources(name[:-1], table_kind)
+        if not rows:
+            return None
+        return _format_rows(kind, rows)
+
+    def _select(self, where: str, params: Tuple) -> List[Dict]:
+        """Returns the matching rows, most common first and without repeats.
+
+        A drop is typically listed twice, in the monster's drop table and in
+        the item's sources; only one of them is returned.
+        """
+        with self._lock:
+            cursor = self._conn.execute(
+                "SELECT item, source, section, quantity, rarity, price "
+                f"FROM table_rows WHERE {where} "
+                "ORDER BY rarity_value IS NULL, rarity_value DESC, source, item",
+                params,
+            )
+            columns = [column[0] for column in cursor.description]
+            rows = [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+        unique_rows, seen = [], set()
+        for row in rows:
+            key = (
+                normalize_alias(row["item"]),
+                normalize_alias(row["source"]),
+                row["quantity"],
+                row["rarity"],
+            )
+            if key not in seen:
+                seen.add(key)
+                unique_rows.append(row)
+        return unique_rows
+
+
+def _format_rows(kind: str, rows: List[Dict]) -> str:
+    """Formats lookup rows as a compact table with the headers once."""
+    if kind == "drops":
+        title = f"{rows[0]['source']} drops"
+        columns = ["item", "quantity", "rarity", "price"]
+    elif kind == "shops":
+        title = f"Shops selling {rows[0]['item']}"
+        columns = ["source", "quantity", "price"]
+    else:
+        title = f"Sources of {rows[0]['item']}"
+        columns = ["source", "quantity", "rarity"]
+    columns = [c for c in columns if any(row[c] for row in rows)]
+
+    lines = [title, "", " | ".join(c.capitalize() for c in columns)]
+    for row in rows[:MAX_ANSWER_ROWS]:
+        lines.append(" | ".join(row[c] or "" for c in columns))
+    if len(rows) > MAX_ANSWER_ROWS:
+        lines.append(f"... and {len(rows) - MAX_ANSWER_ROWS} more")
+    return "\n".join(lines)
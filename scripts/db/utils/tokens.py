@@ -0,0 +1,56 @@
+# The encoding used by both the chat and embedding models.
+ENCODING_NAME = "cl100k_base"
+
+
+def get_encoding(encoding_name: str = ENCODING_NAME):
+    """Returns a tiktoken encoding.
+
+    tiktoken downloads an encoding the first time it's used and caches it in
+    `TIKTOKEN_CACHE_DIR` (by default, a directory under the system's temporary
+    directory). Offline, e.g. when running the benchmarks, the cache has to be
+    populated already: count tokens once with network access, or copy a
+    populated cache over and point `TIKTOKEN_CACHE_DIR` at it.
+
+    Raises:
+        RuntimeError: If the encoding isn't cached and can't be downloaded.
+    """
+    # Imported on first use, so that importing this module (and everything
+    # that counts tokens) stays cheap; later imports are a dictionary lookup.
+    import tiktoken
+
+    try:
+        return tiktoken.get_encoding(encoding_name)
+    except ValueError:
+        # An unknown encoding name.
+        raise
+    except Exception as e:
+        raise RuntimeError(
+            f"Couldn't load tiktoken's {encoding_name} encoding; if offline, set "
+            "TIKTOKEN_CACHE_DIR to a directory it's cached in (see `get_encoding`)."
+        ) from e
+
+
+def num_tokens_from_string(string: str, encoding_name: str = ENCODING_NAME) -> int:
+    """Returns the number of tokens in a text string."""
+    encoding = get_encoding(encoding_name)
+    num_tokens = len(encoding.encode(string))
+    return num_tokens
+
+
+def truncate_to_token_limit(
+    content: str, max_tokens: int, encoding_name: str = ENCODING_NAME
+) -> str:
+    """Truncates content from the end until it fits within `max_tokens`.
+
+    Truncation adheres to the Fibonacci sequence (i.e. first 1 word is cut,
+    then 2, then 3, then 5, then 8 and so on...).
+    """
+    # TODO(rbnsl): Is there a better way of doing this?
+    content_token_count = num_tokens_from_string(content, encoding_name)
+    f1, f2 = 0, 1
+    while content_token_count > max_tokens:
+        content = content.rsplit(" ", f2)[0]
+        f_tmp, f1 = f1, f2
+        f2 += f_tmp
+        content_token_count = num_tokens_from_string(content, encoding_name)
+    return content
@@ -0,0 +1,192 @@
+import threading
+import time
+
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+
+
+# USD per 1K tokens.
+CHAT_PRICE_PER_1K_TOKENS = 0.002
+EMBEDDING_PRICE_PER_1K_TOKENS = 0.0004
+# Quantiles reported by `HistogramSink.report`.
+QUANTILES = [0.5, 0.95, 0.99]
+# Only the most recent traces are kept for computing quantiles.
+MAX_TRACES = 10000
+
+
+class QueryTrace:
+    """Everything recorded while answering a single prompt.
+
+    Stage durations are in seconds. Tokens in are the tokens sent to OpenAI
+    (the embedded prompt and the LLM prompt); tokens out are the tokens of the
+    answer.
+    """
+
+    def __init__(self, prompt: str) -> None:
+        self.prompt = prompt
+        self.stages: Dict[str, float] = {}
+        self.doc_ids: List[str] = []
+        self.embedding_tokens = 0
+        self.llm_tokens_in = 0
+        self.llm_tokens_out = 0
+        self.ttft_seconds: Optional[float] = None
+        self.error: Optional[str] = None
+        self._start = time.perf_counter()
+        self.total_seconds = 0.0
+
+    @contextmanager
+    def span(self, stage: str) -> Iterator[None]:
+        """Times the enclosed block, adding it to `stage`'s duration."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[stage] = self.stages.get(stage, 0.0) + (
+                time.perf_counter() - start
+            )
+
+    def mark_first_token(self) -> None:
+        if self.ttft_seconds is None:
+            self.ttft_seconds = time.perf_counter() - self._start
+
+    @property
+    def tokens_in(self) -> int:
+        return self.embedding_tokens + self.llm_tokens_in
+
+    @property
+    def tokens_out(self) -> int:
+        return self.llm_tokens_out
+
+    @property
+    def cost(self) -> float:
+        """The estimated OpenAI cost of the query, in USD."""
+        return (
+            self.embedding_tokens * EMBEDDING_PRICE_PER_1K_TOKENS
+            + (self.llm_tokens_in + self.llm_tokens_out) * CHAT_PRICE_PER_1K_TOKENS
+        ) / 1000
+
+    def to_dict(self) -> Dict:
+        return {
+            "prompt": self.prompt,
+            "total_seconds": self.total_seconds,
+            "ttft_seconds": self.ttft_seconds,
+            "stages": self.stages,
+            "doc_ids": self.doc_ids,
+            "tokens_in": self.tokens_in,
+            "tokens_out": self.tokens_out,
+            "cost": self.cost,
+            "error": self.error,
+        }
+
+
+class LogSink:
+    """Prints a one-line breakdown of every finished trace."""
+
+    def record(self, trace: QueryTrace) -> None:
+        stages = ", ".join(
+            f"{stage} {seconds * 1000:.1f}ms" for stage, seconds in trace.stages.items()
+        )
+        print(
+            f"Answered in {trace.total_seconds * 1000:.1f}ms ({stages}); "
+            f"{trace.tokens_in} tokens in, {trace.tokens_out} out, "
+            f"${trace.cost:.5f}; documents: {trace.doc_ids}"
+            + (f"; failed: {trace.error}" if trace.error else "")
+        )
+
+
+class HistogramSink:
+    """Keeps recent traces in memory to report latency quantiles and cost."""
+
+    def __init__(self, max_traces: int = MAX_TRACES) -> None:
+        self._lock = threading.Lock()
+        self._max_traces = max_traces
+        self._traces: List[QueryTrace] = []
+
+    def record(self, trace: QueryTrace) -> None:
+        with self._lock:
+            self._traces.append(trace)
+            if len(self._traces) > self._max_traces:
+                del self._traces[0]
+
+    def quantile(self, quantile: float, stage: Optional[str] = None) -> float:
+        """Returns a quantile of the total (or a single stage's) seconds."""
+        with self._lock:
+            if stage is None:
+                values = sorted(t.total_seconds for t in self._traces)
+            else:
+                values = sorted(
+                    t.stages[stage] for t in self._traces if stage in t.stages
+                )
+        if len(values) == 0:
+            return 0.0
+        return values[min(len(values) - 1, int(len(values) * quantile))]
+
+    def cost_per_query(self) -> float:
+        with self._lock:
+            if len(self._traces) == 0:
+                return 0.0
+            return sum(t.cost for t in self._traces) / len(self._traces)
+
+    def stage_totals(self) -> Dict[str, float]:
+        totals: Dict[str, float] = {}
+        with self._lock:
+            for trace in self._traces:
+                for stage, seconds in trace.stages.items():
+                    totals[stage] = totals.get(stage, 0.0) + seconds
+        return totals
+
+    def dominant_stage(self) -> Optional[str]:
+        """Returns the stage that accounts for the most time overall."""
+        totals = self.stage_totals()
+        if len(totals) == 0:
+            return None
+        return max(totals, key=totals.get)
+
+    def report(self) -> str:
+        """Returns a human-readable latency and cost report."""
+        with self._lock:
+            num_traces = len(self._traces)
+        totals = self.stage_totals()
+        all_stages_total = sum(totals.values()) or 1.0
+
+        def _quantiles(stage: Optional[str] = None) -> str:
+            return ", ".join(
+                f"p{int(q * 100)} {self.quantile(q, stage) * 1000:.1f}ms"
+                for q in QUANTILES
+            )
+
+        lines = [
+            f"{num_traces} queries: {_quantiles()}",
+            f"Cost per query: ${self.cost_per_query():.5f}",
+            f"Dominant stage: {self.dominant_stage()}",
+        ]
+        for stage, total in totals.items():
+            lines.append(
+                f"  {stage:<12} {_quantiles(stage)} "
+                f"({100 * total / all_stages_total:4.1f}% of time)"
+            )
+        return "\n".join(lines)
+
+
+class Tracer:
+    """Creates query traces and hands finished ones to every sink.
+
+    Usage:
+        trace = tracer.start(prompt)
+        with trace.span("retrieve"):
+            ...
+        tracer.finish(trace)
+
+    A sink is anything with a `record(trace)` method.
+    """
+
+    def __init__(self, sinks: Optional[List] = None) -> None:
+        self.sinks = sinks if sinks is not None else [LogSink()]
+
+    def start(self, prompt: str) -> QueryTrace:
+        return QueryTrace(prompt)
+
+    def finish(self, trace: QueryTrace) -> None:
+        trace.total_seconds = time.perf_counter() - trace._start
+        for sink in self.sinks:
+            sink.record(trace)
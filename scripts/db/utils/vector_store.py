@@ -0,0 +1,301 @@
+import json
+import numpy as np
+import os
+
+from typing import Dict, List, Optional, Sequence, Tuple
+
+
+# How vectors are kept in memory:
+#   - "float32": as is; 6 KB per 1536-dimension embedding.
+#   - "float16": half precision; half the size, with negligible loss.
+#   - "int8": scalar quantized against each vector's largest component; a
+#     quarter of the size.
+FLOAT32 = "float32"
+FLOAT16 = "float16"
+INT8 = "int8"
+PRECISIONS = [FLOAT32, FLOAT16, INT8]
+INT8_MAX = 127
+# Files a store is saved as, in its directory.
+META_FILENAME = "meta.json"
+CODES_FILENAME = "codes.npy"
+SCALES_FILENAME = "scales.npy"
+PCA_FILENAME = "pca.npz"
+FULL_FILENAME = "full.npy"
+
+
+def quantize(
+    vectors: np.ndarray, precision: str
+) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    """Compresses float32 vectors (one per row) to `precision`.
+
+    Returns:
+        Tuple[np.ndarray, Optional[np.ndarray]]: The compressed vectors and,
+            for int8, each vector's scale (None otherwise).
+    """
+    if precision == FLOAT32:
+        return vectors.astype(np.float32), None
+    if precision == FLOAT16:
+        return vectors.astype(np.float16), None
+    if precision == INT8:
+        scales = np.abs(vectors).max(axis=1) / INT8_MAX
+        scales[scales == 0] = 1.0
+        codes = np.rint(vectors / scales[:, None]).astype(np.int8)
+        return codes, scales.astype(np.float32)
+    raise ValueError(f"Unknown precision: {precision}")
+
+
+def dequantize(codes: np.ndarray, scales: Optional[np.ndarray]) -> np.ndarray:
+    vectors = codes.astype(np.float32)
+    if scales is not None:
+        vectors *= scales[:, None]
+    return vectors
+
+
+class LocalVectorStore:
+    """An in-process nearest-neighbour index of document embeddings.
+
+    Vectors are held compressed in memory: optionally reduced to
+    `dimensions` by PCA fitted on the corpus, then stored at `precision`.
+    The float32 originals are kept on disk and memory-mapped, so that the
+    top `rescore_candidates` of a search can be rescored exactly without
+    holding them in memory.
+
+    Scores are dot products, i.e. cosine similarities for the normalized
+    embeddings OpenAI returns.
+    """
+
+    def __init__(
+        self,
+        precision: str = FLOAT32,
+        dimensions: Optional[int] = None,
+        rescore_candidates: int = 0,
+    ) -> None:
+        """
+        Args:
+            precision (str): How vectors are kept in memory (see
+                `PRECISIONS`).
+            dimensions (Optional[int]): If given, vectors are reduced to this
+                many dimensions by PCA.
+            rescore_candidates (int): How many of the best compressed
+                candidates are rescored against the float32 originals. No
+                rescoring if 0.
+        """
+        if precision not in PRECISIONS:
+            raise ValueError(f"Unknown precision: {precision}")
+        self.precision = precision
+        self.dimensions = dimensions
+        self.rescore_candidates = rescore_candidates
+        self._ids: List[str] = []
+        self._rows = {}
+        # float32 originals; memory-mapped once saved and loaded.
+        self._full = np.zeros((0, 0), dtype=np.float32)
+        # The compressed vectors, rebuilt from `_full` after any change.
+        self._codes: Optional[np.ndarray] = None
+        self._scales: Optional[np.ndarray] = None
+        self._pca_mean: Optional[np.ndarray] = None
+        self._pca_components: Optional[np.ndarray] = None
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    @property
+    def ids(self) -> List[str]:
+        return list(self._ids)
+
+    @property
+    def memory_bytes(self) -> int:
+        """The size of everything searches keep in memory."""
+        self._compress()
+        arrays = [self._codes, self._scales, self._pca_mean, self._pca_components]
+        return sum(array.nbytes for array in arrays if array is not None)
+
+    def add(self, ids: Sequence[str], embeddings: Sequence[Sequence[float]]) -> None:
+        """Adds vectors, replacing any already stored under the same IDs.
+
+        An ID given more than once is stored once, with its last vector.
+        """
+        if len(ids) == 0:
+            return
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        last_rows = {doc_id: row for row, doc_id in enumerate(ids)}
+        if len(last_rows) < len(ids):
+            rows = sorted(last_rows.values())
+            ids = [ids[row] for row in rows]
+            vectors = vectors[rows]
+        self.remove([doc_id for doc_id in ids if doc_id in self._rows])
+        if len(self._ids) == 0:
+            self._full = vectors
+        else:
+            self._full = np.concatenate([self._full, vectors])
+        for doc_id in ids:
+            self._rows[doc_id] = len(self._ids)
+            self._ids.append(doc_id)
+        self._codes = None
+
+    def remove(self, ids: Sequence[str]) -> None:
+        rows = [self._rows[doc_id] for doc_id in ids if doc_id in self._rows]
+        if len(rows) == 0:
+            return
+        keep = np.ones(len(self._ids), dtype=bool)
+        keep[rows] = False
+        self._full = self._full[keep]
+        self._ids = [doc_id for doc_id, kept in zip(self._ids, keep) if kept]
+        self._rows = {doc_id: row for row, doc_id in enumerate(self._ids)}
+        self._codes = None
+
+    def search(self, query: Sequence[float], k: int) -> List[Tuple[str, float]]:
+        """Returns the IDs and scores of the `k` nearest vectors, best first."""
+        if len(self._ids) == 0:
+            return []
+        self._compress()
+        query = np.asarray(query, dtype=np.float32)
+        num_candidates = min(len(self._ids), max(k, self.rescore_candidates))
+
+        # With PCA, x.q is approximated by the projections of x - mean and q;
+        # the mean's share (mean.q) is the same for every x, so it's added
+        # back once.
+        projected_query, offset = query, 0.0
+        if self._pca_components is not None:
+            projected_query = query @ self._pca_components
+            offset = float(self._pca_mean @ query)
+
+        scores = self._score_codes(projected_query)
+        scores += offset
+
+        candidates = np.argpartition(-scores, num_candidates - 1)[:num_candidates]
+        if self.rescore_candidates and self._is_compressed():
+            candidates = np.sort(candidates)
+            scores[candidates] = self._full[candidates] @ query
+        best = candidates[np.argsort(-scores[candidates])][:k]
+        return [(self._ids[row], float(scores[row])) for row in best]
+
+    def score(self, query: Sequence[float], ids: Sequence[str]) -> Dict[str, float]:
+        """Scores only the given vectors (those stored), exactly.
+
+        Only their float32 originals are read, so this costs a few dot
+        products however large the store is.
+        """
+        stored = [doc_id for doc_id in ids if doc_id in self._rows]
+        if len(stored) == 0:
+            return {}
+        rows = np.array([self._rows[doc_id] for doc_id in stored])
+        order = np.argsort(rows)
+        vectors = np.asarray(self._full[rows[order]], dtype=np.float32)
+        scores = vectors @ np.asarray(query, dtype=np.float32)
+        return {stored[i]: float(score) for i, score in zip(order, scores)}
+
+    def save(self, path: str) -> None:
+        """Saves the store to the directory `path`."""
+        self._compress()
+        os.makedirs(path, exist_ok=True)
+        # Written under a new name first, as `_full` may be a memory map of
+        # the file being replaced.
+        full_path = os.path.join(path, FULL_FILENAME)
+        with open(full_path + ".tmp", "wb") as f:
+            np.save(f, self._full)
+        os.replace(full_path + ".tmp", full_path)
+        np.save(os.path.join(path, CODES_FILENAME), self._codes)
+        if self._scales is not None:
+            np.save(os.path.join(path, SCALES_FILENAME), self._scales)
+        if self._pca_components is not None:
+            np.savez(
+                os.path.join(path, PCA_FILENAME),
+                mean=self._pca_mean,
+                components=self._pca_components,
+            )
+        with open(os.path.join(path, META_FILENAME), "w") as f:
+            json.dump(
+                {
+                    "precision": self.precision,
+                    "dimensions": self.dimensions,
+                    "ids": self._ids,
+                },
+                f,
+            )
+        self._full = np.load(full_path, mmap_mode="r")
+
+    @classmethod
+    def load(
+        cls,
+        path: str,
+        precision: str = FLOAT32,
+        dimensions: Optional[int] = None,
+        rescore_candidates: int = 0,
+    ) -> "LocalVectorStore":
+        """Loads a store saved to `path`, or returns an empty one.
+
+        If the store was saved with a different precision or dimensions, it's
+        recompressed from the saved float32 originals.
+        """
+        store = cls(precision, dimensions, rescore_candidates)
+        try:
+            with open(os.path.join(path, META_FILENAME)) as f:
+                meta = json.load(f)
+        except FileNotFoundError:
+            return store
+
+        store._ids = meta["ids"]
+        store._rows = {doc_id: row for row, doc_id in enumerate(store._ids)}
+        store._full = np.load(os.path.join(path, FULL_FILENAME), mmap_mode="r")
+        if meta["precision"] != precision or meta["dimensions"] != dimensions:
+            return store
+
+        store._codes = np.load(os.path.join(path, CODES_FILENAME))
+        if precision == INT8:
+            store._scales = np.load(os.path.join(path, SCALES_FILENAME))
+        if dimensions is not None:
+            pca = np.load(os.path.join(path, PCA_FILENAME))
+            store._pca_mean = pca["mean"]
+            store._pca_components = pca["components"]
+        return store
+
+    def _score_codes(self, query: np.ndarray) -> np.ndarray:
+        """Scores every compressed vector against a (projected) query.
+
+        Compressed vectors aren't widened to float32 first, which would cost
+        more than the dot products themselves. float16 vectors are multiplied
+        as they are, accumulating in float32. For int8 vectors, the query is
+        quantized too, so scores are integer dot products (accumulated in
+        int32, which 127 * 127 * dimensions fits in) times both scales.
+        Either is still several times slower than float32, for which numpy
+        uses BLAS; see benchmarks/vector_store_benchmark.py.
+        """
+        if self.precision == FLOAT32:
+            return self._codes @ query
+        if self.precision == FLOAT16:
+            return np.einsum("ij,j->i", self._codes, query, dtype=np.float32)
+        query_codes, query_scales = quantize(query[None, :], INT8)
+        scores = np.einsum("ij,j->i", self._codes, query_codes[0], dtype=np.int32)
+        return scores.astype(np.float32) * (self._scales * query_scales[0])
+
+    def _is_compressed(self) -> bool:
+        return self.precision != FLOAT32 or self._pca_components is not None
+
+    def _compress(self) -> None:
+        """Rebuilds the compressed vectors from the float32 originals."""
+        if self._codes is not None:
+            return
+        vectors = np.asarray(self._full, dtype=np.float32)
+        self._pca_mean = self._pca_components = None
+        if self.dimensions is not None and len(vectors) > 0:
+            self._pca_mean, self._pca_components = fit_pca(vectors, self.dimensions)
+            vectors = (vectors - self._pca_mean) @ self._pca_components
+        self._codes, self._scales = quantize(vectors, self.precision)
+
+
+def fit_pca(vectors: np.ndarray, dimensions: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Fits PCA to vectors (one per row).
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: The vectors' mean, and the top
+            `dimensions` principal components as the columns of a
+            (vector length, dimensions) matrix.
+    """
+    mean = vectors.mean(axis=0)
+    # The eigenvectors of the covariance matrix are the principal components;
+    # it's only (vector length)^2, however many vectors there are.
+    centered = vectors - mean
+    covariance = centered.T @ centered
+    eigenvalues, eigenvectors = np.linalg.eigh(covariance)
+    top = np.argsort(eigenvalues)[::-1][:dimensions]
+    return mean.astype(np.float32), eigenvectors[:, top].astype(np.float32)
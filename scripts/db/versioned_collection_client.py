@@ -0,0 +1,294 @@
+import json
+import os
+import re
+import shutil
+import threading
+import time
+
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from chroma_collection_client import ChromaCollectionClient
+from utils.chroma import connect
+
+
+# The alias file of collection `<name>` is `<name>.alias.json` in the index
+# root, holding the "current" version's collection name and every "versions"
+# ever built.
+ALIAS_FILE_EXTENSION = ".alias.json"
+# Versioned collections are named `<name>_v<N>`.
+VERSION_SEPARATOR = "_v"
+# Versions kept after a rebuild: the current one, and the one it replaced so
+# that processes still serving it keep working until they notice the swap.
+DEFAULT_KEEP_VERSIONS = 2
+# How often a client checks whether its alias was repointed.
+ALIAS_CHECK_INTERVAL_SECONDS = 1.0
+# A rebuilt version must hold at least this fraction of the documents the
+# current version does, catching loads that failed partway.
+MIN_DOCUMENT_FRACTION = 0.95
+
+
+class ValidationError(Exception):
+    """Raised when a rebuilt collection version fails validation."""
+
+
+class VersionedCollectionClient:
+    """Serves queries from whichever version of a collection is current.
+
+    A collection `<name>` is rebuilt (see `rebuild`) into a new collection
+    `<name>_v<N>` with its own local indices, while queries keep being
+    answered from the current version. Once the new version is loaded and
+    validated, the alias file is atomically repointed at it, so that an
+    index refresh never takes queries offline. Every client of the alias,
+    in any process, picks up the new version within
+    `ALIAS_CHECK_INTERVAL_SECONDS`; queries already in flight finish on
+    the old one.
+
+    Until the first rebuild there's no alias file, and the unversioned
+    collection `<name>` is served as before. It's then garbage-collected
+    like any other old version.
+    """
+
+    def __init__(
+        self,
+        api_type: str,
+        host: str,
+        port: int,
+        openai_api_key: str,
+        collection_name: str,
+        index_root: Optional[str] = None,
+        keep_versions: int = DEFAULT_KEEP_VERSIONS,
+        **client_kwargs,
+    ) -> None:
+        """
+        Args:
+            api_type (str): The type of API to use when connecting to ChromaDB
+                (e.g. 'rest').
+            host (str): The hostname of the database server to connect to.
+            port (int): The port number to connect to.
+            openai_api_key (str): The OpenAI API key to use.
+            collection_name (str): The alias the collection's versions are
+                served under.
+            index_root (Optional[str]): The directory the alias file and each
+                version's local indices (in a directory named after the
+                version) are stored in. Defaults to `index` at the root of
+                the project.
+            keep_versions (int): How many versions, the current one included,
+                are kept after a rebuild. Older ones are deleted.
+            **client_kwargs: Passed on to each version's
+                `ChromaCollectionClient`, except `index_dir`. Embeddings are
+                cached across versions if `embedding_cache_precision` is
+                given, so a rebuild only embeds changed documents.
+        """
+        self._client_args = (api_type, host, port, openai_api_key)
+        self._client_kwargs = client_kwargs
+        self._chroma = connect(api_type, host, port)
+        self._name = collection_name
+        if index_root is None:
+            current_dir = os.path.dirname(os.path.abspath(__file__))
+            index_root = os.path.join(current_dir, "..", "..", "index")
+        self._index_root = index_root
+        self._alias_path = os.path.join(
+            index_root, collection_name + ALIAS_FILE_EXTENSION
+        )
+        self._client_kwargs.setdefault(
+            "embedding_cache_path",
+            os.path.join(index_root, f"{collection_name}_embedding_cache.sqlite3"),
+        )
+        self._keep_versions = keep_versions
+        # Guards switching versions, so that concurrent queries noticing a
+        # swap open the new version once.
+        self._lock = threading.Lock()
+        self._alias_mtime = None
+        self._alias_checked = 0.0
+        self._version, self._client = None, None
+        self._current_client()
+
+    @property
+    def version(self) -> str:
+        """The name of the collection currently served."""
+        return self._version
+
+    def query(self, prompt: str, n_results: int = 3) -> str:
+        return self._current_client().query(prompt, n_results)
+
+    def stream_query(self, prompt: str, n_results: int = 3) -> Iterator[str]:
+        # The version is resolved once, so a swap mid-answer doesn't switch
+        # collections under it.
+        return self._current_client().stream_query(prompt, n_results)
+
+    def search(self, prompt: str, n_results: int = 3) -> List[str]:
+        return self._current_client().search(prompt, n_results)
+
+    def rebuild(
+        self,
+        summaries: List[Tuple[str, str]],
+        tables: Optional[List[Dict]] = None,
+        sample_prompts: Sequence[str] = (),
+    ) -> str:
+        """Builds, validates and switches to a new version of the collection.
+
+        Queries are served from the current version throughout. If building
+        the new version fails, or it fails validation, it's deleted and the
+        current version stays.
+
+        Args:
+            summaries (List[Tuple[str, str]]): Filename and content pairs of
+                every summary (see `ChromaCollectionClient.load`).
+            tables (Optional[List[Dict]]): Every table sidecar (see
+                `ChromaCollectionClient.load_tables`).
+            sample_prompts (Sequence[str]): Prompts that must each retrieve
+                at least one document from the new version.
+
+        Returns:
+            str: The new version's collection name.
+
+        Raises:
+            ValidationError: If the new version has too few documents, or a
+                sample prompt retrieves nothing.
+        """
+
+        def _populate(client: ChromaCollectionClient) -> None:
+            client.load(summaries)
+            if tables:
+                client.load_tables(tables)
+
+        return self._build(_populate, sample_prompts)
+
+    def restore(self, snapshot_path: str, sample_prompts: Sequence[str] = ()) -> str:
+        """Builds a new version from a snapshot instead of embedding the corpus.
+
+        This is how a new query node is brought up without calling the
+        embedding API. Otherwise the same as `rebuild`; see
+        `ChromaCollectionClient.export_snapshot`.
+        """
+        return self._build(
+            lambda client: client.import_snapshot(snapshot_path), sample_prompts
+        )
+
+    def _build(
+        self,
+        populate: Callable[[ChromaCollectionClient], None],
+        sample_prompts: Sequence[str],
+    ) -> str:
+        """Populates, validates and switches to a new version."""
+        record = self._read_alias()
+        versions = record["versions"]
+        number = 1 + max((self._version_number(v) for v in versions), default=0)
+        version = f"{self._name}{VERSION_SEPARATOR}{number}"
+        # Recorded before loading, so that a build that dies partway is still
+        # garbage-collected.
+        self._write_alias(record["current"], versions + [version])
+
+        start = time.perf_counter()
+        print(f"Building {version}...")
+        try:
+            client = self._open(version)
+            populate(client)
+            self._validate(client, sample_prompts)
+        except Exception:
+            # Whether loading failed or the result didn't validate, the
+            # current version keeps serving and the new one is discarded.
+            self._delete(version)
+            self._write_alias(record["current"], versions)
+            raise
+
+        self._write_alias(version, versions + [version])
+        with self._lock:
+            self._version, self._client = version, client
+        print(f"Switched to {version} in {time.perf_counter() - start:.1f}s.")
+        self.collect_garbage()
+        return version
+
+    def collect_garbage(self) -> List[str]:
+        """Deletes all but the newest `keep_versions` versions.
+
+        The current version is never deleted, even if it isn't the newest.
+
+        Returns:
+            List[str]: The versions deleted.
+        """
+        record = self._read_alias()
+        versions = sorted(record["versions"], key=self._version_number)
+        kept = versions[-self._keep_versions :]
+        deleted = [v for v in versions if v not in kept and v != record["current"]]
+        for version in deleted:
+            self._delete(version)
+        self._write_alias(record["current"], [v for v in versions if v not in deleted])
+        if deleted:
+            print(f"Deleted {', '.join(deleted)}.")
+        return deleted
+
+    def _validate(
+        self, client: ChromaCollectionClient, sample_prompts: Sequence[str]
+    ) -> None:
+        count = client.count()
+        if count == 0:
+            raise ValidationError("The new version has no documents.")
+        current_count = self._client.count()
+        if count < current_count * MIN_DOCUMENT_FRACTION:
+            raise ValidationError(
+                f"The new version has {count} documents; the current one has "
+                f"{current_count}."
+            )
+        for prompt in sample_prompts:
+            if not client.search(prompt):
+                raise ValidationError(f'"{prompt}" retrieved no documents.')
+
+    def _current_client(self) -> ChromaCollectionClient:
+        """Returns the current version's client, switching if it changed."""
+        now = time.monotonic()
+        if self._client is not None and now - self._alias_checked < (
+            ALIAS_CHECK_INTERVAL_SECONDS
+        ):
+            return self._client
+        with self._lock:
+            self._alias_checked = now
+            try:
+                mtime = os.stat(self._alias_path).st_mtime_ns
+            except FileNotFoundError:
+                mtime = None
+            if self._client is None or mtime != self._alias_mtime:
+                self._alias_mtime = mtime
+                version = self._read_alias()["current"]
+                if version != self._version:
+                    self._client = self._open(version)
+                    self._version = version
+            return self._client
+
+    def _open(self, version: str) -> ChromaCollectionClient:
+        return ChromaCollectionClient(
+            *self._client_args,
+            version,
+            index_dir=os.path.join(self._index_root, version),
+            **self._client_kwargs,
+        )
+
+    def _delete(self, version: str) -> None:
+        try:
+            self._chroma.delete_collection(name=version)
+        except ValueError:
+            # It was never created, e.g. its build died early.
+            pass
+        shutil.rmtree(os.path.join(self._index_root, version), ignore_errors=True)
+
+    def _read_alias(self) -> Dict:
+        try:
+            with open(self._alias_path, encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {"current": self._name, "versions": [self._name]}
+
+    def _write_alias(self, current: str, versions: List[str]) -> None:
+        """Rewrites the alias file atomically; readers see the old or new one."""
+        os.makedirs(self._index_root, exist_ok=True)
+        tmp_path = self._alias_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"current": current, "versions": versions}, f)
+        os.replace(tmp_path, self._alias_path)
+
+    def _version_number(self, version: str) -> int:
+        """Returns N of `<name>_v<N>`, or 0 for the unversioned collection."""
+        match = re.fullmatch(
+            re.escape(self._name + VERSION_SEPARATOR) + r"(\d+)", version
+        )
+        return int(match.group(1)) if match else 0
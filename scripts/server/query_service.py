@@ -0,0 +1,389 @@
+import argparse
+import copy
+import json
+import os
+import sys
+import threading
+import time
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterator, List, Optional, Tuple
+
+
+QUERY_PATH = "/api/v1/query"
+STREAM_PATH = "/api/v1/query/stream"
+METRICS_PATH = "/metrics"
+# Quantiles reported for every latency metric.
+QUANTILES = [0.5, 0.95, 0.99]
+# Only the most recent observations are kept for computing quantiles.
+MAX_OBSERVATIONS = 10000
+UNKNOWN_ERROR_MESSAGE = "An unknown error occurred. Please try again in 1 minute."
+# Connections the server's socket queues before it accepts them. The default
+# of 5 resets connections during bursts of players asking at once.
+REQUEST_QUEUE_SIZE = 128
+
+
+class QueryMetrics:
+    """Thread-safe latency metrics for the query service.
+
+    Time-to-first-token (TTFT) is recorded for streamed answers; total latency
+    is recorded for every answer. "executions" counts the answers actually
+    generated, and "coalesced" the requests answered by another request's
+    execution instead (see `CoalescingAnswerer`).
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._observations: Dict[str, List[float]] = {
+            "ttft_seconds": [],
+            "latency_seconds": [],
+        }
+        self._counters: Dict[str, int] = {
+            "requests": 0,
+            "errors": 0,
+            "executions": 0,
+            "coalesced": 0,
+        }
+
+    def observe(self, name: str, seconds: float) -> None:
+        with self._lock:
+            observations = self._observations[name]
+            observations.append(seconds)
+            if len(observations) > MAX_OBSERVATIONS:
+                del observations[0]
+
+    def increment(self, name: str) -> None:
+        with self._lock:
+            self._counters[name] += 1
+
+    def quantile(self, name: str, quantile: float) -> float:
+        with self._lock:
+            observations = sorted(self._observations[name])
+        if len(observations) == 0:
+            return 0.0
+        return observations[
+            min(len(observations) - 1, int(len(observations) * quantile))
+        ]
+
+    def render_prometheus(self) -> str:
+        """Renders all metrics in the Prometheus text exposition format."""
+        lines = []
+        for name, value in self._counters.items():
+            lines.append(f"# TYPE scapegpt_{name}_total counter")
+            lines.append(f"scapegpt_{name}_total {value}")
+        for name in self._observations:
+            lines.append(f"# TYPE scapegpt_query_{name} summary")
+            for quantile in QUANTILES:
+                lines.append(
+                    f'scapegpt_query_{name}{{quantile="{quantile}"}} '
+                    f"{self.quantile(name, quantile):.6f}"
+                )
+            with self._lock:
+                count = len(self._observations[name])
+                total = sum(self._observations[name])
+            lines.append(f"scapegpt_query_{name}_count {count}")
+            lines.append(f"scapegpt_query_{name}_sum {total:.6f}")
+        return "\n".join(lines) + "\n"
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Normalizes a prompt such that trivially different copies coalesce.
+
+    Case, runs of whitespace and trailing punctuation are ignored; "How do I
+    kill Zulrah?" and "how do i kill zulrah" are the same prompt.
+    """
+    return " ".join(prompt.lower().split()).rstrip("?!. ")
+
+
+class _Flight:
+    """An in-flight answer, shared by every request for the same prompt."""
+
+    def __init__(self) -> None:
+        self.condition = threading.Condition()
+        # The pieces of a streamed answer generated so far.
+        self.tokens: List[str] = []
+        self.result: Optional[str] = None
+        self.error: Optional[Exception] = None
+        self.done = False
+
+
+class CoalescingAnswerer:
+    """Answers identical in-flight prompts with a single execution.
+
+    After a game update, many players ask the same question within seconds.
+    Rather than running retrieval and the LLM for each of them, a request
+    for a prompt (see `normalize_prompt`) that's already being answered
+    waits for that answer instead. Streamed requests joining late are sent
+    the pieces generated so far first. Errors are shared the same way, each
+    request raising its own copy of the error (see `_copy_error`).
+    Nothing is cached: once an answer is complete, the next request for the
+    prompt is answered afresh.
+    """
+
+    def __init__(self, answerer, metrics: QueryMetrics) -> None:
+        """
+        Args:
+            answerer: Anything with `query(prompt) -> str` and
+                `stream_query(prompt) -> Iterator[str]` methods.
+            metrics (QueryMetrics): Where executions and coalesced requests
+                are counted.
+        """
+        self._answerer = answerer
+        self._metrics = metrics
+        self._lock = threading.Lock()
+        self._flights: Dict[Tuple[str, str], _Flight] = {}
+
+    def query(self, prompt: str) -> str:
+        key = ("query", normalize_prompt(prompt))
+        flight, leader = self._join(key)
+        if leader:
+            try:
+                flight.result = str(self._answerer.query(prompt))
+            except Exception as e:
+                flight.error = e
+            finally:
+                self._land(key, flight)
+
+        with flight.condition:
+            while not flight.done:
+                flight.condition.wait()
+        if flight.error is not None:
+            if leader:
+                raise flight.error
+            raise _copy_error(flight.error) from flight.error
+        return flight.result
+
+    def stream_query(self, prompt: str) -> Iterator[str]:
+        key = ("stream", normalize_prompt(prompt))
+        flight, leader = self._join(key)
+        if leader:
+            # Generated on a thread of its own, so that the answer keeps
+            # coming for everyone else if the first requester disconnects.
+            threading.Thread(
+                target=self._generate, args=(key, flight, prompt), daemon=True
+            ).start()
+
+        sent = 0
+        while True:
+            with flight.condition:
+                while sent == len(flight.tokens) and not flight.done:
+                    flight.condition.wait()
+                tokens = flight.tokens[sent:]
+                done = flight.done
+            yield from tokens
+            sent += len(tokens)
+            if done:
+                break
+        if flight.error is not None:
+            # Every request is a waiter here; the error was raised on the
+            # generating thread.
+            raise _copy_error(flight.error) from flight.error
+
+    def _generate(self, key: Tuple[str, str], flight: _Flight, prompt: str) -> None:
+        try:
+            for token in self._answerer.stream_query(prompt):
+                with flight.condition:
+                    flight.tokens.append(token)
+                    flight.condition.notify_all()
+        except Exception as e:
+            flight.error = e
+        finally:
+            self._land(key, flight)
+
+    def _join(self, key: Tuple[str, str]) -> Tuple[_Flight, bool]:
+        """Returns the prompt's flight, and whether the caller must run it."""
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = _Flight()
+                self._flights[key] = flight
+        self._metrics.increment("executions" if leader else "coalesced")
+        return flight, leader
+
+    def _land(self, key: Tuple[str, str], flight: _Flight) -> None:
+        with self._lock:
+            del self._flights[key]
+        with flight.condition:
+            flight.done = True
+            flight.condition.notify_all()
+
+
+def _copy_error(error: Exception) -> Exception:
+    """Returns a new exception of the same type and arguments as `error`.
+
+    Requests sharing an execution's error each raise their own copy, as
+    raising one instance on several threads at once has them all rewrite its
+    traceback. The type is kept so that e.g. a `ValueError` (an invalid
+    prompt) is still answered with a 400.
+    """
+    try:
+        return copy.copy(error)
+    except Exception:
+        # It can't be rebuilt from its arguments.
+        return RuntimeError(f"Coalesced request failed: {error!r}")
+
+
+def make_handler(answerer, metrics: QueryMetrics):
+    """Creates a request handler class bound to an answerer.
+
+    Args:
+        answerer: Anything with `query(prompt) -> str` and
+            `stream_query(prompt) -> Iterator[str]` methods, usually a
+            `VersionedCollectionClient`.
+        metrics (QueryMetrics): Where latency metrics are recorded.
+    """
+
+    class QueryRequestHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path != METRICS_PATH:
+                self.send_error(404)
+                return
+            body = metrics.render_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_POST(self):
+            if self.path not in (QUERY_PATH, STREAM_PATH):
+                self.send_error(404)
+                return
+
+            try:
+                length = int(self.headers.get("Content-Length", 0))
+                prompt = json.loads(self.rfile.read(length))["prompt"]
+            except (ValueError, KeyError, TypeError):
+                self._send_json(400, {"error": "Expected a JSON body with a prompt."})
+                return
+
+            metrics.increment("requests")
+            if self.path == STREAM_PATH:
+                self._stream(prompt)
+            else:
+                self._answer(prompt)
+
+        def _answer(self, prompt):
+            start = time.perf_counter()
+            try:
+                res = str(answerer.query(prompt))
+            except ValueError as e:
+                metrics.increment("errors")
+                self._send_json(400, {"error": str(e)})
+                return
+            except Exception as e:
+                metrics.increment("errors")
+                print(f"Query failed: {e}")
+                self._send_json(500, {"error": UNKNOWN_ERROR_MESSAGE})
+                return
+            metrics.observe("latency_seconds", time.perf_counter() - start)
+            self._send_json(200, {"res": res})
+
+        def _stream(self, prompt):
+            """Streams the answer as server-sent events.
+
+            Each piece of the answer is sent as a `data: {"token": "..."}`
+            event. The stream ends with a `done` event, or an `error` event if
+            the answer couldn't be completed.
+            """
+            start = time.perf_counter()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Cache-Control", "no-cache")
+            self.end_headers()
+
+            first_token = True
+            try:
+                for token in answerer.stream_query(prompt):
+                    if first_token:
+                        metrics.observe("ttft_seconds", time.perf_counter() - start)
+                        first_token = False
+                    self._send_event("message", {"token": token})
+            except BrokenPipeError:
+                # The player closed the panel or sent another prompt.
+                return
+            except ValueError as e:
+                metrics.increment("errors")
+                self._send_event("error", {"error": str(e)})
+                return
+            except Exception as e:
+                metrics.increment("errors")
+                print(f"Streamed query failed: {e}")
+                self._send_event("error", {"error": UNKNOWN_ERROR_MESSAGE})
+                return
+            metrics.observe("latency_seconds", time.perf_counter() - start)
+            self._send_event("done", {})
+
+        def _send_event(self, event, data):
+            message = ""
+            if event != "message":
+                message += f"event: {event}\n"
+            message += f"data: {json.dumps(data)}\n\n"
+            self.wfile.write(message.encode("utf-8"))
+            self.wfile.flush()
+
+        def _send_json(self, status, data):
+            body = json.dumps(data).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    return QueryRequestHandler
+
+
+class QueryServer(ThreadingHTTPServer):
+    request_queue_size = REQUEST_QUEUE_SIZE
+
+
+def create_server(
+    host: str,
+    port: int,
+    answerer,
+    metrics: QueryMetrics = None,
+    coalesce: bool = True,
+):
+    """Creates (but doesn't start) a threaded query server.
+
+    Identical prompts in flight at the same time are answered once (see
+    `CoalescingAnswerer`) unless `coalesce` is False.
+    """
+    if metrics is None:
+        metrics = QueryMetrics()
+    if coalesce:
+        answerer = CoalescingAnswerer(answerer, metrics)
+    return QueryServer((host, port), make_handler(answerer, metrics))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serves ScapeGPT queries over HTTP.")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=80)
+    parser.add_argument("--chroma-api-type", default="rest")
+    parser.add_argument("--chroma-host", default="localhost")
+    parser.add_argument("--chroma-port", type=int, default=8000)
+    parser.add_argument("--collection", default="osrs_wiki")
+    args = parser.parse_args()
+
+    current_dir = os.path.dirname(os.path.abspath(__file__))
+    sys.path.insert(0, os.path.join(current_dir, "..", "db"))
+    from versioned_collection_client import VersionedCollectionClient
+
+    # Serves whichever version of the collection is current, so that
+    # rebuilding it never takes the server offline.
+    client = VersionedCollectionClient(
+        args.chroma_api_type,
+        args.chroma_host,
+        args.chroma_port,
+        os.environ["OPENAI_API_KEY"],
+        args.collection,
+    )
+    server = create_server(args.host, args.port, client)
+    print(f"Serving on {args.host}:{args.port}...")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
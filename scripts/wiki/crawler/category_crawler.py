@@ -1,13 +1,25 @@
+import argparse
+import json
 import os
 import requests
 
 from bs4 import BeautifulSoup
-from typing import Dict
+from typing import Dict, Optional, Set, Tuple
+from urllib.parse import quote
 
 
 OSRS_WIKI_URL_BASE = "https://oldschool.runescape.wiki"
 # The "main" category page that contains links to all other sub-categories.
 OSRS_WIKI_CATEGORY_CATALOG = "https://oldschool.runescape.wiki/w/Category:Content"
+OSRS_WIKI_API_URL = "https://oldschool.runescape.wiki/api.php"
+# Characters MediaWiki leaves unescaped in article URLs.
+SLUG_SAFE_CHARACTERS = ";@$!*(),/~:"
+# Each category's membership fingerprint from the previous crawl, used to
+# skip categories that haven't changed.
+CATEGORY_STATE_FILE = "category_state.json"
+# Slugs added to and removed from categories since the scraper last consumed
+# them, keyed by category.
+SLUGS_DELTA_FILE = "delta.json"
 
 # Categories containing pages that (probably) aren't worth indexing.
 SKIPPED_CATEGORIES = [
@@ -155,9 +167,230 @@ def generate_slug_file(category: str, slug: str):
     print(f"Generated slug file for category: {category}.")
 
 
+def title_to_slug(title: str) -> str:
+    """Returns the slug the wiki links an article by, e.g. '/w/Zulrah%27s_scales'."""
+    return "/w/" + quote(title.replace(" ", "_"), safe=SLUG_SAFE_CHARACTERS)
+
+
+def get_category_fingerprint(category: str) -> Dict:
+    """Cheaply summarizes a category's membership with a single API request.
+
+    Returns:
+        dict: The number of articles in the category ("pages") and when the
+            most recently added one was added ("newest"). Adding an article
+            changes "newest"; removing one changes "pages".
+    """
+    res = requests.get(
+        OSRS_WIKI_API_URL,
+        params={
+            "action": "query",
+            "format": "json",
+            "formatversion": 2,
+            "prop": "categoryinfo",
+            "titles": f"Category:{category}",
+            "list": "categorymembers",
+            "cmtitle": f"Category:{category}",
+            "cmtype": "page",
+            "cmsort": "timestamp",
+            "cmdir": "desc",
+            "cmprop": "timestamp",
+            "cmlimit": 1,
+        },
+    )
+    res.raise_for_status()
+    query = res.json()["query"]
+    info = query["pages"][0].get("categoryinfo", {})
+    members = query["categorymembers"]
+    return {
+        "pages": info.get("pages", 0),
+        "newest": members[0]["timestamp"] if members else None,
+    }
+
+
+def list_category_slugs(category: str, added_since: Optional[str] = None) -> Set[str]:
+    """Lists the slugs of a category's articles through the API.
+
+    Args:
+        category (str): The name of the category.
+        added_since (Optional[str]): If given, only articles added to the
+            category at or after this timestamp are listed.
+
+    Returns:
+        set: The articles' slugs.
+    """
+    params = {
+        "action": "query",
+        "format": "json",
+        "formatversion": 2,
+        "list": "categorymembers",
+        "cmtitle": f"Category:{category}",
+        "cmtype": "page",
+        "cmprop": "title",
+        "cmlimit": "max",
+    }
+    if added_since is not None:
+        params.update(cmsort="timestamp", cmdir="asc", cmstart=added_since)
+
+    slugs = set()
+    while True:
+        res = requests.get(OSRS_WIKI_API_URL, params=params)
+        res.raise_for_status()
+        data = res.json()
+        for member in data["query"]["categorymembers"]:
+            slugs.add(title_to_slug(member["title"]))
+        if "continue" not in data:
+            return slugs
+        params.update(data["continue"])
+
+
+def update_category(
+    category: str, fingerprint: Dict, previous: Optional[Dict], slugs: Set[str]
+) -> Tuple[Set[str], Set[str]]:
+    """Works out which articles were added to and removed from a category.
+
+    Only the articles added since the previous crawl are listed, unless the
+    category's size shows articles were also removed; only then is the whole
+    category listed again.
+
+    Args:
+        category (str): The name of the category.
+        fingerprint (Dict): The category's current fingerprint.
+        previous (Optional[Dict]): The category's fingerprint from the previous
+            crawl, if any.
+        slugs (Set[str]): The category's slugs from the previous crawl.
+
+    Returns:
+        Tuple[Set[str], Set[str]]: The added and removed slugs.
+    """
+    if previous is not None and previous.get("newest") is not None:
+        added = list_category_slugs(category, previous["newest"]) - slugs
+        if len(slugs) + len(added) == fingerprint["pages"]:
+            return added, set()
+
+    current = list_category_slugs(category)
+    return current - slugs, slugs - current
+
+
+def read_slug_file(slugs_dir: str, category: str) -> Optional[Set[str]]:
+    try:
+        with open(os.path.join(slugs_dir, f"{category}.txt")) as f:
+            return {line.strip() for line in f if line.strip()}
+    except FileNotFoundError:
+        return None
+
+
+def write_slug_file(slugs_dir: str, category: str, slugs: Set[str]):
+    with open(os.path.join(slugs_dir, f"{category}.txt"), "w") as f:
+        for slug in sorted(slugs):
+            f.write(slug + "\n")
+
+
+def merge_delta(delta: Dict, category: str, added: Set[str], removed: Set[str]):
+    """Merges a category's changes into a pending (unconsumed) delta.
+
+    A slug added and then removed again before the delta was consumed (or vice
+    versa) cancels out.
+    """
+    changes = delta.setdefault(category, {"added": [], "removed": []})
+    pending_added = set(changes["added"])
+    pending_removed = set(changes["removed"])
+    changes["added"] = sorted((pending_added - removed) | (added - pending_removed))
+    changes["removed"] = sorted((pending_removed - added) | (removed - pending_added))
+    if not changes["added"] and not changes["removed"]:
+        del delta[category]
+
+
+def crawl_deltas(categories_to_slugs: Dict[str, str], full: bool = False):
+    """Updates every category's slug file, recording what changed.
+
+    Each category's fingerprint is compared with the one recorded by the
+    previous crawl, and unchanged categories aren't listed at all. Changes are
+    merged into `slugs/delta.json` for the wiki scraper (`--delta`) to pick
+    up.
+
+    Args:
+        categories_to_slugs (Dict[str, str]): Category names to category slugs.
+        full (bool): If True, every category is listed in full regardless of
+            its fingerprint.
+    """
+    current_dir = os.path.dirname(os.path.abspath(__file__))
+    three_dirs_up = os.path.join(current_dir, "..", "..", "..")
+    slugs_dir = os.path.join(three_dirs_up, "slugs")
+    os.makedirs(slugs_dir, exist_ok=True)
+    state_path = os.path.join(slugs_dir, CATEGORY_STATE_FILE)
+    delta_path = os.path.join(slugs_dir, SLUGS_DELTA_FILE)
+    state = _read_json(state_path)
+    delta = _read_json(delta_path)
+
+    changed = {}
+    for category in categories_to_slugs:
+        fingerprint = get_category_fingerprint(category)
+        previous = state.get(category)
+        slugs = read_slug_file(slugs_dir, category)
+        if slugs is None or full:
+            previous = None
+        elif fingerprint == previous:
+            continue
+
+        slugs = slugs or set()
+        added, removed = update_category(category, fingerprint, previous, slugs)
+        write_slug_file(slugs_dir, category, (slugs | added) - removed)
+        state[category] = fingerprint
+        changed[category] = (added, removed)
+        print(f"{category}: {len(added)} added, {len(removed)} removed.")
+
+    # An article removed from one category but still in another hasn't been
+    # removed from the wiki.
+    remaining = set()
+    for category in categories_to_slugs:
+        remaining |= read_slug_file(slugs_dir, category) or set()
+    for category, (added, removed) in changed.items():
+        merge_delta(delta, category, added, removed - remaining)
+
+    _write_json(delta_path, delta)
+    _write_json(state_path, state)
+    print(f"{len(changed)}/{len(categories_to_slugs)} categories changed.")
+
+
+def _read_json(path: str) -> Dict:
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def _write_json(path: str, data: Dict):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
 def main():
+    parser = argparse.ArgumentParser(
+        description="Crawls OSRS wiki categories into slug files."
+    )
+    parser.add_argument(
+        "--delta",
+        action="store_true",
+        help="Only list categories whose membership changed since the last "
+        "--delta crawl, recording added and removed slugs in slugs/delta.json.",
+    )
+    parser.add_argument(
+        "--full",
+        action="store_true",
+        help="With --delta, list every category in full (still recording the "
+        "delta against the previous slug files).",
+    )
+    args = parser.parse_args()
+
     categories_to_slugs = {}
     collect_category_slugs(OSRS_WIKI_CATEGORY_CATALOG, categories_to_slugs)
+    if args.delta:
+        crawl_deltas(categories_to_slugs, args.full)
+        return
+
     for category, slug in categories_to_slugs.items():
         generate_slug_file(category, slug)
 
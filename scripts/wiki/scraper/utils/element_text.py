@@ -0,0 +1,58 @@
+from bs4 import CData, NavigableString, Tag
+
+from utils.text_cleanup import is_noise_annotation
+
+
+# The string types `Tag.text` includes; comments, scripts etc. are left out.
+TEXT_STRING_TYPES = (NavigableString, CData)
+
+
+def get_element_text(element, br="", skip=None):
+    """Returns an element's text like `element.text`, without modifying it.
+
+    Rather than editing the tree (clearing unwanted elements, replacing <br>s)
+    before reading `.text`, the substitutions are made while reading. This
+    keeps the parsed page intact, so any number of extractors can read the
+    same tree, in any order or at the same time.
+
+    Args:
+        element (Tag): The element to read.
+        br (str): The text each <br> is read as.
+        skip (Callable[[Tag], bool]): Elements (and their descendants) this
+            returns True for are left out.
+
+    Returns:
+        str: The element's text.
+    """
+    parts = []
+    _collect_text(element, br, skip, parts)
+    return "".join(parts)
+
+
+def _collect_text(element, br, skip, parts):
+    for child in element.children:
+        if isinstance(child, Tag):
+            if child.name == "br":
+                parts.append(br)
+            elif skip is None or not skip(child):
+                _collect_text(child, br, skip, parts)
+        elif type(child) in TEXT_STRING_TYPES:
+            parts.append(child)
+
+
+def is_noise_sup(tag):
+    """Whether a tag is a <sup> annotation that's just noise (e.g. "[1]")."""
+    return tag.name == "sup" and is_noise_annotation(get_element_text(tag).strip())
+
+
+def is_math(tag):
+    """Whether a tag is a mathematical formula, which garbles scraped text."""
+    return (
+        tag.name == "span"
+        and "class" in tag.attrs
+        and "mwe-math-element" in tag["class"]
+    )
+
+
+def is_noise_sup_or_math(tag):
+    return is_noise_sup(tag) or is_math(tag)
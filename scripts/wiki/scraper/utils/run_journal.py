@@ -0,0 +1,294 @@
+import os
+import socket
+import sqlite3
+import threading
+import time
+
+
+PENDING = "pending"
+IN_PROGRESS = "in_progress"
+DONE = "done"
+FAILED = "failed"
+STATUSES = [PENDING, IN_PROGRESS, DONE, FAILED]
+# How long to wait for another process to release the database lock.
+LOCK_TIMEOUT_SECONDS = 60
+# A claimed slug is handed to another worker if its lease isn't renewed (by
+# the claiming worker's heartbeat) within this long, e.g. because the worker's
+# host died.
+LEASE_SECONDS = 120
+# How often a worker's heartbeat renews the leases of the slugs it holds.
+HEARTBEAT_INTERVAL_SECONDS = LEASE_SECONDS / 4
+
+
+def get_worker_id():
+    """Returns an ID unique to this process, e.g. 'scraper-1:4242'."""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class RunJournal:
+    """A durable record of every slug in a scrape run and how it went.
+
+    The journal is a SQLite database, so several processes (on one or more
+    hosts sharing the file, e.g. on a network volume) can work through it
+    together: slugs are claimed
+    atomically, and a claim is a lease that expires unless the claiming worker
+    keeps renewing it (see `Heartbeat`). A slug whose lease expires is handed
+    to the next worker to claim, so a dead worker's slugs are never lost.
+
+    Usage:
+        journal = RunJournal(path)
+        journal.add_slugs(slugs)
+        while (slug := journal.claim()) is not None:
+            try:
+                ...
+                journal.mark_done(slug)
+            except Exception as e:
+                journal.mark_failed(slug, repr(e))
+    """
+
+    def __init__(self, path, worker_id=None, lease_seconds=LEASE_SECONDS, wal=False):
+        """
+        Args:
+            path (str): The journal's database file.
+            worker_id (Optional[str]): Identifies this worker's claims.
+                Defaults to `get_worker_id()`.
+            lease_seconds (float): How long a claim lasts unless renewed.
+            wal (bool): Whether to use SQLite's write-ahead log, which lets
+                readers and the writer work concurrently. It relies on memory
+                shared between the processes, so it's only safe if they're all
+                on one host; otherwise claims can be lost or the database
+                corrupted. The default rollback journal only needs the file
+                locks shared volumes provide.
+        """
+        self.path = path
+        self.worker_id = worker_id if worker_id is not None else get_worker_id()
+        self.lease_seconds = lease_seconds
+        self.wal = wal
+        # Autocommit mode; transactions are started explicitly where a
+        # read-then-write has to be atomic.
+        self._conn = sqlite3.connect(
+            path, timeout=LOCK_TIMEOUT_SECONDS, isolation_level=None
+        )
+        # Set either way, as the mode persists in the database file.
+        self._conn.execute(f"PRAGMA journal_mode={'WAL' if wal else 'DELETE'}")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS slugs (
+                slug TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                last_error TEXT,
+                worker TEXT,
+                lease_expires_at REAL,
+                updated_at REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS slugs_status ON slugs (status)")
+
+    def close(self):
+        self._conn.close()
+
+    def add_slugs(self, slugs, requeue=False):
+        """Adds slugs as pending.
+
+        Args:
+            slugs (Iterable[str]): The slugs to add.
+            requeue (bool): If True, slugs already in the journal are made
+                pending again (unless in progress), e.g. because the article
+                changed. Otherwise they're untouched.
+
+        Returns:
+            int: The number of slugs added (or requeued).
+        """
+        now = time.time()
+        query = "INSERT INTO slugs (slug, status, updated_at) VALUES (?, ?, ?) "
+        if requeue:
+            query += (
+                "ON CONFLICT (slug) DO UPDATE SET status = excluded.status, "
+                f"updated_at = excluded.updated_at WHERE status != '{IN_PROGRESS}'"
+            )
+        else:
+            query += "ON CONFLICT (slug) DO NOTHING"
+        before = self._conn.total_changes
+        self._conn.execute("BEGIN IMMEDIATE")
+        self._conn.executemany(query, [(slug, PENDING, now) for slug in slugs])
+        self._conn.execute("COMMIT")
+        return self._conn.total_changes - before
+
+    def claim(self):
+        """Leases the next pending (or abandoned) slug to this worker.
+
+        Returns:
+            str: The claimed slug, or None if there are no slugs to claim.
+        """
+        # BEGIN IMMEDIATE takes the write lock up front, so no other process
+        # can claim the same slug between the SELECT and the UPDATE.
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            now = time.time()
+            row = self._conn.execute(
+                "SELECT slug FROM slugs WHERE status = ? "
+                "OR (status = ? AND lease_expires_at < ?) LIMIT 1",
+                (PENDING, IN_PROGRESS, now),
+            ).fetchone()
+            if row is None:
+                return None
+            self._conn.execute(
+                "UPDATE slugs SET status = ?, attempts = attempts + 1, worker = ?, "
+                "lease_expires_at = ?, updated_at = ? WHERE slug = ?",
+                (IN_PROGRESS, self.worker_id, now + self.lease_seconds, now, row[0]),
+            )
+            return row[0]
+        finally:
+            self._conn.execute("COMMIT")
+
+    def renew_leases(self):
+        """Extends the leases of every slug this worker holds.
+
+        Returns:
+            int: The number of leases renewed.
+        """
+        now = time.time()
+        return self._conn.execute(
+            "UPDATE slugs SET lease_expires_at = ? WHERE status = ? AND worker = ?",
+            (now + self.lease_seconds, IN_PROGRESS, self.worker_id),
+        ).rowcount
+
+    def mark_done(self, slug):
+        """Returns False if the slug's lease was lost to another worker."""
+        return self._set_status(slug, DONE, None)
+
+    def mark_failed(self, slug, error):
+        """Returns False if the slug's lease was lost to another worker."""
+        return self._set_status(slug, FAILED, error)
+
+    def _set_status(self, slug, status, error):
+        # Only the worker holding the lease may finish a slug. Scraping is
+        # idempotent, so a worker that lost its lease has merely duplicated
+        # work; its result is dropped in favour of the new leaseholder's.
+        return (
+            self._conn.execute(
+                "UPDATE slugs SET status = ?, last_error = ?, lease_expires_at = NULL, "
+                "updated_at = ? WHERE slug = ? AND status = ? AND worker = ?",
+                (status, error, time.time(), slug, IN_PROGRESS, self.worker_id),
+            ).rowcount
+            > 0
+        )
+
+    def retry_failed(self, max_attempts=None):
+        """Makes failed slugs pending again.
+
+        Args:
+            max_attempts (int): If given, slugs that have already been
+                attempted this many times stay failed.
+
+        Returns:
+            int: The number of slugs that will be retried.
+        """
+        query = "UPDATE slugs SET status = ?, updated_at = ? WHERE status = ?"
+        params = [PENDING, time.time(), FAILED]
+        if max_attempts is not None:
+            query += " AND attempts < ?"
+            params.append(max_attempts)
+        return self._conn.execute(query, params).rowcount
+
+    def release_dead_claims(self):
+        """Makes slugs claimed by processes on this host that died pending again.
+
+        A process that crashes or is killed mid-slug leaves that slug in
+        progress; this lets the next run pick it back up.
+
+        Returns:
+            int: The number of slugs released.
+        """
+        hostname = socket.gethostname()
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            dead = []
+            for slug, worker in self._conn.execute(
+                "SELECT slug, worker FROM slugs WHERE status = ?", (IN_PROGRESS,)
+            ).fetchall():
+                host, _, pid = worker.rpartition(":")
+                if host == hostname and not _is_process_alive(int(pid)):
+                    dead.append((PENDING, time.time(), slug))
+            self._conn.executemany(
+                "UPDATE slugs SET status = ?, updated_at = ? WHERE slug = ?", dead
+            )
+            return len(dead)
+        finally:
+            self._conn.execute("COMMIT")
+
+    def counts(self):
+        """Returns the number of slugs in each status."""
+        counts = {status: 0 for status in STATUSES}
+        for status, count in self._conn.execute(
+            "SELECT status, COUNT(*) FROM slugs GROUP BY status"
+        ):
+            counts[status] = count
+        return counts
+
+    def slugs_with_status(self, status):
+        """Returns the set of slugs in the given status."""
+        return {
+            slug
+            for (slug,) in self._conn.execute(
+                "SELECT slug FROM slugs WHERE status = ?", (status,)
+            )
+        }
+
+    def failures(self):
+        """Returns (slug, attempts, last error) for every failed slug."""
+        return self._conn.execute(
+            "SELECT slug, attempts, last_error FROM slugs WHERE status = ? "
+            "ORDER BY slug",
+            (FAILED,),
+        ).fetchall()
+
+
+class Heartbeat:
+    """Renews a worker's leases from a background thread while in use.
+
+    Usage:
+        with Heartbeat(journal):
+            ...  # claim and scrape slugs
+    """
+
+    def __init__(self, journal, interval_seconds=HEARTBEAT_INTERVAL_SECONDS):
+        self._path = journal.path
+        self._worker_id = journal.worker_id
+        self._lease_seconds = journal.lease_seconds
+        self._wal = journal.wal
+        self._interval_seconds = interval_seconds
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stopped.set()
+        self._thread.join()
+
+    def _run(self):
+        # SQLite connections can't be shared between threads.
+        journal = RunJournal(
+            self._path, self._worker_id, self._lease_seconds, self._wal
+        )
+        try:
+            while not self._stopped.wait(self._interval_seconds):
+                journal.renew_leases()
+        finally:
+            journal.close()
+
+
+def _is_process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # The process exists but belongs to another user.
+        return True
+    return True
@@ -0,0 +1,162 @@
+import json
+import time
+
+from collections import Counter
+from contextlib import contextmanager
+
+
+# Stages every page goes through, in order.
+STAGES = ["fetch", "parse", "infobox", "content", "write"]
+# How many of the slowest pages the end-of-run summary lists.
+NUM_SLOWEST_PAGES = 10
+# How many of the most common warning details the end-of-run summary lists.
+NUM_TOP_WARNINGS = 10
+
+
+def print_warning(kind, message):
+    """The default warning handler for the scrapers: prints the message."""
+    print(message)
+
+
+class PageMetrics:
+    """Timings, sizes and warnings recorded while scraping a single page."""
+
+    def __init__(self, slug):
+        self.slug = slug
+        self.title = None
+        self.spans = {}
+        self.bytes = {}
+        self.warnings = Counter()
+
+    @property
+    def total_seconds(self):
+        return sum(self.spans.values())
+
+    def to_dict(self):
+        return {
+            "slug": self.slug,
+            "title": self.title,
+            "spans": self.spans,
+            "bytes": self.bytes,
+            "warnings": dict(self.warnings),
+        }
+
+
+class ScrapeMetrics:
+    """Collects per-page metrics over a scrape run.
+
+    Usage:
+        page = metrics.start_page(slug)
+        with metrics.span(page, "fetch"):
+            ...
+        metrics.warn("unknown_headline", f"UNKNOWN *HEADLINE*: ...")
+    """
+
+    def __init__(self):
+        self.pages = []
+        self.warnings = Counter()
+        # Counts of (kind, message) pairs, e.g. how often each unknown infobox
+        # label was seen across the run.
+        self.warning_details = Counter()
+        self._current_page = None
+        self._start = time.perf_counter()
+
+    def start_page(self, slug):
+        page = PageMetrics(slug)
+        self.pages.append(page)
+        self._current_page = page
+        return page
+
+    @contextmanager
+    def span(self, page, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            page.spans[stage] = page.spans.get(stage, 0.0) + (
+                time.perf_counter() - start
+            )
+
+    def warn(self, kind, message):
+        """Records a warning against the current page instead of printing it."""
+        self.warnings[kind] += 1
+        self.warning_details[(kind, message.strip())] += 1
+        if self._current_page is not None:
+            self._current_page.warnings[kind] += 1
+
+    def merge(self, other):
+        """Adds another collector's pages and warnings, e.g. a worker's."""
+        self.pages.extend(other.pages)
+        self.warnings.update(other.warnings)
+        self.warning_details.update(other.warning_details)
+
+    def write_jsonl(self, path):
+        """Writes one JSON object per scraped page."""
+        with open(path, "w", encoding="utf-8") as f:
+            for page in self.pages:
+                f.write(json.dumps(page.to_dict()) + "\n")
+
+    def render_prometheus(self):
+        """Renders run totals in the Prometheus text exposition format."""
+        lines = [
+            "# TYPE scapegpt_scrape_pages_total counter",
+            f"scapegpt_scrape_pages_total {len(self.pages)}",
+            "# TYPE scapegpt_scrape_stage_seconds_total counter",
+        ]
+        for stage in STAGES:
+            total = sum(page.spans.get(stage, 0.0) for page in self.pages)
+            lines.append(
+                f'scapegpt_scrape_stage_seconds_total{{stage="{stage}"}} {total:.6f}'
+            )
+        lines.append("# TYPE scapegpt_scrape_bytes_total counter")
+        for kind in sorted({k for page in self.pages for k in page.bytes}):
+            total = sum(page.bytes.get(kind, 0) for page in self.pages)
+            lines.append(f'scapegpt_scrape_bytes_total{{kind="{kind}"}} {total}')
+        lines.append("# TYPE scapegpt_scrape_warnings_total counter")
+        for kind, count in sorted(self.warnings.items()):
+            lines.append(f'scapegpt_scrape_warnings_total{{kind="{kind}"}} {count}')
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(self.render_prometheus())
+
+    def summary(self):
+        """Returns a human-readable end-of-run summary."""
+        elapsed = time.perf_counter() - self._start
+        num_pages = len(self.pages)
+        fetched_bytes = sum(page.bytes.get("html", 0) for page in self.pages)
+        stage_totals = {
+            stage: sum(page.spans.get(stage, 0.0) for page in self.pages)
+            for stage in STAGES
+        }
+        all_stages_total = sum(stage_totals.values()) or 1.0
+
+        lines = [
+            f"Scraped {num_pages} pages in {elapsed:.1f}s "
+            f"({num_pages / elapsed if elapsed else 0:.2f} pages/s, "
+            f"{fetched_bytes / 1e6 / elapsed if elapsed else 0:.2f} MB/s fetched)",
+            "",
+            "Time per stage:",
+        ]
+        for stage, total in stage_totals.items():
+            lines.append(
+                f"  {stage:<8} {total:8.2f}s ({100 * total / all_stages_total:4.1f}%)"
+            )
+
+        lines += ["", f"Slowest {NUM_SLOWEST_PAGES} pages:"]
+        slowest = sorted(self.pages, key=lambda p: p.total_seconds, reverse=True)
+        for page in slowest[:NUM_SLOWEST_PAGES]:
+            spans = ", ".join(f"{s} {t:.2f}s" for s, t in page.spans.items())
+            lines.append(f"  {page.total_seconds:6.2f}s {page.slug} ({spans})")
+
+        if self.warnings:
+            lines += ["", "Warnings:"]
+            for kind, count in self.warnings.most_common():
+                lines.append(f"  {kind}: {count}")
+            lines += ["", f"Most common {NUM_TOP_WARNINGS} warnings:"]
+            for (_, message), count in self.warning_details.most_common(
+                NUM_TOP_WARNINGS
+            ):
+                lines.append(f"  {count:5d}x {' '.join(message.split())}")
+        return "\n".join(lines)
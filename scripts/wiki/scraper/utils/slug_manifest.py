@@ -0,0 +1,152 @@
+import hashlib
+import json
+import os
+import re
+
+
+MANIFEST_FILE = "manifest.json"
+# Each distinct selection of slugs (categories and patterns) is cached in
+# this directory, next to the manifest.
+SELECTIONS_DIR = "selections"
+# Bumped whenever the manifest's layout changes, so stale manifests are
+# rebuilt rather than misread.
+MANIFEST_VERSION = 1
+
+
+def compile_patterns(patterns, literal=False):
+    """Compiles patterns into a single case-insensitive regex.
+
+    Args:
+        patterns (List[str]): Regexes (or, if `literal`, plain substrings).
+        literal (bool): Whether the patterns are plain substrings.
+
+    Returns:
+        re.Pattern: A regex matching any of the patterns, or None if there are
+            none.
+    """
+    if not patterns:
+        return None
+    if literal:
+        patterns = [re.escape(p) for p in patterns]
+    return re.compile("|".join(f"(?:{p})" for p in patterns), re.IGNORECASE)
+
+
+class SlugManifest:
+    """Every crawled slug, deduplicated, by the categories it belongs to.
+
+    The manifest is built from the category crawler's `slugs/<Category>.txt`
+    files and persisted next to them along with each file's size and
+    modification time, so the slug files are only re-read when one of them
+    changes. Selections of slugs are cached too: selecting the same slugs as a
+    previous run only stats the slug files and reads one file.
+
+    Usage:
+        slugs = SlugManifest(slugs_dir).select(categories, include, exclude)
+    """
+
+    def __init__(self, slugs_dir):
+        self._slugs_dir = slugs_dir
+        self._files = _stat_slug_files(slugs_dir)
+        self._slugs_by_category = None
+
+    @property
+    def slugs_by_category(self):
+        """Maps every category to its (deduplicated, sorted) slugs."""
+        if self._slugs_by_category is None:
+            self._slugs_by_category = self._load()
+        return self._slugs_by_category
+
+    def select(self, categories=None, include=None, exclude=None):
+        """Selects slugs by category and pattern.
+
+        Args:
+            categories (Iterable[str]): Only slugs in at least one of these
+                categories are selected. All categories if None.
+            include (re.Pattern): If given, only slugs matching it are
+                selected.
+            exclude (re.Pattern): If given, slugs matching it are skipped.
+
+        Returns:
+            set: The selected slugs.
+        """
+        key = hashlib.sha1(
+            json.dumps(
+                [
+                    MANIFEST_VERSION,
+                    self._files,
+                    sorted(categories) if categories is not None else None,
+                    include.pattern if include is not None else None,
+                    exclude.pattern if exclude is not None else None,
+                ],
+                sort_keys=True,
+            ).encode("utf-8")
+        ).hexdigest()
+        selection_path = os.path.join(self._slugs_dir, SELECTIONS_DIR, key + ".txt")
+        try:
+            with open(selection_path, encoding="utf-8") as f:
+                return set(f.read().split("\n")) - {""}
+        except FileNotFoundError:
+            pass
+
+        if categories is None:
+            categories = self.slugs_by_category.keys()
+        selected = set()
+        for category in categories:
+            selected.update(self.slugs_by_category.get(category, []))
+        if include is not None:
+            selected = {slug for slug in selected if include.search(slug)}
+        if exclude is not None:
+            selected = {slug for slug in selected if not exclude.search(slug)}
+
+        os.makedirs(os.path.dirname(selection_path), exist_ok=True)
+        _write_atomically(selection_path, "\n".join(sorted(selected)))
+        return selected
+
+    def _load(self):
+        path = os.path.join(self._slugs_dir, MANIFEST_FILE)
+        try:
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+            if data["version"] == MANIFEST_VERSION and data["files"] == self._files:
+                return data["categories"]
+        except (FileNotFoundError, ValueError, KeyError):
+            pass
+
+        slugs_by_category = {}
+        for filename in sorted(self._files):
+            with open(os.path.join(self._slugs_dir, filename), encoding="utf-8") as f:
+                slugs = {line.strip() for line in f} - {""}
+            slugs_by_category[filename[: -len(".txt")]] = sorted(slugs)
+
+        # Selections cached against the old slug files can never match again.
+        selections_dir = os.path.join(self._slugs_dir, SELECTIONS_DIR)
+        if os.path.isdir(selections_dir):
+            for filename in os.listdir(selections_dir):
+                os.remove(os.path.join(selections_dir, filename))
+        _write_atomically(
+            path,
+            json.dumps(
+                {
+                    "version": MANIFEST_VERSION,
+                    "files": self._files,
+                    "categories": slugs_by_category,
+                }
+            ),
+        )
+        return slugs_by_category
+
+
+def _stat_slug_files(slugs_dir):
+    files = {}
+    for entry in os.scandir(slugs_dir):
+        if entry.name.endswith(".txt"):
+            stat = entry.stat()
+            files[entry.name] = [stat.st_size, stat.st_mtime_ns]
+    return files
+
+
+def _write_atomically(path, text):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp_path, path)
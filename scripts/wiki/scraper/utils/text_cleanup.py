@@ -0,0 +1,34 @@
+import re
+
+from functools import lru_cache
+
+
+# Wiki UI artefacts that end up in scraped text, e.g. "(edit)" links next to
+# editable values, "(info)" links, and "(update | poll)" links to the update
+# that changed a value. Any whitespace before an artefact goes with it, and
+# the whitespace inside one can be anything (links are often separated by
+# non-breaking spaces or newlines).
+ARTEFACT_PATTERN = re.compile(
+    r"\s*\(\s*(?:edit|info|update(?:\s*\|\s*poll)?)\s*\)", re.IGNORECASE
+)
+# <sup> annotations worth keeping: ordinals ("2nd", "3rd", "4th") and the
+# US/UK floor numbering disambiguation. Every other <sup> (e.g. reference
+# markers like "[1]" or "[c 1]") is noise.
+KEPT_ANNOTATION_PATTERN = re.compile("st|nd|rd|US|UK")
+# Cell and value text repeats a lot across pages ("Always", "1", "N/A"...).
+CACHE_SIZE = 1 << 16
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def clean_text(text):
+    """Strips whitespace and wiki UI artefacts (e.g. "(edit)") from text."""
+    if "(" not in text:
+        # Most text has no artefacts; skip the regex entirely.
+        return text.strip()
+    return ARTEFACT_PATTERN.sub("", text).strip()
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def is_noise_annotation(sup_text):
+    """Whether a <sup>'s text is noise (e.g. a reference marker like "[1]")."""
+    return KEPT_ANNOTATION_PATTERN.search(sup_text) is None
@@ -0,0 +1,67 @@
+import re
+
+from bs4 import NavigableString
+from urllib.parse import unquote
+
+
+# Names in an infobox "AKA" row are separated by commas, semicolons or <br>s.
+AKA_DELIMITER_PATTERN = re.compile(r"[,;\n]")
+
+
+def _slug_to_name(slug):
+    """Turns a slug such as "/w/Karil%27s_crossbow" into "Karil's crossbow"."""
+    name = slug[3:] if slug.startswith("/w/") else slug
+    name = name.split("?", 1)[0]
+    return unquote(name).replace("_", " ").strip()
+
+
+def get_aliases(soup, title, slug):
+    """Collects every name an article can be referred to by.
+
+    This includes the article title, the slug the article was scraped from
+    (which may itself be a redirect), the page the wiki says it redirected from
+    and any names listed in the infobox's "AKA" row.
+
+    Args:
+        soup (BeautifulSoup): The parsed article.
+        title (str): The article title.
+        slug (str): The slug the article was fetched from.
+
+    Returns:
+        list: A de-duplicated list of aliases, in the order they were found.
+    """
+    aliases = [title, _slug_to_name(slug)]
+
+    redirected_from = soup.find("span", class_="mw-redirectedfrom")
+    if redirected_from:
+        for a in redirected_from.find_all("a"):
+            if "title" in a.attrs:
+                aliases.append(a["title"])
+
+    infobox = soup.find("table", class_="infobox")
+    if infobox:
+        for row in infobox.find_all("tr"):
+            label = row.find("th")
+            value = row.find("td")
+            if not label or not value or label.text.strip().lower() != "aka":
+                continue
+
+            # <br>s are rendered as newlines without mutating the soup.
+            aka = ""
+            for element in value.descendants:
+                if element.name == "br":
+                    aka += "\n"
+                elif isinstance(element, NavigableString):
+                    aka += element
+            aliases.extend(AKA_DELIMITER_PATTERN.split(aka))
+            break
+
+    seen = set()
+    unique_aliases = []
+    for alias in aliases:
+        alias = alias.strip()
+        if not alias or alias.lower() in seen:
+            continue
+        seen.add(alias.lower())
+        unique_aliases.append(alias)
+    return unique_aliases
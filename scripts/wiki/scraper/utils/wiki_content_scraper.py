@@ -1,8 +1,10 @@
-import copy
-
-from bs4 import NavigableString
 from enum import Enum
 
+from utils.element_text import get_element_text, is_noise_sup, is_noise_sup_or_math
+from utils.scrape_metrics import print_warning
+from utils.text_cleanup import clean_text
+from utils.wiki_tables import COMPACT, WikiTable
+
 
 EXCLUDED_HEADLINES = set(
     [
@@ -178,31 +180,14 @@ SKILLS = set(
 )
 
 
-def _parse_wikitable(wikitable):
+def _parse_wikitable(wikitable, section=""):
+    """Extracts a wikitable's headers and rows into a `WikiTable`."""
+
     def _get_headers():
         headers = []
         for th in wikitable.select("tr th"):
             header_content = ""
 
-            # TODO(rbnsl): Abstract this out.
-            # Removes annotations ([1], [c 1] etc.).
-            sups = th.find_all("sup")
-            for sup in sups:
-                sup_text = sup.text.strip()
-                if (
-                    "st" not in sup_text
-                    and "nd" not in sup_text
-                    and "rd" not in sup_text
-                    and "US" not in sup_text
-                    and "UK" not in sup_text
-                ):
-                    sup.clear()
-
-            # Some tables have long enough headers that have <br>s; these need to be
-            # replaced with whitespace.
-            for br in th.find_all("br"):
-                br.replace_with(NavigableString(" "))
-
             # Some table headers have images of skills; these need to be parsed in a
             # way that actually adds the name of the skill.
             skill = th.find("a")
@@ -215,7 +200,10 @@ def _parse_wikitable(wikitable):
             if "class" in th.attrs and "alch-column" in th["class"]:
                 continue
 
-            header_content += th.text.strip()
+            # Annotations ([1], [c 1] etc.) are left out. Some tables have
+            # long enough headers that have <br>s; these are read as
+            # whitespace.
+            header_content += get_element_text(th, br=" ", skip=is_noise_sup).strip()
 
             # Some headers may be empty, in which case we want to ignore them.
             # For example, in any of the drops tables in
@@ -234,11 +222,6 @@ def _parse_wikitable(wikitable):
 
             row = []
             for td in tds:
-                # Remove all mathematical formulas/elements as these mess up
-                # formatting.
-                for math_element in td.select("span.mwe-math-element"):
-                    math_element.clear()
-
                 # Ignore cells containing just images as this messes up
                 # the table formatting. For example, consider the
                 # "Creation Menu" table under the
@@ -271,20 +254,6 @@ def _parse_wikitable(wikitable):
                     row.append(parsable_img_content[:-2])
                     continue
 
-                # TODO(rbnsl): Abstract this out.
-                # Removes annotations ([1], [c 1] etc.).
-                sups = td.find_all("sup")
-                for sup in sups:
-                    sup_text = sup.text.strip()
-                    if (
-                        "st" not in sup_text
-                        and "nd" not in sup_text
-                        and "rd" not in sup_text
-                        and "US" not in sup_text
-                        and "UK" not in sup_text
-                    ):
-                        sup.clear()
-
                 # Some table data cells contain just a gold or silver star
                 # indicating whether a piece of content is members-only or
                 # available for free-to-play (F2P) players. Replace these images
@@ -303,7 +272,9 @@ def _parse_wikitable(wikitable):
                     row_content = ""
                     at_least_one_li = False
                     for li in td.find_all("li"):
-                        row_content += li.text.strip()
+                        row_content += get_element_text(
+                            li, skip=is_noise_sup_or_math
+                        ).strip()
                         skill = li.find("span", class_="scp")
                         if skill and "data-skill" in skill.attrs:
                             row_content += " " + skill["data-skill"]
@@ -331,24 +302,19 @@ def _parse_wikitable(wikitable):
                     row.append(row_content)
                     continue
 
-                # Some table data cells contain <br>s. These should be replaced
-                # such that table data is comma-delimited.
-                for br in td.find_all("br"):
-                    br.replace_with(NavigableString(" / "))
-
                 # Same as with headers, we don't want to consider the high alch
                 # information.
                 if "class" in td.attrs and "alch-column" in td["class"]:
                     continue
 
                 # At this point, we can just parse the row content normally.
-                row_content = td.text.strip()
-                row_content = row_content.replace("(update)", "")
-                row_content = row_content.replace(" (update)", "")
-                # TODO(rbnsl): These below 3 aren't working; fix them.
-                row_content = row_content.replace(" (update | poll)", "")
-                row_content = row_content.replace("\n(update | poll)", "")
-                row_content = row_content.replace("(update | poll)", "")
+                # Mathematical formulas mess up formatting and annotations
+                # ([1], [c 1] etc.) are noise, so both are left out. Some table
+                # data cells contain <br>s; these are read as " / " such that
+                # table data is delimited.
+                row_content = clean_text(
+                    get_element_text(td, br=" / ", skip=is_noise_sup_or_math)
+                )
 
                 # We might have no row content. This usually happens when the
                 # table data cell just had an image that did _not_ have a
@@ -373,19 +339,7 @@ def _parse_wikitable(wikitable):
 
         return rows
 
-    output = ""
-    headers = _get_headers()
-    rows = _get_rows()
-
-    for row in rows:
-        for i in range(len(headers)):
-            header = headers[i]
-            cell = row[i] if i < len(row) else ""
-            output += f"{header}: {cell}, "
-        output = output[:-2] + "\n"
-
-    output += "\n"
-    return output
+    return WikiTable(_get_headers(), _get_rows(), section)
 
 
 def _parse_skill_infobox(skill_infobox):
@@ -428,23 +382,29 @@ def _parse_unordered_list(ul):
     for li in ul.find_all("li", recursive=False):
         sub_ul = li.find("ul")
         if sub_ul:
-            copy_ul = copy.copy(sub_ul)
-            sub_ul.clear()
-            output += f"* {li.text.strip()}\n"
-            for sub_li in copy_ul.find_all("li"):
+            # The item's own text, without its sub-list.
+            li_text = get_element_text(li, skip=lambda tag: tag is sub_ul)
+            output += f"* {li_text.strip()}\n"
+            for sub_li in sub_ul.find_all("li"):
                 output += f"  * {sub_li.text.strip()}\n"
             continue
         output += f"* {li.text.strip()}\n"
     return output + "\n"
 
 
-def _parse_tabber(tabber):
+def _parse_tabber(tabber, section, render_table):
     """Parses tabber <div>s.
 
     For example, the table under "Quests" in
     https://oldschool.runescape.wiki/w/Combat_only_pure is a tabber as it has
     multiple, clickable tabs with different information depending on which tab
     is selected.
+
+    Args:
+        tabber (Tag): The tabber <div>.
+        section (str): The headline the tabber appears under.
+        render_table (Callable[[Tag, str], str]): Parses and renders a
+            wikitable given the section it appears in.
     """
     tabs = tabber.select("div.tabbertab")
     if len(tabs) == 0:
@@ -453,12 +413,14 @@ def _parse_tabber(tabber):
     output = ""
     for tab in tabs:
         # Append the tab's title before adding the tab content.
+        tab_section = section
         if "data-title" in tab.attrs:
             output += tab["data-title"] + ":\n\n"
+            tab_section = tab["data-title"]
 
         wikitable = tab.select("table.wikitable")
         if len(wikitable) > 0:
-            output += _parse_wikitable(wikitable[0])
+            output += render_table(wikitable[0], tab_section)
             continue
 
         ul = tab.select("ul")
@@ -470,7 +432,7 @@ def _parse_tabber(tabber):
 
 # TODO(rbnsl): Abstract this out with how you do this in right-hand side
 # infoboxes (as per `infobox_scraper.py`).
-def _parse_combat_bonuses(infobox, title):
+def _parse_combat_bonuses(infobox, title, warn=print_warning):
     """Parses combat bonus tables found on equipment pages."""
 
     class CombatBonusesState(Enum):
@@ -529,14 +491,14 @@ def _parse_combat_bonuses(infobox, title):
 
         bonus_values = row.find_all("td", class_="infobox-nested")
         if len(bonus_values) != len(cur_bonus_headers):
-            print(f"Oddly formatted combat bonus table in article: {title}")
+            warn(
+                "odd_combat_bonuses",
+                f"Oddly formatted combat bonus table in article: {title}",
+            )
             continue
 
         for i, bonus_value in enumerate(bonus_values):
-            for br in bonus_value.find_all("br"):
-                br.replace_with(NavigableString(" "))
-
-            bv = bonus_value.text.strip()
+            bv = get_element_text(bonus_value, br=" ").strip()
 
             bv_a = bonus_value.find("a")
             if bv_a and "title" in bv_a.attrs and "slot" in bv_a["title"].lower():
@@ -560,7 +522,34 @@ def _parse_combat_bonuses(infobox, title):
     return output + "\n"
 
 
-def get_content(soup, title):
+def get_content(
+    soup, title, warn=print_warning, table_format=COMPACT, tables=None, offload=False
+):
+    """Scrapes an article's core content into text.
+
+    Args:
+        soup (BeautifulSoup): The parsed article.
+        title (str): The article's title, for warnings.
+        warn (Callable[[str, str], None]): Called with the kind and message of
+            anything unexpected in the article.
+        table_format (str): How wikitables are rendered (see `TABLE_FORMATS`).
+        tables (list): If given, every wikitable is also appended to it as a
+            `WikiTable`, e.g. to be stored as sidecar data.
+        offload (bool): Whether large lookup tables (drops, shops) are left
+            out of the content but for their item names, as their rows are
+            served from the table store. Only set this if `tables` are
+            stored.
+
+    Returns:
+        str: The article's content.
+    """
+
+    def _render_table(wikitable, section):
+        table = _parse_wikitable(wikitable, section)
+        if tables is not None:
+            tables.append(table)
+        return table.render(table_format, offload)
+
     content_section = soup.select(
         "div#bodyContent div#mw-content-text div.mw-parser-output"
     )
@@ -572,11 +561,16 @@ def get_content(soup, title):
     # concatenation.
     output = ""
     cur_headline = ""
+    # The latest headline of any level, which tables are filed under.
+    cur_section = ""
     for child in content_section.findChildren(recursive=False):
         if child.name == "h2":
             headline = child.find("span", class_="mw-headline")
             if not headline:
-                print(f"Unable to grab a main headline in article: {title}")
+                warn(
+                    "missing_headline",
+                    f"Unable to grab a main headline in article: {title}",
+                )
                 continue
 
             headline = headline.text.strip()
@@ -584,8 +578,12 @@ def get_content(soup, title):
                 headline.lower() not in KNOWN_HEADLINES
                 and headline.lower() not in EXCLUDED_HEADLINES
             ):
-                print(f"\nUNKNOWN *HEADLINE*: {headline}\nFOR TITLE: {title}\n")
+                warn(
+                    "unknown_headline",
+                    f"\nUNKNOWN *HEADLINE*: {headline}\nFOR TITLE: {title}\n",
+                )
             cur_headline = headline
+            cur_section = headline
             if cur_headline.lower() in EXCLUDED_HEADLINES:
                 continue
 
@@ -600,7 +598,7 @@ def get_content(soup, title):
         match child.name:
             case "div":
                 if "class" in child.attrs and "tabber" in child["class"]:
-                    output += _parse_tabber(child)
+                    output += _parse_tabber(child, cur_section, _render_table)
                     continue
 
                 for childs_child in child.findChildren(recursive=False):
@@ -617,11 +615,13 @@ def get_content(soup, title):
             case small_header if small_header in ["h3", "h4"]:
                 headline = child.find("span", class_="mw-headline")
                 if not headline:
-                    print(
-                        f"Unable to grab an {child.name} headline in article: {title}"
+                    warn(
+                        "missing_headline",
+                        f"Unable to grab an {child.name} headline in article: {title}",
                     )
                     continue
                 headline = headline.text.strip()
+                cur_section = headline
                 output += f"{headline}\n\n"
 
             case "p":
@@ -629,24 +629,12 @@ def get_content(soup, title):
                 if child.find("span", class_="mwe-math-element"):
                     continue
 
-                # Removes (most) <sup> tags as they just add noise. Keep
+                # Leaves out (most) <sup> tags as they just add noise. Keeps
                 # the ones for numbers (e.g. "2nd", "3rd", "4th") as well
                 # as the one providing disambiguation between floor
                 # numberings depending on the type of English (US vs UK).
-                # TODO(rbnsl): Abstract this out as it appears in multiple
-                # places.
-                sups = child.find_all("sup")
-                for sup in sups:
-                    sup_text = sup.text.strip()
-                    if (
-                        "st" not in sup_text
-                        and "nd" not in sup_text
-                        and "rd" not in sup_text
-                        and "US" not in sup_text
-                        and "UK" not in sup_text
-                    ):
-                        sup.clear()
-                output += f"{child.text.strip()}\n\n"
+                paragraph = get_element_text(child, skip=is_noise_sup).strip()
+                output += f"{paragraph}\n\n"
 
             case "ul":
                 output += _parse_unordered_list(child)
@@ -663,7 +651,7 @@ def get_content(soup, title):
                 # the "Drops" tables in:
                 # https://oldschool.runescape.wiki/w/Zulrah.
                 if "wikitable" in child["class"]:
-                    output += _parse_wikitable(child)
+                    output += _render_table(child, cur_section)
                     continue
                 # "Skill boxes" usually denoting 1+ skill levels required to
                 # do or make something. An example is:
@@ -676,7 +664,7 @@ def get_content(soup, title):
                 # equipment. https://oldschool.runescape.wiki/w/Abyssal_bludgeon
                 # for an example; the infobox bonus table appears near the top.
                 if "infobox" in child["class"] and "infobox-bonuses" in child["class"]:
-                    output += _parse_combat_bonuses(child, title)
+                    output += _parse_combat_bonuses(child, title, warn)
                     continue
 
     return output.strip()
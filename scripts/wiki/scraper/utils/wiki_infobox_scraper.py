@@ -1,7 +1,10 @@
-from bs4 import NavigableString
 from collections import OrderedDict
 from enum import Enum
 
+from utils.element_text import get_element_text
+from utils.scrape_metrics import print_warning
+from utils.text_cleanup import clean_text
+
 
 VALID_COMBAT_STATS_TITLES = set(
     [
@@ -83,7 +86,7 @@ class CombatStatsState(Enum):
     DEFENSIVE_STATS = 3
 
 
-def get_infobox(soup, title):
+def get_infobox(soup, title, warn=print_warning):
     # Although other elements in the page can have the class ".infobox",
     # it's always the case that the first element with ".infobox" is the
     # right-hand side table containing the metadata/information for whatever
@@ -95,7 +98,7 @@ def get_infobox(soup, title):
     # between the two).
     table = soup.find("table", class_="infobox")
     if not table:
-        print(f"No infobox found for article: {title}")
+        warn("no_infobox", f"No infobox found for article: {title}")
         return ""
 
     # TODO(rbnsl): Use lists here instead of non-performant string
@@ -205,9 +208,7 @@ def get_infobox(soup, title):
                     not in VALID_COMBAT_STATS_DATA_ATTRS
                 ):
                     continue
-                combat_stats_value = combat_stats_value.text.strip()
-                combat_stats_value = combat_stats_value.replace("(edit)", "")
-                combat_stats_value = combat_stats_value.replace(" (edit)", "")
+                combat_stats_value = clean_text(combat_stats_value.text)
                 info[cur_combat_stats_headers[i]] = combat_stats_value
 
             # Reset stored combat headers/state appropriately.
@@ -224,33 +225,20 @@ def get_infobox(soup, title):
         if len(cols) < 2:
             continue
 
-        # Some table headers have <br>s; these need to be replaced with
-        # whitespace.
-        for br in cols[0].find_all("br"):
-            br.replace_with(NavigableString(" "))
-
-        row_label = cols[0].text.strip()
+        # Some table headers have <br>s; these are read as whitespace.
+        row_label = get_element_text(cols[0], br=" ").strip()
         if row_label.lower() in EXCLUDED_INFOBOX_LABELS:
             continue
         if row_label.lower() not in KNOWN_INFOBOX_LABELS:
-            print(f"\nUNKNOWN *INFOBOX* LABEL: {row_label}\nFOR TITLE: {title}\n")
+            warn(
+                "unknown_infobox_label",
+                f"\nUNKNOWN *INFOBOX* LABEL: {row_label}\nFOR TITLE: {title}\n",
+            )
 
-        # If a infobox value has a <br>, replace it with a ", ". Example -
+        # If a infobox value has a <br>, it's read as ", ". Example -
         # https://oldschool.runescape.wiki/w/Fermenting_vat (see "Keldagrim"
         # and "Port Phasmatys").
-        for br in cols[1].find_all("br"):
-            br.replace_with(NavigableString(", "))
-
-        row_content = (
-            cols[1]
-            .text.strip()
-            .replace(" (edit)", "")
-            .replace("(edit)", "")
-            .replace(" (info)", "")
-            .replace("(info)", "")
-            .replace("(Update)", "")
-            .replace(" (Update)", "")
-        )
+        row_content = clean_text(get_element_text(cols[1], br=", "))
 
         # Specifically handles scraping "Attack speed" data (it's an image)
         # in most articles.
@@ -0,0 +1,201 @@
+import json
+import os
+
+
+# How tables are rendered into summaries:
+#   - "compact": the headers once, then one delimited line per row (tables
+#     with a single row are rendered as "rows").
+#   - "rows": every cell labelled with its header ("Header: cell, ..."), as
+#     summaries were originally written. Drop tables with hundreds of rows
+#     repeat every header hundreds of times this way.
+COMPACT = "compact"
+ROWS = "rows"
+TABLE_FORMATS = [COMPACT, ROWS]
+# Separates headers and cells in compact tables. Cells already use " / " and
+# ", " within themselves.
+COMPACT_DELIMITER = " | "
+# Extension of the sidecar files a page's tables are stored in.
+TABLES_FILE_EXTENSION = ".json"
+# Kinds of lookup tables, whose rows are structured data (which item comes
+# from which source) best answered from the table store rather than from
+# summaries. The table store reads them, and the columns `classify_table`
+# finds, from the sidecars rather than interpreting tables itself.
+DROPS = "drops"
+SHOPS = "shops"
+# Lookup tables with at least this many rows are offloaded: summaries only
+# list their items (or sources), and the rows live in the table store. Below
+# this, the note saying so costs about as much as the rows it replaces.
+OFFLOAD_MIN_ROWS = 4
+
+
+def _find_column(headers, *names):
+    """Returns the index of the first header starting with any of `names`."""
+    for i, header in enumerate(headers):
+        if header.lower().startswith(names):
+            return i
+    return None
+
+
+def classify_table(headers):
+    """Works out from its headers whether a table is a lookup table.
+
+    Drop tables (e.g. "Item | Quantity | Rarity" on monster pages, or "Source
+    | Level | Quantity | Rarity" on item pages) and shop tables (e.g. "Item |
+    Number in stock | Price sold at" on shop pages, or "Seller | Location |
+    Price sold at" on item pages) are lookup tables.
+
+    Returns:
+        dict: The table's kind (`DROPS` or `SHOPS`), whether its rows are
+            named by "item" or "source" (the page being the other side of
+            each row) and that column's index, and the indices of its
+            "quantity", "rarity" and "price" columns (None for those it
+            lacks). None if the table isn't a lookup table.
+    """
+    lowered = [header.lower() for header in headers]
+    lookup = None
+    if "rarity" in lowered:
+        item = _find_column(headers, "item")
+        source = _find_column(headers, "source")
+        if item is not None:
+            lookup = {"kind": DROPS, "subject": "item", "column": item}
+        elif source is not None:
+            lookup = {"kind": DROPS, "subject": "source", "column": source}
+    if lookup is None and any(
+        header.startswith(("number in stock", "stock")) for header in lowered
+    ):
+        item = _find_column(headers, "item")
+        if item is not None:
+            lookup = {"kind": SHOPS, "subject": "item", "column": item}
+    if lookup is None:
+        seller = _find_column(headers, "seller", "shop")
+        if seller is not None and _find_column(headers, "price") is not None:
+            lookup = {"kind": SHOPS, "subject": "source", "column": seller}
+    if lookup is None:
+        return None
+    lookup["quantity"] = _find_column(headers, "quantity", "number in stock", "stock")
+    lookup["rarity"] = _find_column(headers, "rarity")
+    lookup["price"] = _find_column(headers, "price", "ge price")
+    return lookup
+
+
+class WikiTable:
+    """A wikitable extracted into columns: its headers and its rows' cells.
+
+    Rows have one cell per header; missing cells are empty and cells beyond
+    the last header are dropped. Tables without headers keep their rows as
+    they are.
+    """
+
+    def __init__(self, headers, rows, section=""):
+        self.headers = headers
+        if headers:
+            rows = [
+                row[: len(headers)] + [""] * (len(headers) - len(row)) for row in rows
+            ]
+        self.rows = rows
+        # The headline (or tab) the table appears under, e.g. "Drops".
+        self.section = section
+        self.lookup = classify_table(headers)
+
+    @property
+    def offloaded(self):
+        """Whether the table's rows belong in the table store, not summaries."""
+        return self.lookup is not None and len(self.rows) >= OFFLOAD_MIN_ROWS
+
+    def render(self, table_format=COMPACT, offload=False):
+        if offload and self.offloaded:
+            return self.render_offloaded()
+        if table_format == ROWS:
+            return self.render_rows()
+        return self.render_compact()
+
+    def render_offloaded(self):
+        """Lists just the names in the table's subject column.
+
+        The names keep the summary retrievable for them; the remaining
+        columns are answered from the table store.
+        """
+        column = self.lookup["column"]
+        names = [row[column] for row in self.rows if row[column]]
+        other_headers = [h for i, h in enumerate(self.headers) if i != column]
+        return (
+            f"{self.headers[column]}: {', '.join(names)}\n"
+            f"({', '.join(other_headers)} for these {len(self.rows)} rows are in "
+            "the table store.)\n\n"
+        )
+
+    def render_compact(self):
+        if not self.rows:
+            return "\n"
+        if len(self.rows) == 1 and self.headers:
+            # A lone row doesn't repeat its headers; labelling its cells reads
+            # better and costs about as much.
+            return self.render_rows()
+        lines = []
+        if self.headers:
+            lines.append(COMPACT_DELIMITER.join(self.headers))
+        for row in self.rows:
+            lines.append(COMPACT_DELIMITER.join(row))
+        return "\n".join(lines) + "\n\n"
+
+    def render_rows(self):
+        output = ""
+        for row in self.rows:
+            output += (
+                ", ".join(
+                    f"{header}: {cell}" for header, cell in zip(self.headers, row)
+                )
+                + "\n"
+            )
+        return output + "\n"
+
+    def to_dict(self):
+        return {
+            "section": self.section,
+            "headers": self.headers,
+            "rows": self.rows,
+            "lookup": self.lookup,
+        }
+
+    @classmethod
+    def from_dict(cls, d):
+        return cls(d["headers"], d["rows"], d.get("section", ""))
+
+
+def get_tables_filename(summary_filename):
+    """Returns the sidecar filename for a summary, e.g. 'Zulrah.json'."""
+    return summary_filename[: -len(".txt")] + TABLES_FILE_EXTENSION
+
+
+def write_tables(tables_dir, summary_filename, title, tables):
+    """Writes a page's tables to its sidecar file in `tables_dir`.
+
+    Pages without tables get no sidecar; a stale one from an earlier scrape
+    is removed.
+    """
+    path = os.path.join(tables_dir, get_tables_filename(summary_filename))
+    if not tables:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        return
+    os.makedirs(tables_dir, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(
+            {
+                "id": summary_filename,
+                "title": title,
+                "tables": [table.to_dict() for table in tables],
+            },
+            f,
+            ensure_ascii=False,
+        )
+
+
+def read_tables(path):
+    """Reads a sidecar file, returning (summary filename, title, tables)."""
+    with open(path, encoding="utf-8") as f:
+        record = json.load(f)
+    tables = [WikiTable.from_dict(table) for table in record["tables"]]
+    return record["id"], record["title"], tables
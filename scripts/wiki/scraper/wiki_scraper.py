@@ -1,22 +1,42 @@
+import argparse
+import json
+import multiprocessing
 import os
 import requests
-import sys
+import time
 
 from bs4 import BeautifulSoup
 
+from utils.run_journal import DONE, IN_PROGRESS, PENDING, Heartbeat, RunJournal
+from utils.scrape_metrics import ScrapeMetrics, print_warning
+from utils.slug_manifest import SlugManifest, compile_patterns
+from utils.wiki_alias_scraper import get_aliases
 from utils.wiki_content_scraper import get_content
 from utils.wiki_infobox_scraper import get_infobox
+from utils.wiki_tables import get_tables_filename, write_tables
 
 
 OSRS_WIKI_URL_BASE = "https://oldschool.runescape.wiki"
 SLUGS_DEV_FILE = "test_slugs.txt"
+ALIASES_FILE = "aliases.jsonl"
+ALIASES_DEV_FILE = "test_aliases.jsonl"
+# Written by the category crawler's delta crawl (under slugs/).
+SLUGS_DELTA_FILE = "delta.json"
+# Summaries written and deleted by delta scrapes that the index hasn't been
+# synced with yet.
+SUMMARIES_DELTA_FILE = "summaries_delta.json"
+SUMMARIES_DELTA_DEV_FILE = "test_summaries_delta.json"
+# Positional modes: "dev" scrapes only the test slugs, "norescan" skips
+# articles that already have a summary.
+SCRAPE_MODES = ["dev", "norescan"]
+# Slugs containing any of these (case-insensitively) are never scraped.
 PROBLEM_PAGES = [
     "calc",
     "screenshots",
     "user:",
 ]
-# This is just for dev purposes. It allows for only scraping specific
-# categories. If you _don't_ want to scrape a category, comment it out.
+PROBLEM_PAGES_PATTERN = compile_patterns(PROBLEM_PAGES, literal=True)
+# The categories scraped by default. Use --categories to scrape others.
 SCRAPE_CATEGORIES = [
     "Combat",
     "Combat Achievements",
@@ -34,14 +54,32 @@ SCRAPE_CATEGORIES = [
     "Races",
     "Items",
 ]
-
-
-def get_slugs(dev: bool = False):
+# How long a journal worker waits before checking again for slugs to claim,
+# when the only unfinished slugs are leased to other workers.
+QUEUE_POLL_INTERVAL_SECONDS = 5
+# How often a coordinator prints the journal's progress.
+COORDINATOR_REPORT_INTERVAL_SECONDS = 30
+
+
+def get_slugs(
+    dev: bool = False,
+    categories=SCRAPE_CATEGORIES,
+    include=None,
+    exclude=PROBLEM_PAGES_PATTERN,
+):
     """Extracts slugs from the 'slugs' directory.
 
+    Slugs are read from the directory's manifest (see `SlugManifest`), which
+    is only rebuilt when a slug file changes.
+
     Args:
         dev (bool): If True, only returns the slugs from the 'test_slugs.txt'
             file.
+        categories (Iterable[str]): The categories to return slugs for, or
+            None for every category. Defaults to `SCRAPE_CATEGORIES`.
+        include (re.Pattern): If given, only slugs matching it are returned.
+        exclude (re.Pattern): Slugs matching it are skipped. Defaults to
+            skipping `PROBLEM_PAGES`.
 
     Returns:
         set: A set of all slugs.
@@ -50,38 +88,142 @@ def get_slugs(dev: bool = False):
         FileNotFoundError: If the 'slugs' directory or 'test_slugs.txt' file is
             not found.
     """
-    slugs = []
     current_dir = os.path.dirname(os.path.abspath(__file__))
     three_dirs_up = os.path.join(current_dir, "..", "..", "..")
     slugs_dir = os.path.join(three_dirs_up, "slugs")
 
     if dev:
+        slugs = []
         filename = os.path.join(three_dirs_up, SLUGS_DEV_FILE)
         with open(filename) as file:
             for line in file:
                 slugs.append(line.strip())
         return slugs
 
-    for filename in os.listdir(slugs_dir):
-        if not filename.endswith(".txt"):
-            continue
+    return SlugManifest(slugs_dir).select(categories, include, exclude)
+
+
+def get_summary_filename(slug: str) -> str:
+    """Returns the filename of a slug's summary, e.g. 'Zulrah's_scales.txt'."""
+    return slug[3:].replace("/", "|").replace("%27", "'") + ".txt"
+
+
+def get_summaries_dir(dev: bool) -> str:
+    current_dir = os.path.dirname(os.path.abspath(__file__))
+    three_dirs_up = os.path.join(current_dir, "..", "..", "..")
+    return os.path.join(three_dirs_up, "test_summaries" if dev else "summaries")
+
+
+def get_tables_dir(dev: bool) -> str:
+    """Returns the directory pages' tables are stored in as sidecar data."""
+    current_dir = os.path.dirname(os.path.abspath(__file__))
+    three_dirs_up = os.path.join(current_dir, "..", "..", "..")
+    return os.path.join(three_dirs_up, "test_tables" if dev else "tables")
+
+
+def get_delta_slugs(
+    categories=SCRAPE_CATEGORIES, include=None, exclude=PROBLEM_PAGES_PATTERN
+):
+    """Reads the slugs added and removed since the last delta scrape.
+
+    Slugs are selected by category and pattern as in `get_slugs`.
 
-        if filename.replace(".txt", "") not in SCRAPE_CATEGORIES:
+    Returns:
+        Tuple[Set[str], Set[str]]: The added and removed slugs.
+    """
+    current_dir = os.path.dirname(os.path.abspath(__file__))
+    three_dirs_up = os.path.join(current_dir, "..", "..", "..")
+    try:
+        with open(os.path.join(three_dirs_up, "slugs", SLUGS_DELTA_FILE)) as f:
+            delta = json.load(f)
+    except FileNotFoundError:
+        return set(), set()
+
+    added, removed = set(), set()
+    for category, changes in delta.items():
+        if categories is None or category in categories:
+            added.update(changes["added"])
+            removed.update(changes["removed"])
+    selected = set()
+    for slug in added | removed:
+        if include is not None and not include.search(slug):
             continue
+        if exclude is not None and exclude.search(slug):
+            continue
+        selected.add(slug)
+    return added & selected, (removed - added) & selected
 
-        with open(os.path.join(slugs_dir, filename), "r") as file:
-            for line in file:
-                # Hacky way of skipping specific problem-pages.
-                should_skip_slug = False
-                for problem_page in PROBLEM_PAGES:
-                    if problem_page in line.lower():
-                        should_skip_slug = True
-                        break
-                if should_skip_slug:
-                    continue
-                slugs.append(line.strip())
 
-    return set(slugs)
+def consume_slugs_delta(dev: bool, added, removed, unfinished=()):
+    """Marks the crawler's delta as scraped and records it for index syncing.
+
+    Summaries of removed slugs are deleted, and the upserted and removed
+    summary filenames are merged into the summaries delta file, which is what
+    `ChromaCollectionClient.sync` is fed with.
+
+    Args:
+        dev (bool): Whether this is a dev run.
+        added (Iterable[str]): The slugs that were scraped.
+        removed (Iterable[str]): The slugs removed from the wiki.
+        unfinished (Iterable[str]): Added slugs that weren't scraped, e.g.
+            because they failed. They're left in the crawler's delta, so the
+            next delta scrape picks them up again.
+    """
+    summaries_dir = get_summaries_dir(dev)
+    tables_dir = get_tables_dir(dev)
+    for slug in removed:
+        filename = get_summary_filename(slug)
+        for path in [
+            os.path.join(summaries_dir, filename),
+            os.path.join(tables_dir, get_tables_filename(filename)),
+        ]:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    current_dir = os.path.dirname(os.path.abspath(__file__))
+    three_dirs_up = os.path.join(current_dir, "..", "..", "..")
+    path = os.path.join(
+        three_dirs_up, SUMMARIES_DELTA_DEV_FILE if dev else SUMMARIES_DELTA_FILE
+    )
+    try:
+        with open(path) as f:
+            pending = json.load(f)
+    except FileNotFoundError:
+        pending = {"upserted": [], "removed": []}
+    upserted = {get_summary_filename(slug) for slug in added}
+    deleted = {get_summary_filename(slug) for slug in removed}
+    pending["upserted"] = sorted((set(pending["upserted"]) - deleted) | upserted)
+    pending["removed"] = sorted((set(pending["removed"]) - upserted) | deleted)
+    with open(path + ".tmp", "w") as f:
+        json.dump(pending, f, indent=2)
+    os.replace(path + ".tmp", path)
+
+    slugs_delta_path = os.path.join(three_dirs_up, "slugs", SLUGS_DELTA_FILE)
+    unfinished = set(unfinished)
+    if unfinished:
+        try:
+            with open(slugs_delta_path) as f:
+                delta = json.load(f)
+        except FileNotFoundError:
+            delta = {}
+        remaining = {}
+        for category, changes in delta.items():
+            category_unfinished = unfinished.intersection(changes["added"])
+            if category_unfinished:
+                remaining[category] = {
+                    "added": sorted(category_unfinished),
+                    "removed": [],
+                }
+        with open(slugs_delta_path + ".tmp", "w") as f:
+            json.dump(remaining, f, indent=2)
+        os.replace(slugs_delta_path + ".tmp", slugs_delta_path)
+    else:
+        try:
+            os.remove(slugs_delta_path)
+        except FileNotFoundError:
+            pass
 
 
 def get_scanned_slugs(dev: bool = False):
@@ -120,7 +262,9 @@ def get_scanned_slugs(dev: bool = False):
     return scanned_slugs
 
 
-def generate_article_summary(dev: bool, slug: str, slug_number: int):
+def generate_article_summary(
+    dev: bool, slug: str, slug_number: int, metrics: ScrapeMetrics = None
+):
     """Generate a summary of an article.
 
     Scraping any article is broken down into 3 sections:
@@ -128,10 +272,22 @@ def generate_article_summary(dev: bool, slug: str, slug_number: int):
         2. The article's infobox (right-hand side metadata/information)
         3. The article's core content
 
+    The article's wikitables are rendered compactly into the summary, and
+    also stored column by column in a sidecar file under tables/ (see
+    `write_tables`). Large drop and shop tables are only listed by item in
+    the summary; their rows are served from the table store built from the
+    sidecars.
+
+    Every name the article goes by (title, slug, redirects and infobox "AKA"
+    names) is also appended to the aliases file, keyed by the summary's
+    filename, so that queries naming the article can be resolved directly.
+
     Args:
         slug (str): The slug of the article.
         slug_number (int): The number of the slug. Purely for dev purposes (for
             seeing how many articles have been scraped).
+        metrics (ScrapeMetrics): Where the page's per-stage timings, sizes and
+            warnings are recorded. Warnings are printed if not given.
 
     Returns:
         None
@@ -140,21 +296,36 @@ def generate_article_summary(dev: bool, slug: str, slug_number: int):
     def _get_title():
         title = soup.find("h1", id="firstHeading")
         if not title:
-            print(f"No title found for slug: {slug}")
+            warn("no_title", f"No title found for slug: {slug}")
             return None
         return title.text.strip()
 
+    warn = print_warning
+    if metrics is None:
+        metrics = ScrapeMetrics()
+    else:
+        warn = metrics.warn
+    page = metrics.start_page(slug)
+
     url = OSRS_WIKI_URL_BASE + slug
-    res = requests.get(url)
+    with metrics.span(page, "fetch"):
+        res = requests.get(url)
+        res.raise_for_status()
+    page.bytes["html"] = len(res.content)
 
-    soup = BeautifulSoup(res.content, "html.parser")
+    with metrics.span(page, "parse"):
+        soup = BeautifulSoup(res.content, "html.parser")
 
     title = _get_title()
     if not title:
         title = slug[3:]
+    page.title = title
     print(f"{slug_number}: {title} in progress...")
-    infobox = get_infobox(soup, title)
-    content = get_content(soup, title)
+    with metrics.span(page, "infobox"):
+        infobox = get_infobox(soup, title, warn)
+    tables = []
+    with metrics.span(page, "content"):
+        content = get_content(soup, title, warn, tables=tables, offload=True)
 
     summary = f"{title}\n\n{infobox}\n{content}"
     # Creates the summaries/ directory at the root of the project if it doesn't
@@ -163,32 +334,314 @@ def generate_article_summary(dev: bool, slug: str, slug_number: int):
     # within the summaries/ directory.
     current_dir = os.path.dirname(os.path.abspath(__file__))
     three_dirs_up = os.path.join(current_dir, "..", "..", "..")
-    if dev:
-        summaries_dir = os.path.join(three_dirs_up, "test_summaries")
-    else:
-        summaries_dir = os.path.join(three_dirs_up, "summaries")
+    summaries_dir = get_summaries_dir(dev)
     os.makedirs(summaries_dir, exist_ok=True)
-    filename = slug[3:].replace("/", "|").replace("%27", "'") + ".txt"
-    filename = os.path.join(summaries_dir, filename)
-    with open(filename, "w", encoding="utf-8") as f:
-        f.write(summary)
+    filename = get_summary_filename(slug)
+    encoded_summary = summary.encode("utf-8")
+    page.bytes["summary"] = len(encoded_summary)
+    with metrics.span(page, "write"):
+        with open(os.path.join(summaries_dir, filename), "wb") as f:
+            f.write(encoded_summary)
+        write_tables(get_tables_dir(dev), filename, title, tables)
+
+        # Rescans append a fresh line rather than rewriting the file; the last
+        # line for a given filename wins when the aliases are loaded.
+        aliases_filename = ALIASES_DEV_FILE if dev else ALIASES_FILE
+        with open(
+            os.path.join(three_dirs_up, aliases_filename), "a", encoding="utf-8"
+        ) as f:
+            record = {"id": filename, "aliases": get_aliases(soup, title, slug)}
+            f.write(json.dumps(record) + "\n")
+
+
+def scrape_from_journal(
+    dev: bool, journal_path: str, metrics: ScrapeMetrics = None, wal: bool = False
+):
+    """Scrapes slugs claimed from a run journal until every slug is finished.
+
+    Any number of processes, on any number of hosts sharing the journal, can
+    call this at once; each slug is leased to one of them at a time. A slug
+    whose scrape raises is marked as failed (with the error) rather than
+    stopping the run. Once nothing is left to claim, this keeps polling while
+    other workers still hold slugs, so that a dead worker's slugs are picked
+    up when their leases expire.
+
+    Args:
+        dev (bool): Whether summaries are written to test_summaries/.
+        journal_path (str): The path of the run journal.
+        metrics (ScrapeMetrics): Where per-page metrics are recorded. A new
+            collector is created if not given.
+        wal (bool): Whether the journal uses SQLite's write-ahead log (see
+            `RunJournal`).
+
+    Returns:
+        ScrapeMetrics: The metrics recorded by this call.
+    """
+    if metrics is None:
+        metrics = ScrapeMetrics()
+    journal = RunJournal(journal_path, wal=wal)
+    num_scraped = 0
+    try:
+        with Heartbeat(journal):
+            while True:
+                slug = journal.claim()
+                if slug is None:
+                    if journal.counts()[IN_PROGRESS] == 0:
+                        break
+                    time.sleep(QUEUE_POLL_INTERVAL_SECONDS)
+                    continue
+                try:
+                    generate_article_summary(dev, slug, num_scraped, metrics)
+                except Exception as e:
+                    print(f"Failed to scrape {slug}: {e!r}")
+                    journal.mark_failed(slug, repr(e))
+                else:
+                    journal.mark_done(slug)
+                num_scraped += 1
+    finally:
+        journal.close()
+    return metrics
+
+
+def populate_journal(
+    journal_path: str,
+    slugs,
+    retry_failed: bool,
+    max_attempts: int,
+    requeue: bool = False,
+    wal: bool = False,
+):
+    """Queues a run's slugs in its journal, resuming the run if it exists.
+
+    Slugs not yet in the journal are added as pending, slugs left in progress
+    by a local process that died are released and, if `retry_failed` is set,
+    failed slugs are made pending again. Slugs that are already done are
+    skipped, unless `requeue` is set (e.g. because they changed).
+    """
+    journal = RunJournal(journal_path, wal=wal)
+    num_added = journal.add_slugs(slugs, requeue)
+    num_released = journal.release_dead_claims()
+    num_retried = journal.retry_failed(max_attempts) if retry_failed else 0
+    print(
+        f"Journal {journal_path}: {num_added} new slugs, {num_released} released "
+        f"from dead workers, {num_retried} failures to retry; {journal.counts()}"
+    )
+    journal.close()
+
+
+def work_journal(
+    dev: bool,
+    journal_path: str,
+    num_workers: int,
+    metrics: ScrapeMetrics,
+    wal: bool = False,
+):
+    """Scrapes slugs from a journal with `num_workers` local processes."""
+    if num_workers > 1:
+        with multiprocessing.Pool(num_workers) as pool:
+            for worker_metrics in pool.starmap(
+                scrape_from_journal,
+                [(dev, journal_path, None, wal)] * num_workers,
+            ):
+                metrics.merge(worker_metrics)
+    else:
+        scrape_from_journal(dev, journal_path, metrics, wal)
+
+
+def wait_for_journal(journal_path: str, wal: bool = False):
+    """Reports a journal's progress until every slug is finished."""
+    journal = RunJournal(journal_path, wal=wal)
+    try:
+        while True:
+            counts = journal.counts()
+            print(f"Journal {journal_path}: {counts}")
+            if counts[PENDING] == 0 and counts[IN_PROGRESS] == 0:
+                break
+            time.sleep(COORDINATOR_REPORT_INTERVAL_SECONDS)
+    finally:
+        journal.close()
+
+
+def report_journal(journal_path: str, wal: bool = False):
+    journal = RunJournal(journal_path, wal=wal)
+    print(f"Journal {journal_path}: {journal.counts()}")
+    for slug, attempts, last_error in journal.failures():
+        print(f"  {slug} failed after {attempts} attempt(s): {last_error}")
+    journal.close()
 
 
 def main():
-    # TODO(rbnsl): Clean up this arg parsing logic.
-    args = sys.argv[1:]
-    dev, rescan = False, True
-    if len(args) > 0 and args[0] == "dev":
-        dev = True
-    if len(args) > 1 and args[1] == "norescan":
-        rescan = False
-    all_slugs = get_slugs(dev)
-    scanned_slugs = get_scanned_slugs(dev)
-    for i, slug in enumerate(all_slugs):
-        if not rescan and slug in scanned_slugs:
-            continue
+    parser = argparse.ArgumentParser(
+        description="Scrapes OSRS wiki articles into summaries."
+    )
+    parser.add_argument(
+        "modes",
+        nargs="*",
+        help="'dev' scrapes only the test slugs into test_summaries/; "
+        "'norescan' skips articles that already have a summary.",
+    )
+    parser.add_argument(
+        "--metrics-out",
+        help="Write per-page scrape metrics to this file.",
+    )
+    parser.add_argument(
+        "--metrics-format",
+        choices=["jsonl", "prometheus"],
+        default="jsonl",
+        help="The format of the --metrics-out file.",
+    )
+    parser.add_argument(
+        "--journal",
+        help="Record the run in this SQLite journal, resuming it if it exists. "
+        "Slugs already scraped in the journal are skipped.",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="The number of worker processes claiming slugs from the journal.",
+    )
+    parser.add_argument(
+        "--role",
+        choices=["coordinator", "worker"],
+        help="Split a journaled run across processes or hosts sharing the "
+        "journal: the coordinator queues the slugs and reports progress, "
+        "workers scrape them. By default a process does both.",
+    )
+    parser.add_argument(
+        "--journal-wal",
+        action="store_true",
+        help="Use SQLite's write-ahead log for the journal, which is faster "
+        "with many --workers. Only safe if every process using the journal "
+        "runs on this host; never use it for a journal on a shared volume.",
+    )
+    parser.add_argument(
+        "--retry-failed",
+        action="store_true",
+        help="Retry the journal's failed slugs.",
+    )
+    parser.add_argument(
+        "--max-attempts",
+        type=int,
+        help="With --retry-failed, don't retry slugs attempted this many times.",
+    )
+    parser.add_argument(
+        "--categories",
+        nargs="+",
+        metavar="CATEGORY",
+        help="The categories to scrape. Defaults to SCRAPE_CATEGORIES.",
+    )
+    parser.add_argument(
+        "--all-categories",
+        action="store_true",
+        help="Scrape every crawled category.",
+    )
+    parser.add_argument(
+        "--include",
+        action="append",
+        metavar="REGEX",
+        help="Only scrape slugs matching this (case-insensitive) regex. May be "
+        "given more than once.",
+    )
+    parser.add_argument(
+        "--exclude",
+        action="append",
+        metavar="REGEX",
+        help="Also skip slugs matching this (case-insensitive) regex, on top of "
+        "PROBLEM_PAGES. May be given more than once.",
+    )
+    parser.add_argument(
+        "--delta",
+        action="store_true",
+        help="Only scrape slugs the category crawler's last --delta crawl(s) "
+        "added, and delete the summaries of removed slugs.",
+    )
+    args = parser.parse_args()
+    # Checked here rather than with `choices`, which argparse also applies to
+    # the empty default of `nargs="*"` (rejecting a bare run) on Python 3.11.
+    unknown_modes = [mode for mode in args.modes if mode not in SCRAPE_MODES]
+    if unknown_modes:
+        parser.error(
+            f"invalid mode(s): {', '.join(unknown_modes)} "
+            f"(choose from {', '.join(SCRAPE_MODES)})"
+        )
+    if args.journal is None and (
+        args.workers > 1 or args.retry_failed or args.role or args.journal_wal
+    ):
+        parser.error(
+            "--workers, --retry-failed, --role and --journal-wal require --journal"
+        )
+    dev = "dev" in args.modes
+    rescan = "norescan" not in args.modes
+    categories = args.categories or SCRAPE_CATEGORIES
+    if args.all_categories:
+        categories = None
+    include = compile_patterns(args.include)
+    exclude = compile_patterns([PROBLEM_PAGES_PATTERN.pattern] + (args.exclude or []))
+
+    metrics = ScrapeMetrics()
+    if args.role != "worker":
+        if args.delta:
+            all_slugs, removed_slugs = get_delta_slugs(categories, include, exclude)
+            print(
+                f"Delta: {len(all_slugs)} slugs to scrape, "
+                f"{len(removed_slugs)} to remove."
+            )
+        else:
+            all_slugs = get_slugs(dev, categories, include, exclude)
+
+    if args.journal:
+        if args.role != "worker":
+            populate_journal(
+                args.journal,
+                all_slugs,
+                args.retry_failed,
+                args.max_attempts,
+                requeue=args.delta,
+                wal=args.journal_wal,
+            )
+        if args.role == "coordinator":
+            wait_for_journal(args.journal, args.journal_wal)
+        else:
+            work_journal(dev, args.journal, args.workers, metrics, args.journal_wal)
+        report_journal(args.journal, args.journal_wal)
+    else:
+        scanned_slugs = get_scanned_slugs(dev)
+        failed_slugs = set()
+        for i, slug in enumerate(all_slugs):
+            if not rescan and not args.delta and slug in scanned_slugs:
+                continue
 
-        generate_article_summary(dev, slug, i)
+            try:
+                generate_article_summary(dev, slug, i, metrics)
+            except requests.HTTPError as e:
+                # Without a journal to retry it from, a page that can't be
+                # fetched is reported and skipped rather than ending the run.
+                metrics.warn("http_error", f"{slug}: {e}")
+                print(f"{i}: {slug} skipped: {e}")
+                failed_slugs.add(slug)
+
+    if args.delta and args.role != "worker":
+        # Failed slugs stay in the crawler's delta to be retried; consuming
+        # them would sync their stale (or missing) summaries as upserted.
+        if args.journal:
+            journal = RunJournal(args.journal, wal=args.journal_wal)
+            scraped_slugs = all_slugs & journal.slugs_with_status(DONE)
+            journal.close()
+        else:
+            scraped_slugs = all_slugs - failed_slugs
+        consume_slugs_delta(
+            dev, scraped_slugs, removed_slugs, all_slugs - scraped_slugs
+        )
+
+    if args.role == "coordinator":
+        return
+    print(metrics.summary())
+    if args.metrics_out:
+        if args.metrics_format == "prometheus":
+            metrics.write_prometheus(args.metrics_out)
+        else:
+            metrics.write_jsonl(args.metrics_out)
 
 
 if __name__ == "__main__":
@@ -4,56 +4,274 @@ import com.google.gson.Gson;
 import com.google.gson.JsonObject;
 
 import java.io.IOException;
+import java.util.LinkedHashMap;
+import java.util.Map;
+import java.util.concurrent.CompletableFuture;
+import java.util.function.Consumer;
 
+import okhttp3.Call;
+import okhttp3.Callback;
 import okhttp3.HttpUrl;
 import okhttp3.OkHttpClient;
 import okhttp3.Request;
 import okhttp3.RequestBody;
 import okhttp3.Response;
+import okio.BufferedSource;
 
 import static net.runelite.http.api.RuneLiteAPI.JSON;
 
 public class ScapeGptClient {
+    private static final int DEFAULT_CACHE_SIZE = 32;  // Recent answers kept, by prompt
+    private static final String UNKNOWN_ERROR_MESSAGE = "An unknown error occurred. Please try again in 1 minute.";
+
     private final OkHttpClient client;
     private final HttpUrl apiUrl;
+    private final HttpUrl streamUrl;
     private final Gson gson;
+    private final Map<String, String> cache;
+    // The asynchronous request whose answer is being waited on, cancelled when superseded.
+    private CompletableFuture<String> inFlight;
+
+    public ScapeGptClient(OkHttpClient client, HttpUrl apiUrl, HttpUrl streamUrl, Gson gson) {
+        this(client, apiUrl, streamUrl, gson, DEFAULT_CACHE_SIZE);
+    }
 
-    public ScapeGptClient(OkHttpClient client, HttpUrl apiUrl, Gson gson) {
+    public ScapeGptClient(OkHttpClient client, HttpUrl apiUrl, HttpUrl streamUrl, Gson gson, int cacheSize) {
         this.client = client;
         this.apiUrl = apiUrl;
+        this.streamUrl = streamUrl;
         this.gson = gson;
+        this.cache = new LinkedHashMap<String, String>(16, 0.75f, true) {
+            @Override
+            protected boolean removeEldestEntry(Map.Entry<String, String> eldest) {
+                return size() > cacheSize;
+            }
+        };
     }
 
     public String getResponse(String prompt) {
+        String cached = getCached(prompt);
+        if (cached != null) {
+            return cached;
+        }
+
+        Request request = buildRequest(apiUrl, prompt);
+
+        try (Response response = client.newCall(request).execute()) {
+            return putCached(prompt, readResponse(response));
+        } catch (Exception e) {
+            return getErrorMessage(e);
+        }
+    }
+
+    /**
+     * Asks for the answer to a prompt without blocking the calling thread. The request is
+     * enqueued on OkHttp's dispatcher, and any request still in flight from an earlier call
+     * to an async method is cancelled, since its answer would no longer be shown.
+     *
+     * @return a future completed with the trimmed answer (or an error message to show
+     * instead); it's cancelled if superseded, and cancelling it cancels the request
+     */
+    public CompletableFuture<String> getResponseAsync(String prompt) {
+        return enqueue(prompt, apiUrl, this::readResponse);
+    }
+
+    /**
+     * Streams the answer to a prompt, passing each piece to onToken as soon as it arrives.
+     * The answer is sent by the server as server-sent events: one "data" event per piece,
+     * then a "done" event (or an "error" event if the answer couldn't be completed). Only
+     * answers ended by a "done" event are cached.
+     *
+     * @return the complete, trimmed answer, or an error message to show instead
+     */
+    public String streamResponse(String prompt, Consumer<String> onToken) {
+        String cached = getCached(prompt);
+        if (cached != null) {
+            onToken.accept(cached);
+            return cached;
+        }
+
+        Request request = buildRequest(streamUrl, prompt);
+
+        try (Response response = client.newCall(request).execute()) {
+            return putCached(prompt, readStream(response, onToken));
+        } catch (Exception e) {
+            return getErrorMessage(e);
+        }
+    }
+
+    /**
+     * The asynchronous version of streamResponse: onToken is called on OkHttp's dispatcher
+     * thread, and superseded requests are cancelled as with getResponseAsync.
+     */
+    public CompletableFuture<String> streamResponseAsync(String prompt, Consumer<String> onToken) {
+        return enqueue(prompt, streamUrl, response -> readStream(response, onToken));
+    }
+
+    private CompletableFuture<String> enqueue(String prompt, HttpUrl url, ResponseReader reader) {
+        CompletableFuture<String> future = new CompletableFuture<>();
+        supersede(future);
+
+        // Repeated questions are answered without a request, so they don't count against the quota.
+        String cached = getCached(prompt);
+        if (cached != null) {
+            future.complete(cached);
+            return future;
+        }
+
+        Call call = client.newCall(buildRequest(url, prompt));
+        future.whenComplete((answer, e) -> {
+            if (future.isCancelled()) {
+                call.cancel();
+            }
+        });
+        call.enqueue(new Callback() {
+            @Override
+            public void onFailure(Call call, IOException e) {
+                if (!call.isCanceled()) {
+                    future.complete(getErrorMessage(e));
+                }
+            }
+
+            @Override
+            public void onResponse(Call call, Response response) {
+                try (Response r = response) {
+                    future.complete(putCached(prompt, reader.read(r)));
+                } catch (Exception e) {
+                    if (!call.isCanceled()) {
+                        future.complete(getErrorMessage(e));
+                    }
+                }
+            }
+        });
+        return future;
+    }
+
+    private synchronized void supersede(CompletableFuture<String> future) {
+        if (inFlight != null) {
+            inFlight.cancel(false);
+        }
+        inFlight = future;
+    }
+
+    private String readResponse(Response response) throws Exception {
+        if (!response.isSuccessful()) throw new Exception("Unexpected code " + response);
+
+        String jsonData = response.body().string();
+        JsonObject json = gson.newBuilder().create().fromJson(jsonData, JsonObject.class);
+        return json.get("res").getAsString().trim();
+    }
+
+    private String readStream(Response response, Consumer<String> onToken) throws Exception {
+        if (!response.isSuccessful()) throw new Exception("Unexpected code " + response);
+
+        StringBuilder answer = new StringBuilder();
+        BufferedSource source = response.body().source();
+        String event = "message";
+        String line;
+        while ((line = source.readUtf8Line()) != null) {
+            if (line.isEmpty()) {
+                // A blank line ends the current event.
+                event = "message";
+                continue;
+            }
+            if (line.startsWith("event: ")) {
+                event = line.substring("event: ".length());
+                continue;
+            }
+            if (!line.startsWith("data: ")) {
+                continue;
+            }
+
+            JsonObject data = gson.fromJson(line.substring("data: ".length()), JsonObject.class);
+            if (event.equals("done")) {
+                return answer.toString().trim();
+            }
+            if (event.equals("error")) {
+                throw new ServerErrorException(data.get("error").getAsString());
+            }
+
+            String token = data.get("token").getAsString();
+            // Mirrors the trim() of blocking responses for the start of the answer.
+            if (answer.length() == 0) {
+                token = token.replaceAll("^\\s+", "");
+                if (token.isEmpty()) {
+                    continue;
+                }
+            }
+            answer.append(token);
+            onToken.accept(token);
+        }
+        // Without a "done" event the connection dropped mid-answer; the partial answer mustn't be
+        // cached as if it were complete.
+        throw new IOException("The answer stream ended before the answer was complete");
+    }
+
+    /**
+     * Prompts differing only in case, whitespace or trailing punctuation share an answer, as
+     * they do on the server.
+     */
+    private static String cacheKey(String prompt) {
+        return prompt.toLowerCase().trim().replaceAll("\\s+", " ").replaceAll("[?!. ]+$", "");
+    }
+
+    private String getCached(String prompt) {
+        synchronized (cache) {
+            return cache.get(cacheKey(prompt));
+        }
+    }
+
+    private String putCached(String prompt, String answer) {
+        // Empty answers are more likely a hiccup than the answer, so they're asked again.
+        if (!answer.isEmpty()) {
+            synchronized (cache) {
+                cache.put(cacheKey(prompt), answer);
+            }
+        }
+        return answer;
+    }
+
+    private Request buildRequest(HttpUrl url, String prompt) {
         Request.Builder builder = new Request.Builder();
 
         JsonObject jsonObject = new JsonObject();
         jsonObject.addProperty("prompt", prompt);
 
-        Request request = builder
+        return builder
                 .post(RequestBody.create(JSON, gson.toJson(jsonObject)))
-                .url(apiUrl)
+                .url(url)
                 .build();
+    }
 
-        try {
-            Response response = client.newCall(request).execute();
-            if (!response.isSuccessful()) throw new Exception("Unexpected code " + response);
-
-            String jsonData = response.body().string();
-            JsonObject json = gson.newBuilder().create().fromJson(jsonData, JsonObject.class);
-            return json.get("res").getAsString().trim();
-        } catch (IOException e) {
-            String errorMessage = e.getMessage();
+    private String getErrorMessage(Exception e) {
+        String errorMessage = e.getMessage();
+        if (e instanceof ServerErrorException) {
+            // Already meant to be shown.
+            return errorMessage;
+        }
+        if (e instanceof IOException) {
             System.err.println("Error making request: " + errorMessage);
-            return "An unknown error occurred. Please try again in 1 minute.";
-        } catch (Exception e) {
-            String errorMessage = e.getMessage();
-            System.err.println("Unexpected error: " + errorMessage);
-            if (errorMessage.contains("code=429")) {
-                return "Too many requests! There is a limit of 3 queries per minute, and 20 queries per day.";
-            } else {
-                return "An unknown error occurred. Please try again in 1 minute.";
-            }
+            return UNKNOWN_ERROR_MESSAGE;
+        }
+
+        System.err.println("Unexpected error: " + errorMessage);
+        if (errorMessage != null && errorMessage.contains("code=429")) {
+            return "Too many requests! There is a limit of 3 queries per minute, and 20 queries per day.";
+        } else {
+            return UNKNOWN_ERROR_MESSAGE;
+        }
+    }
+
+    private interface ResponseReader {
+        String read(Response response) throws Exception;
+    }
+
+    /**
+     * An error the server reported in the middle of a streamed answer, with a message for the user.
+     */
+    private static class ServerErrorException extends Exception {
+        ServerErrorException(String message) {
+            super(message);
         }
     }
 }
@@ -14,6 +14,7 @@ import javax.swing.JLabel;
 import javax.swing.JPanel;
 import javax.swing.JScrollPane;
 import javax.swing.JTextArea;
+import javax.swing.SwingUtilities;
 import javax.swing.border.EmptyBorder;
 import javax.swing.text.BadLocationException;
 import javax.swing.text.Document;
@@ -32,6 +33,7 @@ class ScapeGptPanel extends PluginPanel {
     private final JTextArea responseArea = new JTextArea();
 
     private String prompt = "";
+    private int submissions = 0;
     private ScapeGptClient scapeGptClient;
 
     void init(ScapeGptClient client) {
@@ -101,12 +103,35 @@ class ScapeGptPanel extends PluginPanel {
             @Override
             public void keyPressed(KeyEvent e) {
                 if (e.getKeyCode() == KeyEvent.VK_ENTER && e.isShiftDown()) {
-                    responseArea.setText(scapeGptClient.getResponse(prompt));
+                    submitPrompt(prompt);
                 }
             }
         });
     }
 
+    /**
+     * Streams the answer to a prompt into the response area without blocking the Swing event
+     * thread, so the panel stays responsive and the answer appears as it's generated. A prompt
+     * submitted before the previous one is answered supersedes it.
+     */
+    private void submitPrompt(String submittedPrompt) {
+        responseArea.setText("");
+        // Only touched on the Swing event thread, so pieces of superseded answers are dropped.
+        final int submission = ++submissions;
+        scapeGptClient.streamResponseAsync(submittedPrompt,
+                token -> SwingUtilities.invokeLater(() -> {
+                    if (submission == submissions) {
+                        responseArea.append(token);
+                    }
+                }))
+                .thenAccept(answer -> SwingUtilities.invokeLater(() -> {
+                    // Replaces the streamed text with the trimmed answer (or an error message).
+                    if (submission == submissions) {
+                        responseArea.setText(answer);
+                    }
+                }));
+    }
+
     private void addPromptInputFieldDocumentListener() {
         promptInputField.getDocument().addDocumentListener(new DocumentListener() {
             @Override
@@ -22,6 +22,7 @@ import okhttp3.OkHttpClient;
 public class ScapeGptPlugin extends Plugin {
     private static final String HOST = "44.211.86.102";  // Server IP address that handles requests
     private static final String ENDPOINT = "api/v1/query";
+    private static final String STREAM_ENDPOINT = "api/v1/query/stream";
     private static final String LOGO = "scapegpt-icon.png";
     private static final int HTTP_TIMEOUT_SECONDS = 45;  // Both connection and waiting for response
     @Inject
@@ -36,11 +37,13 @@ public class ScapeGptPlugin extends Plugin {
     private ScapeGptPanel panel;
     private NavigationButton navButton;
     private HttpUrl apiUrl;
+    private HttpUrl streamUrl;
 
     @Override
     protected void startUp() {
         apiUrl = new HttpUrl.Builder().scheme("http").host(HOST).addPathSegments(ENDPOINT).build();
-        scapeGptClient = new ScapeGptClient(httpClient.newBuilder().connectTimeout(HTTP_TIMEOUT_SECONDS, TimeUnit.SECONDS).readTimeout(HTTP_TIMEOUT_SECONDS, TimeUnit.SECONDS).build(), apiUrl, gson);
+        streamUrl = new HttpUrl.Builder().scheme("http").host(HOST).addPathSegments(STREAM_ENDPOINT).build();
+        scapeGptClient = new ScapeGptClient(httpClient.newBuilder().connectTimeout(HTTP_TIMEOUT_SECONDS, TimeUnit.SECONDS).readTimeout(HTTP_TIMEOUT_SECONDS, TimeUnit.SECONDS).build(), apiUrl, streamUrl, gson);
 
         panel = injector.getInstance(ScapeGptPanel.class);
         panel.init(scapeGptClient);
@@ -0,0 +1,171 @@
+package com.rohanbansal;
+
+import com.google.gson.Gson;
+
+import java.util.ArrayList;
+import java.util.List;
+import java.util.concurrent.CompletableFuture;
+import java.util.concurrent.TimeUnit;
+
+import okhttp3.Call;
+import okhttp3.OkHttpClient;
+import okhttp3.mockwebserver.MockResponse;
+import okhttp3.mockwebserver.MockWebServer;
+import okhttp3.mockwebserver.SocketPolicy;
+import org.junit.After;
+import org.junit.Before;
+import org.junit.Test;
+
+import static org.junit.Assert.assertEquals;
+import static org.junit.Assert.assertNotNull;
+import static org.junit.Assert.assertTrue;
+
+public class ScapeGptClientTest {
+    private static final String UNKNOWN_ERROR_MESSAGE = "An unknown error occurred. Please try again in 1 minute.";
+
+    private MockWebServer server;
+    private OkHttpClient okHttpClient;
+
+    @Before
+    public void setUp() throws Exception {
+        server = new MockWebServer();
+        server.start();
+        okHttpClient = new OkHttpClient();
+    }
+
+    @After
+    public void tearDown() throws Exception {
+        okHttpClient.dispatcher().cancelAll();
+        server.shutdown();
+    }
+
+    private ScapeGptClient newClient(int cacheSize) {
+        return new ScapeGptClient(okHttpClient, server.url("/api"), server.url("/stream"), new Gson(), cacheSize);
+    }
+
+    private static MockResponse answer(String res) {
+        return new MockResponse().setBody("{\"res\": \"" + res + "\"}");
+    }
+
+    private static MockResponse events(String... events) {
+        return new MockResponse()
+                .setHeader("Content-Type", "text/event-stream")
+                .setBody(String.join("", events));
+    }
+
+    private static String event(String name, String data) {
+        return (name == null ? "" : "event: " + name + "\n") + "data: " + data + "\n\n";
+    }
+
+    @Test
+    public void cacheHitSendsNoRequest() throws Exception {
+        ScapeGptClient client = newClient(32);
+        server.enqueue(answer(" Rune essence. "));
+
+        assertEquals("Rune essence.", client.getResponse("What is mined at the rune essence mine?"));
+        // Differs only in case, whitespace and trailing punctuation.
+        assertEquals("Rune essence.", client.getResponse("  what is mined at the  rune essence mine "));
+        assertEquals("Rune essence.", client.getResponseAsync("What is mined at the rune essence mine?")
+                .get(5, TimeUnit.SECONDS));
+
+        assertEquals(1, server.getRequestCount());
+    }
+
+    @Test
+    public void leastRecentlyUsedAnswerIsEvicted() throws Exception {
+        ScapeGptClient client = newClient(2);
+        server.enqueue(answer("a"));
+        server.enqueue(answer("b"));
+        server.enqueue(answer("c"));
+        server.enqueue(answer("b again"));
+
+        client.getResponse("a");
+        client.getResponse("b");
+        // Using "a" makes "b" the least recently used, so "c" evicts it.
+        client.getResponse("a");
+        client.getResponse("c");
+        assertEquals(3, server.getRequestCount());
+
+        assertEquals("a", client.getResponse("a"));
+        assertEquals(3, server.getRequestCount());
+        assertEquals("b again", client.getResponse("b"));
+        assertEquals(4, server.getRequestCount());
+    }
+
+    @Test
+    public void supersedingCancelsEarlierFutureAndCall() throws Exception {
+        ScapeGptClient client = newClient(32);
+        server.enqueue(new MockResponse().setSocketPolicy(SocketPolicy.NO_RESPONSE));
+        server.enqueue(answer("second"));
+
+        CompletableFuture<String> first = client.getResponseAsync("first");
+        assertNotNull(server.takeRequest(5, TimeUnit.SECONDS));
+        List<Call> running = okHttpClient.dispatcher().runningCalls();
+        assertEquals(1, running.size());
+        Call firstCall = running.get(0);
+
+        CompletableFuture<String> second = client.getResponseAsync("second");
+
+        assertTrue(first.isCancelled());
+        assertTrue(firstCall.isCanceled());
+        assertEquals("second", second.get(5, TimeUnit.SECONDS));
+    }
+
+    @Test
+    public void streamParsesTokensUntilDone() throws Exception {
+        ScapeGptClient client = newClient(32);
+        server.enqueue(events(
+                event(null, "{\"token\": \" \"}"),
+                event(null, "{\"token\": \" Buy\"}"),
+                event("message", "{\"token\": \" a\"}"),
+                event(null, "{\"token\": \" pickaxe. \"}"),
+                event("done", "{}"),
+                // Anything after "done" is ignored.
+                event(null, "{\"token\": \" Ignored\"}")));
+
+        List<String> tokens = new ArrayList<>();
+        assertEquals("Buy a pickaxe.", client.streamResponse("How do I start mining?", tokens::add));
+        assertEquals(3, tokens.size());
+        assertEquals("Buy", tokens.get(0));
+        assertEquals(" a", tokens.get(1));
+        assertEquals(" pickaxe. ", tokens.get(2));
+
+        // A cached answer is passed to onToken whole.
+        List<String> cachedTokens = new ArrayList<>();
+        assertEquals("Buy a pickaxe.", client.streamResponse("how do I start mining", cachedTokens::add));
+        assertEquals(1, cachedTokens.size());
+        assertEquals("Buy a pickaxe.", cachedTokens.get(0));
+        assertEquals(1, server.getRequestCount());
+    }
+
+    @Test
+    public void streamEndingBeforeDoneIsAnErrorAndNotCached() throws Exception {
+        ScapeGptClient client = newClient(32);
+        server.enqueue(events(event(null, "{\"token\": \"Half an\"}")));
+        server.enqueue(events(event(null, "{\"token\": \"A whole answer.\"}"), event("done", "{}")));
+
+        List<String> tokens = new ArrayList<>();
+        assertEquals(UNKNOWN_ERROR_MESSAGE, client.streamResponse("What is a rune?", tokens::add));
+        assertEquals(1, tokens.size());
+
+        assertEquals("A whole answer.", client.streamResponseAsync("What is a rune?", token -> { })
+                .get(5, TimeUnit.SECONDS));
+        assertEquals(2, server.getRequestCount());
+    }
+
+    @Test
+    public void errorEventSurfacesItsMessage() throws Exception {
+        ScapeGptClient client = newClient(32);
+        server.enqueue(events(
+                event(null, "{\"token\": \"Partial\"}"),
+                event("error", "{\"error\": \"The wiki could not be searched. Please try again.\"}")));
+        server.enqueue(events(event("error", "{\"error\": \"Still broken.\"}")));
+
+        assertEquals("The wiki could not be searched. Please try again.",
+                client.streamResponse("What is a rune?", token -> { }));
+        // Errors aren't cached either.
+        assertEquals("Still broken.", client.streamResponseAsync("What is a rune?", token -> { })
+                .get(5, TimeUnit.SECONDS));
+        assertEquals(2, server.getRequestCount());
+    }
+}